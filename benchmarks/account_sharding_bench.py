@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+"""
+    account_sharding_bench.py:
+    Builds the AMI distribution settings for a large number of synthetic
+    publishing and sharing accounts with the ami distribution custom
+    resource code, and reports the size of the generated settings against
+    the SSM parameter, AMI tag and EC2 Image Builder limits together with
+    the time spent building and hashing them.
+
+    Publishing targets are limited to a single distribution, sharing
+    accounts beyond it are shared with by ami_sharing after the build.
+
+    usage: python -m benchmarks.account_sharding_bench [--accounts 5000]
+"""
+
+import argparse
+import math
+import time
+
+from tests.utils.lambda_module import load_lambda_module
+
+ami_distribution = load_lambda_module('stacks/vmdkexport/resources/amidistribution/ami_distribution.py')
+
+SSM_PARAMETER_MAX_LENGTH = 4096
+
+
+def synthetic_accounts(count: int, offset: int = 0) -> list:
+    return [f"{100000000000 + offset + i:012d}" for i in range(count)]
+
+
+def timed(function, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return result, (time.perf_counter() - started) / repeat * 1000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--accounts", type=int, default=5000, help="number of sharing accounts")
+    parser.add_argument("--publishing-accounts", type=int, default=1000)
+    parser.add_argument("--regions", type=int, default=3)
+    parser.add_argument("--organizational-units", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    publishing = synthetic_accounts(args.publishing_accounts)
+    sharing = synthetic_accounts(args.accounts, offset=args.accounts)
+    sharing += [
+        f"arn:aws:organizations::111122223333:ou/o-a1b2c3d4e5/ou-ab12-{i:08d}"
+        for i in range(args.organizational_units)
+    ]
+    regions = [f"region-{i}" for i in range(args.regions)]
+    serialized = ",".join(sharing)
+
+    parsed, parse_ms = timed(lambda: ami_distribution.parse_account_list(serialized), args.repeat)
+    distributions, build_ms = timed(lambda: ami_distribution.get_distributions_configurations(
+        aws_distribution_regions=regions,
+        ami_distribution_name="AmiShare-bench-{{ imagebuilder:buildDate }}",
+        publishing_account_ids=publishing,
+        sharing_account_ids=parsed
+    ), args.repeat)
+    config_hash, hash_ms = timed(lambda: ami_distribution.distribution_configuration_hash(
+        ami_distribution.canonical_distribution_configuration("bench", distributions)
+    ), args.repeat)
+
+    ami_configs = [d['amiDistributionConfiguration'] for d in distributions]
+    max_targets = max(len(c.get('targetAccountIds', [])) for c in ami_configs)
+    max_user_ids = max(len(c.get('launchPermission', {}).get('userIds', [])) for c in ami_configs)
+    tags = ami_configs[0]['amiTags']
+
+    print(f"{args.publishing_accounts} publishing and {args.accounts} sharing accounts, {args.organizational_units} OUs, {args.regions} regions")
+    print()
+    print("before (single parameter, single distribution per region):")
+    print(f"  SSM parameter value        {len(serialized):>8} chars (limit {SSM_PARAMETER_MAX_LENGTH})")
+    print(f"  launch userIds             {len(sharing) - args.organizational_units:>8} ids   (limit {ami_distribution.MAX_LAUNCH_PERMISSION_USER_IDS})")
+    print(f"  SharingTargets tag         {len(serialized):>8} chars (limit {ami_distribution.MAX_TAG_VALUE_LENGTH})")
+    print()
+    print("after:")
+    print(f"  SSM parameter shards       {math.ceil(len(serialized) / SSM_PARAMETER_MAX_LENGTH):>8} (approx.)")
+    print(f"  distributions              {len(distributions):>8} ({len(distributions) // args.regions} per region)")
+    print(f"  max targetAccountIds       {max_targets:>8} ids")
+    print(f"  max launch userIds         {max_user_ids:>8} ids")
+    print(f"  shared after the build     {len(ami_distribution.overflow_sharing_user_ids(parsed)):>8} ids")
+    print(f"  PublishTargets tag         {len(tags['PublishTargets']):>8} chars '{tags['PublishTargets']}'")
+    print(f"  SharingTargets tag         {len(tags['SharingTargets']):>8} chars '{tags['SharingTargets']}'")
+    print()
+    print(f"  parse account list         {parse_ms:>8.2f} ms")
+    print(f"  build distributions        {build_ms:>8.2f} ms")
+    print(f"  canonical hash             {hash_ms:>8.2f} ms ({config_hash[:16]})")
+
+
+if __name__ == "__main__":
+    main()
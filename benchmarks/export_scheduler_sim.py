@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+    export_scheduler_sim.py:
+    Simulates bursty export load against the per-region export image task
+    quota and reports how well the export slots are used with and without
+    the export scheduler.
+
+    * unscheduled: export_image is called as soon as the AMI is available,
+      exports over the quota fail and the execution dies.
+    * fifo: exports wait for a slot in arrival order.
+    * priority: exports wait for a slot, release builds ahead of nightlies
+      (the policy implemented by vmexportcommon.export_scheduler).
+
+    usage: python -m benchmarks.export_scheduler_sim [--seed 7]
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "stacks", "vmdkexport", "resources", "vmexport", "common", "python"))
+
+from vmexportcommon.export_scheduler import (PRIORITIES, queue_key,  # noqa: E402
+                                             slot_available)
+
+
+class Request():
+
+    def __init__(self, name: str, priority_class: str, arrival: int, duration: int):
+        self.name = name
+        self.priority_class = priority_class
+        self.arrival = arrival
+        self.duration = duration
+        self.key = None
+        self.started = None
+        self.failed = False
+
+
+def bursty_requests(bursts: int, burst_size: int, burst_gap: int, release_ratio: float, rng: random.Random) -> list:
+    requests = []
+    for burst in range(bursts):
+        for i in range(burst_size):
+            priority_class = "release" if rng.random() < release_ratio else "nightly"
+            arrival = burst * burst_gap + rng.randint(0, 120)
+            duration = int(rng.uniform(20, 60) * 60)
+            requests.append(Request(f"build-{burst}-{i}", priority_class, arrival, duration))
+    return sorted(requests, key=lambda r: r.arrival)
+
+
+def simulate(requests: list, policy: str, slot_limit: int, retry_seconds: int) -> dict:
+    running = []
+    waiting = []
+    busy_seconds = 0
+    pending = list(requests)
+    t = 0
+
+    while pending or waiting or running:
+        running = [r for r in running if r.started + r.duration > t]
+
+        while pending and pending[0].arrival <= t:
+            request = pending.pop(0)
+            if policy == "unscheduled":
+                if len(running) < slot_limit:
+                    request.started = t
+                    running.append(request)
+                else:
+                    request.failed = True
+            else:
+                priority = PRIORITIES[request.priority_class] if policy == "priority" else 0
+                request.key = queue_key(priority, request.arrival, request.name)
+                waiting.append(request)
+
+        # waiting executions retry on their own ExportSlotWaitTask cadence
+        queue = sorted(r.key for r in waiting)
+        holders = {r.name: r.started for r in running}
+        for request in list(waiting):
+            if (t - request.arrival) % retry_seconds != 0:
+                continue
+            if slot_available(holders, queue, request.key, slot_limit):
+                request.started = t
+                running.append(request)
+                holders[request.name] = t
+                waiting.remove(request)
+                queue.remove(request.key)
+
+        busy_seconds += len(running)
+        t += 1
+
+    makespan = max((r.started + r.duration for r in requests if r.started is not None), default=0)
+    return {
+        "exported": sum(1 for r in requests if r.started is not None),
+        "failed": sum(1 for r in requests if r.failed),
+        "utilization": busy_seconds / (slot_limit * makespan) if makespan else 0.0,
+        "makespan_hours": makespan / 3600,
+        "waits": {
+            priority_class: [
+                (r.started - r.arrival) / 60 for r in requests
+                if r.priority_class == priority_class and r.started is not None
+            ]
+            for priority_class in ("release", "nightly")
+        }
+    }
+
+
+def percentile(values: list, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slot-limit", type=int, default=5)
+    parser.add_argument("--bursts", type=int, default=4)
+    parser.add_argument("--burst-size", type=int, default=12)
+    parser.add_argument("--burst-gap-minutes", type=int, default=90)
+    parser.add_argument("--release-ratio", type=float, default=0.25)
+    parser.add_argument("--retry-seconds", type=int, default=60, help="ExportSlotWaitTask duration")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    print(f"{args.bursts} bursts of {args.burst_size} exports every {args.burst_gap_minutes}m, {args.slot_limit} export slots")
+    print()
+    print(f"{'policy':12} {'exported':>8} {'failed':>6} {'util':>6} {'makespan':>9} {'release p50/p95 wait':>21} {'nightly p50/p95 wait':>21}")
+
+    for policy in ("unscheduled", "fifo", "priority"):
+        requests = bursty_requests(args.bursts, args.burst_size, args.burst_gap_minutes * 60, args.release_ratio, random.Random(args.seed))
+        result = simulate(requests, policy, args.slot_limit, args.retry_seconds)
+        waits = result["waits"]
+        release = f"{percentile(waits['release'], 50):.0f}m / {percentile(waits['release'], 95):.0f}m"
+        nightly = f"{percentile(waits['nightly'], 50):.0f}m / {percentile(waits['nightly'], 95):.0f}m"
+        print(
+            f"{policy:12} {result['exported']:>8} {result['failed']:>6} {result['utilization']:>6.0%} "
+            f"{result['makespan_hours']:>8.1f}h {release:>21} {nightly:>21}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+    express_workflow_bench.py:
+    Compares the per-export Standard workflow state transitions and the
+    orchestration latency of the short synchronous stretches when they run
+    in the parent Standard workflow versus a nested Express workflow
+    started synchronously by the parent.
+
+    usage: python -m benchmarks.express_workflow_bench [--exports 1000]
+"""
+
+import argparse
+
+from benchmarks.workflow_sim import (Overheads, Scenario, build_visits,
+                                     stretch_seconds, summarize)
+
+LAYOUTS = {
+    "baseline (all standard)": dict(express_start=False, express_publish=False),
+    "express start stretch": dict(express_start=True, express_publish=False),
+    "express start + publish stretches": dict(express_start=True, express_publish=True)
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exports", type=int, default=1000, help="number of exports used to scale the transition counts")
+    parser.add_argument("--ami-build-minutes", type=float, default=45)
+    parser.add_argument("--vmdk-export-minutes", type=float, default=40)
+    parser.add_argument("--standard-transition-ms", type=float, default=Overheads.standard_transition * 1000)
+    parser.add_argument("--express-transition-ms", type=float, default=Overheads.express_transition * 1000)
+    parser.add_argument("--nested-start-ms", type=float, default=Overheads.nested_sync_start * 1000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    scenario = Scenario(
+        ami_build_seconds=args.ami_build_minutes * 60,
+        vmdk_export_seconds=args.vmdk_export_minutes * 60
+    )
+    overheads = Overheads(
+        standard_transition=args.standard_transition_ms / 1000,
+        express_transition=args.express_transition_ms / 1000,
+        nested_sync_start=args.nested_start_ms / 1000
+    )
+
+    print(f"Scenario: AMI build {args.ami_build_minutes:.0f}m, VMDK export {args.vmdk_export_minutes:.0f}m, {args.exports} exports")
+    print(f"Assumed overheads: {overheads}")
+    print()
+    print(f"{'layout':36} {'std/export':>10} {'exp/export':>10} {'std total':>10} {'start ms':>9} {'publish ms':>10} {'orch ms':>8}")
+
+    baseline = None
+    for name, layout in LAYOUTS.items():
+        visits = build_visits(scenario, **layout)
+        summary = summarize(visits, overheads)
+        start_ms = stretch_seconds(visits, "start", overheads) * 1000
+        publish_ms = stretch_seconds(visits, "publish", overheads) * 1000
+        orchestration_ms = summary["orchestration_seconds"] * 1000
+        print(
+            f"{name:36} {summary['standard_transitions']:>10} {summary['express_transitions']:>10} "
+            f"{summary['standard_transitions'] * args.exports:>10} {start_ms:>9.0f} {publish_ms:>10.0f} {orchestration_ms:>8.0f}"
+        )
+        if baseline is None:
+            baseline = (summary, start_ms, publish_ms)
+        else:
+            saved = baseline[0]["standard_transitions"] - summary["standard_transitions"]
+            print(
+                f"{'':36} saved {saved} standard transition(s) per export, "
+                f"start stretch {start_ms - baseline[1]:+.0f} ms, publish stretch {publish_ms - baseline[2]:+.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+"""
+    parallel_start_bench.py:
+    Compares the critical path from the available AMI to the started
+    export when the AMI metadata publishing runs before the export
+    (serial) versus next to it in a Parallel state, with the AMI resolved
+    by the AMI poll.
+
+    usage: python -m benchmarks.parallel_start_bench [--exports 1000]
+"""
+
+import argparse
+
+from benchmarks.workflow_sim import (LambdaDurations, Overheads, Scenario,
+                                     build_visits, stretch_seconds, summarize)
+
+LAYOUTS = {
+    "serial start": dict(express_start=True, parallel_start=False),
+    "parallel start": dict(express_start=True, parallel_start=True)
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--exports", type=int, default=1000, help="number of exports used to scale the savings")
+    parser.add_argument("--ami-metadata-ms", type=float, default=LambdaDurations.ami_metadata * 1000)
+    parser.add_argument("--ami-lookup-ms", type=float, default=LambdaDurations.ami_lookup * 1000,
+                        help="the get_image call of the metadata function, moved to the AMI poll")
+    parser.add_argument("--vmdk-export-ms", type=float, default=LambdaDurations.vmdk_export * 1000)
+    parser.add_argument("--express-transition-ms", type=float, default=Overheads.express_transition * 1000)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    scenario = Scenario(durations=LambdaDurations(
+        ami_metadata=args.ami_metadata_ms / 1000,
+        ami_lookup=args.ami_lookup_ms / 1000,
+        vmdk_export=args.vmdk_export_ms / 1000
+    ))
+    overheads = Overheads(express_transition=args.express_transition_ms / 1000)
+
+    print(f"Assumed durations: {scenario.durations}")
+    print(f"Assumed overheads: {overheads}")
+    print()
+    print(f"{'layout':16} {'std/export':>10} {'exp/export':>10} {'start ms':>9} {'to export ms':>12}")
+
+    baseline = None
+    for name, layout in LAYOUTS.items():
+        visits = build_visits(scenario, **layout)
+        summary = summarize(visits, overheads)
+        start_ms = stretch_seconds(visits, "start", overheads) * 1000
+        export_ms = stretch_seconds(visits, "start", overheads, until_state="VDMKExportLambdaTask") * 1000
+        print(
+            f"{name:16} {summary['standard_transitions']:>10} {summary['express_transitions']:>10} "
+            f"{start_ms:>9.0f} {export_ms:>12.0f}"
+        )
+        if baseline is None:
+            baseline = (start_ms, export_ms)
+        else:
+            saved_ms = baseline[1] - export_ms
+            print(
+                f"{'':16} export starts {saved_ms:.0f} ms earlier per execution "
+                f"({saved_ms * args.exports / 1000:.0f} s over {args.exports} exports), "
+                f"start stretch {start_ms - baseline[0]:+.0f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+    router_layout_bench.py:
+    Compares the Lambda cold starts and the p95 invocation latency of the
+    State Machine when every stage has its own function (per_stage) versus
+    when a single router function serves all stages (router).
+
+    Executions arrive at random times over the window and replay the
+    invocations of the workflow model. A container serves one invocation
+    at a time and is reclaimed once it has been idle for longer than the
+    keep warm time, an invocation without an idle warm container of its
+    function pays the cold start.
+
+    usage: python -m benchmarks.router_layout_bench [--executions 200]
+"""
+
+import argparse
+import math
+import random
+
+from benchmarks.workflow_sim import Scenario, build_visits
+
+ROUTER = "router"
+
+
+def timeline(visits: list) -> list:
+    """
+        (offset seconds, visit) of the Lambda invocations of one execution,
+        the branches of a Parallel state start at the same time.
+    """
+    invocations = []
+    elapsed = 0.0
+    branches = {}
+    for visit in visits:
+        if visit.branch:
+            offset = elapsed + branches.get(visit.branch, 0.0)
+            branches[visit.branch] = branches.get(visit.branch, 0.0) + visit.seconds
+        else:
+            if branches:
+                elapsed += max(branches.values())
+                branches = {}
+            offset = elapsed
+            elapsed += visit.seconds
+        if visit.is_lambda:
+            invocations.append((offset, visit))
+    return invocations
+
+
+def invocations_of(executions: int, window_seconds: float, jitter: float, rng: random.Random) -> list:
+    """
+        (start time, state, handler seconds) of all invocations, in start order.
+    """
+    invocations = []
+    for _ in range(executions):
+        started_at = rng.uniform(0, window_seconds)
+        scenario = Scenario(
+            ami_build_seconds=Scenario.ami_build_seconds * rng.uniform(1 - jitter, 1 + jitter),
+            vmdk_export_seconds=Scenario.vmdk_export_seconds * rng.uniform(1 - jitter, 1 + jitter)
+        )
+        visits = build_visits(scenario, express_start=True, parallel_start=True)
+        for offset, visit in timeline(visits):
+            invocations.append((started_at + offset, visit.state, visit.seconds))
+    return sorted(invocations)
+
+
+def replay(invocations: list, layout: str, cold_start_seconds: float, keep_warm_seconds: float) -> dict:
+    # function -> containers as [busy until, last used]
+    pools = {}
+    latencies = []
+    cold_starts = 0
+    for started_at, state, seconds in invocations:
+        containers = pools.setdefault(ROUTER if layout == ROUTER else state, [])
+        # reclaim the containers idle for longer than the keep warm time
+        containers[:] = [c for c in containers if c[0] > started_at or started_at - c[1] <= keep_warm_seconds]
+        idle = [c for c in containers if c[0] <= started_at]
+        if idle:
+            container = max(idle, key=lambda c: c[1])
+            duration = seconds
+        else:
+            container = [0.0, 0.0]
+            containers.append(container)
+            duration = seconds + cold_start_seconds
+            cold_starts += 1
+        container[0] = container[1] = started_at + duration
+        latencies.append(duration)
+
+    return {
+        "invocations": len(latencies),
+        "cold_starts": cold_starts,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99)
+    }
+
+
+def percentile(values: list, percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--executions", type=int, default=200)
+    parser.add_argument("--window-hours", type=float, default=8, help="executions start at random times within the window")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative variation of the AMI build and VMDK export times")
+    parser.add_argument("--keep-warm-minutes", type=float, default=10, help="idle time after which a container is reclaimed")
+    parser.add_argument("--cold-start-ms", type=float, default=600, help="cold start of a stage function")
+    parser.add_argument("--router-cold-start-ms", type=float, default=750, help="cold start of the larger router package")
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    invocations = invocations_of(args.executions, args.window_hours * 3600, args.jitter, random.Random(args.seed))
+    layouts = {
+        "per_stage": args.cold_start_ms / 1000,
+        ROUTER: args.router_cold_start_ms / 1000
+    }
+
+    print(f"{args.executions} executions over {args.window_hours:.0f}h, containers kept warm for {args.keep_warm_minutes:.0f}m")
+    print()
+    print(f"{'layout':10} {'invocations':>11} {'cold starts':>11} {'cold %':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7}")
+    for layout, cold_start_seconds in layouts.items():
+        result = replay(invocations, layout, cold_start_seconds, args.keep_warm_minutes * 60)
+        print(
+            f"{layout:10} {result['invocations']:>11} {result['cold_starts']:>11} "
+            f"{result['cold_starts'] / result['invocations'] * 100:>6.1f}% "
+            f"{result['p50'] * 1000:>7.0f} {result['p95'] * 1000:>7.0f} {result['p99'] * 1000:>7.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
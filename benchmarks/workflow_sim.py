@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+
+"""
+    workflow_sim.py:
+    Lightweight model of the VMDKExportStateMachine which replays the
+    states visited by a single AMI -> VMDK export so that state transition
+    counts and orchestration latency can be compared between workflow
+    layouts without deploying the stack.
+
+    The model only counts states and adds fixed per-state overheads, the
+    defaults below are assumptions and can be overridden from the command
+    line of the individual benchmarks.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import List
+
+STANDARD = "standard"
+EXPRESS = "express"
+
+# the poll interval used by the AMIAvailableWaitTask and VMDKExportWaitTask
+POLL_INTERVAL_SECONDS = 180
+
+
+@dataclass
+class Overheads:
+    """
+        Assumed latencies (in seconds) added by the orchestration itself.
+    """
+    standard_transition: float = 0.05
+    express_transition: float = 0.01
+    nested_sync_start: float = 0.25
+    lambda_invoke: float = 0.03
+
+
+@dataclass
+class LambdaDurations:
+    """
+        Assumed handler durations (in seconds) of the short synchronous steps.
+    """
+    entry_point: float = 0.05
+    ami_poll: float = 0.3
+    ami_metadata: float = 0.6
+    ami_lookup: float = 0.15
+    vmdk_export: float = 0.8
+    vmdk_poll: float = 0.3
+    vmdk_metadata: float = 0.9
+
+
+@dataclass
+class Visit:
+    """
+        A single state visited by an execution.
+    """
+    workflow: str
+    state: str
+    seconds: float = 0.0
+    is_lambda: bool = False
+    is_nested_start: bool = False
+    stretch: str = ""
+    branch: str = ""
+
+
+@dataclass
+class Scenario:
+    """
+        The external timings of one export.
+    """
+    ami_build_seconds: float = 45 * 60
+    vmdk_export_seconds: float = 40 * 60
+    poll_interval_seconds: float = POLL_INTERVAL_SECONDS
+    durations: LambdaDurations = field(default_factory=LambdaDurations)
+
+    @property
+    def ami_poll_iterations(self) -> int:
+        return max(1, math.ceil(self.ami_build_seconds / self.poll_interval_seconds))
+
+    @property
+    def vmdk_poll_iterations(self) -> int:
+        return max(1, math.ceil(self.vmdk_export_seconds / self.poll_interval_seconds))
+
+
+def poll_loop(wait_state: str, poll_state: str, choice_state: str, iterations: int, poll_seconds: float, interval: float) -> List[Visit]:
+    visits = []
+    for _ in range(iterations):
+        visits.append(Visit(STANDARD, wait_state, interval))
+        visits.append(Visit(STANDARD, poll_state, poll_seconds, is_lambda=True))
+        visits.append(Visit(STANDARD, choice_state))
+    return visits
+
+
+def nested(task_state: str, child_visits: List[Visit]) -> List[Visit]:
+    """
+        Wraps a stretch of states in a synchronous Express child workflow.
+    """
+    stretch = child_visits[0].stretch
+    moved = [Visit(EXPRESS, v.state, v.seconds, v.is_lambda, stretch=stretch, branch=v.branch) for v in child_visits]
+    return [Visit(STANDARD, task_state, is_nested_start=True, stretch=stretch)] + moved
+
+
+def build_visits(scenario: Scenario, express_start: bool = False, express_publish: bool = False,
+                 parallel_start: bool = False) -> List[Visit]:
+    d = scenario.durations
+
+    if parallel_start:
+        # the AMI is resolved by the poll, the metadata branch no longer
+        # looks it up and runs next to the export branch
+        start_stretch = [
+            Visit(STANDARD, "ExportStartParallelTask", stretch="start"),
+            Visit(STANDARD, "AMIMetadataLambdaTask", d.ami_metadata - d.ami_lookup, is_lambda=True, stretch="start", branch="metadata"),
+            Visit(STANDARD, "VDMKExportLambdaTask", d.vmdk_export, is_lambda=True, stretch="start", branch="export")
+        ]
+    else:
+        start_stretch = [
+            Visit(STANDARD, "AMIMetadataLambdaTask", d.ami_metadata, is_lambda=True, stretch="start"),
+            Visit(STANDARD, "VDMKExportLambdaTask", d.vmdk_export, is_lambda=True, stretch="start")
+        ]
+    publish_stretch = [
+        Visit(STANDARD, "VMDKMetadataLambdaTask", d.vmdk_metadata, is_lambda=True, stretch="publish")
+    ]
+
+    if express_start:
+        start_stretch = nested("ExportStartExpressTask", start_stretch)
+    if express_publish:
+        publish_stretch = nested("ExportPublishExpressTask", publish_stretch)
+
+    visits = [Visit(STANDARD, "EntryPointLambdaTask", d.entry_point, is_lambda=True)]
+    visits += poll_loop(
+        "AMIAvailableWaitTask", "AMIPollLambdaTask", "AMIPollCheckTask",
+        scenario.ami_poll_iterations, d.ami_poll, scenario.poll_interval_seconds
+    )
+    visits += start_stretch
+    visits += poll_loop(
+        "VMDKExportWaitTask", "VMDKPollLambdaTask", "VMDKPollCheckTask",
+        scenario.vmdk_poll_iterations, d.vmdk_poll, scenario.poll_interval_seconds
+    )
+    visits += publish_stretch
+    visits.append(Visit(STANDARD, "VMDKExportInvoked"))
+    return visits
+
+
+def orchestration_seconds(visit: Visit, overheads: Overheads) -> float:
+    """
+        The latency added by the orchestrator on top of the work done in the state.
+    """
+    seconds = overheads.standard_transition if visit.workflow == STANDARD else overheads.express_transition
+    if visit.is_lambda:
+        seconds += overheads.lambda_invoke
+    if visit.is_nested_start:
+        seconds += overheads.nested_sync_start
+    return seconds
+
+
+def stretch_seconds(visits: List[Visit], stretch: str, overheads: Overheads, until_state: str = None) -> float:
+    """
+        Wall time spent in one of the short synchronous stretches, or until
+        the given state of the stretch completed. Visits of the branches of a
+        Parallel state run at the same time, the state after it waits for
+        the slowest branch.
+    """
+    elapsed = 0.0
+    branches = {}
+    for visit in (v for v in visits if v.stretch == stretch):
+        seconds = visit.seconds + orchestration_seconds(visit, overheads)
+        if visit.branch:
+            branches[visit.branch] = branches.get(visit.branch, 0.0) + seconds
+            if visit.state == until_state:
+                return elapsed + branches[visit.branch]
+            continue
+        if branches:
+            elapsed += max(branches.values())
+            branches = {}
+        elapsed += seconds
+        if visit.state == until_state:
+            return elapsed
+    return elapsed + (max(branches.values()) if branches else 0.0)
+
+
+def summarize(visits: List[Visit], overheads: Overheads) -> dict:
+    return {
+        "standard_transitions": sum(1 for v in visits if v.workflow == STANDARD),
+        "express_transitions": sum(1 for v in visits if v.workflow == EXPRESS),
+        "work_seconds": sum(v.seconds for v in visits),
+        "orchestration_seconds": sum(orchestration_seconds(v, overheads) for v in visits)
+    }
@@ -16,21 +16,138 @@
 """
 
 
+import hashlib
 import json
 import logging
 import os
+import re
 
 import boto3
 import botocore
 
+# EC2 Image Builder limits of a single AMI distribution
+MAX_TARGET_ACCOUNT_IDS = 1536
+MAX_LAUNCH_PERMISSION_USER_IDS = 1536
+MAX_LAUNCH_PERMISSION_ORGANIZATION_ARNS = 25
+MAX_LAUNCH_PERMISSION_ORGANIZATIONAL_UNIT_ARNS = 25
 
-def get_ssm_parameter(
-        ssm_param_name: str, 
+# maximum length of an AMI tag value
+MAX_TAG_VALUE_LENGTH = 256
+
+ACCOUNT_ID_PATTERN = re.compile(r"^\d{12}$")
+ORGANIZATION_ARN_PATTERN = re.compile(r"^arn:aws[a-z-]*:organizations::\d{12}:organization/o-[a-z0-9]{10,32}$")
+ORGANIZATIONAL_UNIT_ARN_PATTERN = re.compile(r"^arn:aws[a-z-]*:organizations::\d{12}:ou/o-[a-z0-9]{10,32}/ou-[a-z0-9]{4,32}-[a-z0-9]{8,32}$")
+
+
+def get_ssm_parameters(
+        ssm_param_names: list[str],
+        aws_ssm_region: str
+    ) -> dict:
+    ssm = boto3.client('ssm', region_name=aws_ssm_region)
+    response = ssm.get_parameters(Names=ssm_param_names, WithDecryption=False)
+    if len(response['InvalidParameters']) > 0:
+        raise ValueError(f"SSM parameters not found: {response['InvalidParameters']}")
+    return {parameter['Name']: parameter['Value'] for parameter in response['Parameters']}
+
+
+def get_ssm_parameter_shards(
+        ssm_param_path: str,
         aws_ssm_region: str
     ) -> str:
+    """
+        Concatenates an account list sharded across the parameters below a path,
+        i.e. /stack-AmiSharing/AmiSharingAccountIds/0, .../1
+    """
     ssm = boto3.client('ssm', region_name=aws_ssm_region)
-    parameter = ssm.get_parameter(Name=ssm_param_name, WithDecryption=False)
-    return parameter['Parameter']
+    shards = []
+    for page in ssm.get_paginator('get_parameters_by_path').paginate(Path=ssm_param_path.rstrip("/"), WithDecryption=False):
+        shards += page['Parameters']
+    if len(shards) == 0:
+        raise ValueError(f"No SSM parameters found below {ssm_param_path}")
+    shards.sort(key=lambda parameter: int(parameter['Name'].rsplit("/", 1)[-1]))
+    return ",".join(parameter['Value'] for parameter in shards)
+
+
+def get_s3_object(s3_uri: str, aws_region: str) -> str:
+    bucket, key = s3_uri[len("s3://"):].split("/", 1)
+    s3 = boto3.client('s3', region_name=aws_region)
+    return s3.get_object(Bucket=bucket, Key=key)['Body'].read().decode("utf-8")
+
+
+def parse_account_list(value: str) -> list[str]:
+    """
+        Account lists are comma or whitespace separated, or a JSON array.
+    """
+    value = value.strip()
+    if value.startswith("["):
+        return [str(entry).strip() for entry in json.loads(value) if str(entry).strip()]
+    return [entry for entry in re.split(r"[,\s]+", value) if entry]
+
+
+def load_account_lists(
+        sources: list[str],
+        aws_region: str
+    ) -> dict:
+    """
+        Loads the account lists of the given sources, a source is one of
+            - the name of a SSM parameter
+            - a SSM parameter path (ending with /) with the list sharded across its parameters
+            - a s3://bucket/key uri of an object holding the list
+        All single SSM parameters are read with one request.
+    """
+    values = {}
+
+    ssm_param_names = [source for source in sources if not source.startswith("s3://") and not source.endswith("/")]
+    if len(ssm_param_names) > 0:
+        values.update(get_ssm_parameters(list(dict.fromkeys(ssm_param_names)), aws_region))
+
+    for source in sources:
+        if source.startswith("s3://"):
+            values[source] = get_s3_object(source, aws_region)
+        elif source.endswith("/"):
+            values[source] = get_ssm_parameter_shards(source, aws_region)
+
+    return {source: parse_account_list(value) for source, value in values.items()}
+
+
+def split_launch_permission_targets(entries: list[str]) -> tuple:
+    """
+        Splits the sharing targets into account ids, organization ARNs and
+        organizational unit ARNs.
+    """
+    account_ids, organization_arns, organizational_unit_arns = [], [], []
+    for entry in entries:
+        if ACCOUNT_ID_PATTERN.match(entry):
+            account_ids.append(entry)
+        elif ORGANIZATION_ARN_PATTERN.match(entry):
+            organization_arns.append(entry)
+        elif ORGANIZATIONAL_UNIT_ARN_PATTERN.match(entry):
+            organizational_unit_arns.append(entry)
+        else:
+            raise ValueError(f"Invalid sharing target: {entry}")
+
+    if len(organization_arns) > MAX_LAUNCH_PERMISSION_ORGANIZATION_ARNS:
+        raise ValueError(f"At most {MAX_LAUNCH_PERMISSION_ORGANIZATION_ARNS} organization ARNs are supported")
+    if len(organizational_unit_arns) > MAX_LAUNCH_PERMISSION_ORGANIZATIONAL_UNIT_ARNS:
+        raise ValueError(f"At most {MAX_LAUNCH_PERMISSION_ORGANIZATIONAL_UNIT_ARNS} organizational unit ARNs are supported")
+
+    return account_ids, organization_arns, organizational_unit_arns
+
+
+def chunk(values: list, size: int) -> list[list]:
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+
+def account_list_tag(entries: list[str]) -> str:
+    """
+        The list of targets when it fits into an AMI tag value, otherwise
+        a summary with the number of targets and a digest of the list.
+    """
+    joined = ",".join(entries)
+    if len(joined) <= MAX_TAG_VALUE_LENGTH:
+        return joined
+    digest = hashlib.sha256(",".join(sorted(entries)).encode(encoding="utf-8")).hexdigest()
+    return f"{len(entries)} targets sha256:{digest[:16]}"
 
 
 def get_distributions_configurations(
@@ -39,29 +156,143 @@ def get_distributions_configurations(
         publishing_account_ids: list[str],
         sharing_account_ids: list[str]
     ) -> list[dict]:
+    """
+        Builds the single distribution of each region, EC2 Image Builder
+        accepts one distribution per region. The first sharing accounts up
+        to the launch permission limit are shared with through the
+        distribution, the remaining ones by ami_sharing once the image is
+        available (see overflow_sharing_user_ids). Publishing targets cannot
+        be added after the build, longer publishing lists are rejected.
+    """
+
+    for account_id in publishing_account_ids:
+        if not ACCOUNT_ID_PATTERN.match(account_id):
+            raise ValueError(f"Invalid publishing target: {account_id}")
+    if len(publishing_account_ids) > MAX_TARGET_ACCOUNT_IDS:
+        raise ValueError(
+            f"{len(publishing_account_ids)} publishing targets, EC2 Image Builder supports at most "
+            f"{MAX_TARGET_ACCOUNT_IDS}; share the AMI with the remaining accounts instead"
+        )
+
+    sharing_user_ids, organization_arns, organizational_unit_arns = split_launch_permission_targets(sharing_account_ids)
+
+    ami_tags = {
+        'PublishTargets': account_list_tag(publishing_account_ids),
+        'SharingTargets': account_list_tag(sharing_account_ids)
+    }
+
+    launch_permission = {}
+    if len(sharing_user_ids) > 0:
+        launch_permission['userIds'] = sharing_user_ids[:MAX_LAUNCH_PERMISSION_USER_IDS]
+    if len(organization_arns) > 0:
+        launch_permission['organizationArns'] = organization_arns
+    if len(organizational_unit_arns) > 0:
+        launch_permission['organizationalUnitArns'] = organizational_unit_arns
 
     distribution_configs = []
 
     for aws_region in aws_distribution_regions:
-        distribution_config = {
+        ami_distribution_configuration = {
+            'name': ami_distribution_name,
+            'description': f'AMI Distribution configuration for {ami_distribution_name}',
+            'amiTags': ami_tags
+        }
+        if len(publishing_account_ids) > 0:
+            ami_distribution_configuration['targetAccountIds'] = publishing_account_ids
+        if len(launch_permission) > 0:
+            ami_distribution_configuration['launchPermission'] = launch_permission
+
+        distribution_configs.append({
             'region': aws_region,
+            'amiDistributionConfiguration': ami_distribution_configuration
+        })
+
+    return distribution_configs
+
+
+def overflow_sharing_user_ids(sharing_account_ids: list[str]) -> list[str]:
+    """
+        The sharing accounts beyond the launch permission limit of a
+        distribution, which are shared with after the build.
+    """
+    sharing_user_ids, _, _ = split_launch_permission_targets(sharing_account_ids)
+    return sharing_user_ids[MAX_LAUNCH_PERMISSION_USER_IDS:]
+
+
+def canonical_distribution_configuration(
+        description: str,
+        distributions: list[dict]
+    ) -> dict:
+    """
+        Projects a distribution configuration onto the attributes managed by
+        this custom resource, with lists and tags in a stable order, so that
+        the desired and the live configuration can be compared.
+    """
+
+    def project(distribution: dict) -> dict:
+        ami_config = distribution.get('amiDistributionConfiguration', {})
+        launch_permission = ami_config.get('launchPermission', {})
+        return {
+            'region': distribution['region'],
             'amiDistributionConfiguration': {
-                'name': ami_distribution_name,
-                'description': f'AMI Distribution configuration for {ami_distribution_name}',
-                'targetAccountIds': publishing_account_ids,
-                'amiTags': {
-                    'PublishTargets': ",".join(publishing_account_ids),
-                    'SharingTargets': ",".join(sharing_account_ids)
-                },
+                'name': ami_config.get('name'),
+                'description': ami_config.get('description'),
+                'targetAccountIds': sorted(ami_config.get('targetAccountIds', [])),
+                'amiTags': dict(sorted(ami_config.get('amiTags', {}).items())),
                 'launchPermission': {
-                    'userIds': sharing_account_ids
+                    'userIds': sorted(launch_permission.get('userIds', [])),
+                    'organizationArns': sorted(launch_permission.get('organizationArns', [])),
+                    'organizationalUnitArns': sorted(launch_permission.get('organizationalUnitArns', []))
                 }
             }
         }
 
-        distribution_configs.append(distribution_config)
+    projected = [project(distribution) for distribution in distributions]
+    return {
+        'description': description,
+        'distributions': sorted(projected, key=lambda d: json.dumps(d, sort_keys=True))
+    }
+
+
+def distribution_configuration_hash(canonical_configuration: dict) -> str:
+    serialized = json.dumps(canonical_configuration, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(serialized.encode(encoding="utf-8")).hexdigest()
 
-    return distribution_configs
+
+def update_distribution_configuration(
+        ami_distribution_arn: str,
+        description: str,
+        distributions: list[dict]
+    ) -> str:
+    """
+        Updates the distribution configuration when its live settings differ
+        from the desired settings and returns the hash of the desired settings.
+    """
+    logger = logging.getLogger()
+    client = boto3.client('imagebuilder')
+    desired_hash = distribution_configuration_hash(
+        canonical_distribution_configuration(description, distributions)
+    )
+
+    live = client.get_distribution_configuration(
+        distributionConfigurationArn=ami_distribution_arn
+    )['distributionConfiguration']
+    live_hash = distribution_configuration_hash(
+        canonical_distribution_configuration(live.get('description'), live.get('distributions', []))
+    )
+    # every update bumps the distribution configuration used by in-flight
+    # builds, so only write when the settings have changed
+    if live_hash == desired_hash:
+        logger.info(f"Distribution configuration {ami_distribution_arn} is up to date ({desired_hash})")
+        return desired_hash
+
+    client.update_distribution_configuration(
+        distributionConfigurationArn=ami_distribution_arn,
+        description=description,
+        distributions=distributions
+    )
+    logger.info(f"Updated distribution configuration {ami_distribution_arn} ({live_hash} -> {desired_hash})")
+    return desired_hash
 
 
 def lambda_handler(event, context):
@@ -79,27 +310,37 @@ def lambda_handler(event, context):
     imagebuiler_name = props['ImageBuilderName']
     ami_distribution_name = props['AmiDistributionName']
     ami_distribution_arn = props['AmiDistributionArn']
-    ssm_publishing_account_ids_param_name = props['PublishingAccountIds']
-    ssm_sharing_account_ids_param_name = props['SharingAccountIds']
+    # sources of the account lists, see load_account_lists
+    publishing_account_ids_source = props['PublishingAccountIds']
+    sharing_account_ids_source = props['SharingAccountIds']
+
+    account_lists = load_account_lists(
+        [publishing_account_ids_source, sharing_account_ids_source],
+        aws_region
+    )
+    publishing_account_ids = account_lists[publishing_account_ids_source]
+    sharing_account_ids = account_lists[sharing_account_ids_source]
 
-    publishing_account_ids = get_ssm_parameter(ssm_publishing_account_ids_param_name, aws_region)['Value'].split(",")
-    sharing_account_ids = get_ssm_parameter(ssm_sharing_account_ids_param_name, aws_region)['Value'].split(",")
+    logger.info(f"{len(publishing_account_ids)} publishing targets from {publishing_account_ids_source}")
+    logger.info(f"{len(sharing_account_ids)} sharing targets from {sharing_account_ids_source}")
 
-    logger.info(publishing_account_ids)
-    logger.info(sharing_account_ids)
+    description = f"AMI Distribution settings for: {imagebuiler_name}"
+    distributions = get_distributions_configurations(
+        aws_distribution_regions=aws_distribution_regions,
+        ami_distribution_name=ami_distribution_name,
+        publishing_account_ids=publishing_account_ids,
+        sharing_account_ids=sharing_account_ids
+    )
+    config_hash = distribution_configuration_hash(
+        canonical_distribution_configuration(description, distributions)
+    )
 
     if event['RequestType'] != 'Delete':
         try:
-            client = boto3.client('imagebuilder')
-            client.update_distribution_configuration(
-                distributionConfigurationArn=ami_distribution_arn,
-                description=f"AMI Distribution settings for: {imagebuiler_name}",
-                distributions=get_distributions_configurations(
-                    aws_distribution_regions=aws_distribution_regions,
-                    ami_distribution_name=ami_distribution_name,
-                    publishing_account_ids=publishing_account_ids,
-                    sharing_account_ids=sharing_account_ids
-                )
+            config_hash = update_distribution_configuration(
+                ami_distribution_arn=ami_distribution_arn,
+                description=description,
+                distributions=distributions
             )
         except botocore.exceptions.ClientError as err:
             raise err
@@ -107,7 +348,8 @@ def lambda_handler(event, context):
     output = {
         'PhysicalResourceId': f"ami-distribution-id-{cdk_stack_name}",
         'Data': {
-            'AmiDistributionArn': ami_distribution_arn
+            'AmiDistributionArn': ami_distribution_arn,
+            'DistributionConfigHash': config_hash
         }
     }
     logger.info(f"Output: {json.dumps(output)}")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""
+    ami_sharing.py:
+    Lambda Handler subscribed to the EC2 Image Builder notification
+    topic which shares the AMIs of an available image with the sharing
+    accounts beyond the launch permission limit of an EC2 Image Builder
+    distribution. The first accounts are shared with through the
+    distribution configuration (see ami_distribution), the remaining
+    ones are added to the launch permissions of the AMI in each region
+    with the EC2 ModifyImageAttribute API.
+"""
+
+import json
+import logging
+import os
+
+import boto3
+from ami_distribution import chunk, load_account_lists, overflow_sharing_user_ids
+
+# account ids added to the launch permissions of an AMI per request
+MAX_LAUNCH_PERMISSION_CHANGES = 500
+
+
+def share_image(ec2_client, ami_id: str, user_ids: list[str]):
+    for user_ids_chunk in chunk(user_ids, MAX_LAUNCH_PERMISSION_CHANGES):
+        ec2_client.modify_image_attribute(
+            ImageId=ami_id,
+            Attribute="launchPermission",
+            LaunchPermission={'Add': [{'UserId': user_id} for user_id in user_ids_chunk]}
+        )
+
+
+def lambda_handler(event, context):
+    # set logging
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    # print the event details
+    logger.debug(json.dumps(event, indent=2))
+
+    image = json.loads(event["Records"][0]["Sns"]["Message"])
+    status = image.get('state', {}).get('status')
+    if status != "AVAILABLE":
+        logger.info(f"Image {image.get('arn')} is {status}, nothing to share")
+        return
+
+    sharing_account_ids_source = os.environ['SHARING_ACCOUNT_IDS']
+    sharing_account_ids = load_account_lists([sharing_account_ids_source], os.environ['AWS_REGION'])[sharing_account_ids_source]
+    user_ids = overflow_sharing_user_ids(sharing_account_ids)
+    if len(user_ids) == 0:
+        logger.info(f"All sharing targets of {image.get('arn')} are shared with through the distribution")
+        return
+
+    # the AMIs copied to the publishing accounts are owned by those accounts
+    account_id = context.invoked_function_arn.split(":")[4]
+    for ami in image.get('outputResources', {}).get('amis', []):
+        if ami.get('accountId', account_id) != account_id:
+            continue
+        share_image(boto3.client('ec2', region_name=ami['region']), ami['image'], user_ids)
+        logger.info(f"Shared {ami['image']} in {ami['region']} with {len(user_ids)} further accounts")
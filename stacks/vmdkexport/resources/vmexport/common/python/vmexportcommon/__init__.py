@@ -0,0 +1,5 @@
+"""
+    vmexportcommon:
+    Shared code for the AMI -> VMDK export Lambda handlers,
+    deployed as a Lambda layer.
+"""
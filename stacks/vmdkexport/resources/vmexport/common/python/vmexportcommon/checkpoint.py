@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+
+"""
+    checkpoint.py:
+    Per-stage checkpoints of the export of an image build.
+
+    Each stage which completes stores its output (AMI, export task, S3
+    location) in the export control table, one item per image build
+    (pk "CHECKPOINT#<image build version arn>", sk "CHECKPOINT") with a
+    flat "checkpoint_<stage>" attribute per stage. A resumed execution
+    seeds its state from the checkpoints and skips the completed stages,
+    so an export which failed after the VMDK was written does not poll
+    Image Builder and export again.
+
+    Checkpoints are written on a best effort basis, failures are logged
+    and only mean that a resumed execution redoes the stage.
+"""
+
+import logging
+import os
+import time
+
+import boto3
+from vmexportcommon.stage_history import (AMI_AVAILABLE, EXPORT_COMPLETED,
+                                          EXPORT_STARTED, METADATA_PUBLISHED)
+
+logger = logging.getLogger()
+
+# the stages share their names with the stage history
+AMI_METADATA_PUBLISHED = "ami_metadata_published"
+
+STAGES = (AMI_AVAILABLE, AMI_METADATA_PUBLISHED, EXPORT_STARTED, EXPORT_COMPLETED, METADATA_PUBLISHED)
+
+# the State Machine state a resumed export continues from
+RESUME_AMI_POLL = "ami_poll"
+RESUME_EXPORT_SLOT = "export_slot"
+RESUME_EXPORT_POLL = "export_poll"
+RESUME_EXPORT_METADATA = "export_metadata"
+RESUME_COMPLETED = "completed"
+
+RESUME_POINTS = (RESUME_AMI_POLL, RESUME_EXPORT_SLOT, RESUME_EXPORT_POLL, RESUME_EXPORT_METADATA, RESUME_COMPLETED)
+
+DEFAULT_RETENTION_DAYS = 30
+
+
+def checkpoint_key(image_build_version_arn: str) -> dict:
+    return {"pk": f"CHECKPOINT#{image_build_version_arn}", "sk": "CHECKPOINT"}
+
+
+def checkpoint_attribute(stage: str) -> str:
+    return f"checkpoint_{stage}"
+
+
+def resume_point(checkpoints: dict) -> str:
+    """
+        The first stage a resumed export has to run, given the checkpoints
+        of its image build. The export is only skipped once the AMI
+        metadata, which is published alongside it, has been published.
+    """
+    if METADATA_PUBLISHED in checkpoints:
+        return RESUME_COMPLETED
+    if AMI_METADATA_PUBLISHED in checkpoints:
+        if EXPORT_COMPLETED in checkpoints:
+            return RESUME_EXPORT_METADATA
+        if EXPORT_STARTED in checkpoints:
+            return RESUME_EXPORT_POLL
+    if AMI_AVAILABLE in checkpoints:
+        return RESUME_EXPORT_SLOT
+    return RESUME_AMI_POLL
+
+
+def resume_state(state, checkpoints: dict):
+    """
+        Restores the outputs of the completed stages into the state and
+        sets the point the export resumes from.
+    """
+    state["resume_from"] = resume_point(checkpoints)
+    if state["resume_from"] == RESUME_AMI_POLL:
+        return state
+
+    state["ami_state"] = "AVAILABLE"
+    state["ami_id"] = checkpoints[AMI_AVAILABLE]["ami_id"]
+    state["ami_name"] = checkpoints[AMI_AVAILABLE]["ami_name"]
+    if state["resume_from"] in (RESUME_EXPORT_POLL, RESUME_EXPORT_METADATA, RESUME_COMPLETED):
+        state["export_image_task_id"] = checkpoints[EXPORT_STARTED]["export_image_task_id"]
+        state["export_format"] = checkpoints[EXPORT_STARTED]["export_format"]
+    if state["resume_from"] in (RESUME_EXPORT_METADATA, RESUME_COMPLETED):
+        state["vdmk_export_status"] = "COMPLETED"
+    return state
+
+
+class CheckpointStore():
+
+    def __init__(self, table_name: str, retention_days: int = DEFAULT_RETENTION_DAYS, dynamodb_resource=None):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.retention_days = retention_days
+
+    def save(self, image_build_version_arn: str, stage: str, output: dict, at: float = None):
+        at = at if at is not None else time.time()
+        self.table.update_item(
+            Key=checkpoint_key(image_build_version_arn),
+            UpdateExpression="SET #stage = :output, #expires = :expires",
+            ExpressionAttributeNames={"#stage": checkpoint_attribute(stage), "#expires": "expires_at"},
+            ExpressionAttributeValues={":output": output, ":expires": int(at) + self.retention_days * 86400}
+        )
+
+    def clear(self, image_build_version_arn: str, *stages: str):
+        self.table.update_item(
+            Key=checkpoint_key(image_build_version_arn),
+            UpdateExpression="REMOVE " + ", ".join(f"#s{i}" for i in range(len(stages))),
+            ExpressionAttributeNames={f"#s{i}": checkpoint_attribute(stage) for i, stage in enumerate(stages)}
+        )
+
+    def load(self, image_build_version_arn: str) -> dict:
+        """
+            The checkpoints of the image build, as {stage: output}.
+        """
+        item = self.table.get_item(Key=checkpoint_key(image_build_version_arn), ConsistentRead=True).get('Item', {})
+        return {
+            stage: dict(item[checkpoint_attribute(stage)])
+            for stage in STAGES
+            if checkpoint_attribute(stage) in item
+        }
+
+
+def save_checkpoint(event, stage: str, **output):
+    """
+        Checkpoints the output of the stage in the table named by the
+        EXPORT_CONTROL_TABLE environment variable, never failing the stage.
+    """
+    try:
+        CheckpointStore(os.environ['EXPORT_CONTROL_TABLE']).save(event["image_build_version_arn"], stage, output)
+    except Exception as e:
+        logger.warning(f"Unable to checkpoint stage {stage}: {e}")
+
+
+def clear_checkpoints(event, *stages: str):
+    try:
+        CheckpointStore(os.environ['EXPORT_CONTROL_TABLE']).clear(event["image_build_version_arn"], *stages)
+    except Exception as e:
+        logger.warning(f"Unable to clear the checkpoints {stages}: {e}")
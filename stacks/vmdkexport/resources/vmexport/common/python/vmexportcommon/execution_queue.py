@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+
+"""
+    execution_queue.py:
+    Queue of the export requests that wait for a running execution of
+    the State Machine to end.
+
+    The notification handler starts at most MAX_RUNNING_EXECUTIONS
+    executions at once. Requests beyond the limit are stored in the
+    export control table (pk "PENDING_EXECUTIONS", sk the image build
+    version arn, so a redelivered notification is queued once) and
+    started in the order they arrived when an execution ends.
+
+    Each request is started under a name derived from its queue entry:
+    two handlers that start the same request at once start a single
+    execution, and the entry is only removed once its execution exists.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+QUEUE_PK = "PENDING_EXECUTIONS"
+
+# requests that could not be started for this long are dropped by the table TTL
+PENDING_RETENTION_SECONDS = 7 * 24 * 60 * 60
+
+
+def execution_name(item: dict) -> str:
+    digest = hashlib.sha256(f"{item['sk']}#{item['enqueued_at']}".encode("utf-8")).hexdigest()
+    return f"queued-{digest[:32]}"
+
+
+class ExecutionQueue():
+
+    def __init__(self, table_name: str, dynamodb_resource=None):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+
+    def add(self, image_build_version_arn: str, execution_input: dict, now: float = None):
+        now = now if now is not None else time.time()
+        try:
+            self.table.put_item(
+                Item={
+                    'pk': QUEUE_PK,
+                    'sk': image_build_version_arn,
+                    'execution_input': json.dumps(execution_input),
+                    'enqueued_at': Decimal(str(now)),
+                    'expires_at': Decimal(int(now) + PENDING_RETENTION_SECONDS)
+                },
+                ConditionExpression="attribute_not_exists(sk)"
+            )
+            logger.info(f"Queued the export of {image_build_version_arn}")
+        except ClientError as err:
+            if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise err
+            logger.info(f"The export of {image_build_version_arn} is already queued")
+
+    def pending(self) -> list:
+        """
+            The queued requests, oldest first.
+        """
+        items = []
+        paginator = self.table.meta.client.get_paginator('query')
+        for page in paginator.paginate(
+            TableName=self.table.name,
+            KeyConditionExpression="pk = :pk",
+            ExpressionAttributeValues={':pk': QUEUE_PK},
+            ConsistentRead=True
+        ):
+            items.extend(page['Items'])
+        return sorted(items, key=lambda item: item['enqueued_at'])
+
+    def remove(self, item: dict):
+        try:
+            # a request queued again since it was read is kept
+            self.table.delete_item(
+                Key={'pk': QUEUE_PK, 'sk': item['sk']},
+                ConditionExpression="enqueued_at = :enqueued_at",
+                ExpressionAttributeValues={':enqueued_at': item['enqueued_at']}
+            )
+        except ClientError as err:
+            if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise err
+
+
+def running_execution_count(stepfunctions_client, state_machine_arn: str) -> int:
+    count = 0
+    paginator = stepfunctions_client.get_paginator('list_executions')
+    for page in paginator.paginate(stateMachineArn=state_machine_arn, statusFilter='RUNNING'):
+        count += len(page['executions'])
+    return count
+
+
+def start_queued(stepfunctions_client, state_machine_arn: str, queue: ExecutionQueue, max_running: int) -> list:
+    """
+        Starts the queued requests while fewer than max_running executions
+        run, 0 starts them all. Returns the started image build version arns.
+    """
+    pending = queue.pending()
+    if not pending:
+        return []
+    running = running_execution_count(stepfunctions_client, state_machine_arn) if max_running else 0
+
+    started = []
+    for item in pending:
+        if max_running and running >= max_running:
+            logger.info(f"{running} of {max_running} executions are running, {len(pending) - len(started)} exports stay queued")
+            break
+        try:
+            stepfunctions_client.start_execution(
+                stateMachineArn=state_machine_arn,
+                name=execution_name(item),
+                input=item['execution_input']
+            )
+        except ClientError as err:
+            # started by another handler, and finished since
+            if err.response['Error']['Code'] != 'ExecutionAlreadyExists':
+                raise err
+        queue.remove(item)
+        started.append(item['sk'])
+        running += 1
+    return started
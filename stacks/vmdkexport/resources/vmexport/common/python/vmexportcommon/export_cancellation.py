@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""
+    export_cancellation.py:
+    Cancels in-flight exports, and supersedes the export of an older
+    build of a recipe when a newer build arrives.
+
+    Image build version arns have the form
+    arn:aws:imagebuilder:<region>:<account>:image/<recipe>/<version>/<build>,
+    so the builds of a recipe share the arn up to the recipe name and are
+    ordered by version and build number. A recipe can be built by several
+    pipelines, so a build only supersedes the builds of its own pipeline,
+    the sourcePipelineArn of the image descriptor.
+
+    Cancelling stops the execution first, so that the export poll does
+    not report the cancelled export image task as a failure. The export
+    image task ids are then read back from the task outputs of the
+    execution history, cancelled, and the export slot of each image
+    build is released.
+"""
+
+import json
+import logging
+
+import boto3
+from botocore.exceptions import ClientError
+from vmexportcommon.image_descriptor import ImageDescriptorCache
+
+logger = logging.getLogger()
+
+SUPERSEDED_ERROR = "Superseded"
+CANCELLED_ERROR = "Cancelled"
+
+# executions started by the backfill command are never superseded,
+# a backfill exports older builds of a recipe on purpose
+BACKFILL_EXECUTION_PREFIX = "backfill-"
+
+
+def parse_image_build_version_arn(arn: str) -> tuple:
+    """
+        (recipe key, (version..., build)) of an image build version arn.
+    """
+    prefix, separator, resource = arn.partition(":image/")
+    parts = resource.split("/")
+    if not separator or len(parts) != 3:
+        raise ValueError(f"Invalid image build version arn: {arn}")
+    recipe, version, build = parts
+    try:
+        order = tuple(int(part) for part in version.split(".")) + (int(build),)
+    except ValueError:
+        raise ValueError(f"Invalid image build version arn: {arn}")
+    return f"{prefix}:image/{recipe}", order
+
+
+def supersedes(image_build_version_arn: str, other_arn: str, pipeline_of=None) -> bool:
+    """
+        True when the image build is a newer build of the same recipe and,
+        given pipeline_of (image build version arn -> pipeline arn), of the
+        same pipeline. The pipelines are only looked up for newer builds.
+    """
+    recipe, order = parse_image_build_version_arn(image_build_version_arn)
+    other_recipe, other_order = parse_image_build_version_arn(other_arn)
+    if recipe != other_recipe or order <= other_order:
+        return False
+    return pipeline_of is None or pipeline_of(image_build_version_arn) == pipeline_of(other_arn)
+
+
+def is_image_build_version_arn(arn: str) -> bool:
+    try:
+        parse_image_build_version_arn(arn)
+    except ValueError:
+        return False
+    return True
+
+
+def execution_image_build_version_arns(execution_input: dict) -> list:
+    if "image_build_version_arns" in execution_input:
+        return list(execution_input["image_build_version_arns"])
+    if execution_input.get("image_build_version_arn"):
+        return [execution_input["image_build_version_arn"]]
+    return []
+
+
+def plan_supersede(image_build_version_arn: str, running: list, pipeline_of=None) -> tuple:
+    """
+        (start, executions to supersede) for a new image build, given the
+        running executions as dicts with name, executionArn and
+        image_build_version_arns, and optionally pipeline_of (image build
+        version arn -> pipeline arn).
+
+        The new build is not started when it is already being exported or
+        a newer build of its recipe and pipeline is running. Running single
+        exports of older builds of the recipe and pipeline are superseded.
+        Batch and backfill executions are left running, they export older
+        builds on purpose.
+    """
+    versioned = is_image_build_version_arn(image_build_version_arn)
+    stale = []
+    for execution in running:
+        arns = execution["image_build_version_arns"]
+        if image_build_version_arn in arns:
+            logger.info(f"{image_build_version_arn} is already exported by {execution['executionArn']}")
+            return False, []
+        if not versioned:
+            continue
+        builds = [arn for arn in arns if is_image_build_version_arn(arn)]
+        if any(supersedes(arn, image_build_version_arn, pipeline_of) for arn in builds):
+            logger.info(f"A newer build than {image_build_version_arn} is exported by {execution['executionArn']}")
+            return False, []
+        older = [arn for arn in builds if supersedes(image_build_version_arn, arn, pipeline_of)]
+        if not older:
+            continue
+        if len(arns) > 1 or execution["name"].startswith(BACKFILL_EXECUTION_PREFIX):
+            logger.info(f"Not superseding the batch or backfill execution {execution['executionArn']}")
+            continue
+        stale.append(execution)
+    return True, stale
+
+
+def export_task_ids(history_events: list) -> list:
+    """
+        The export image task ids found in the task outputs of an execution
+        history, including the outputs of the Map iterations and of the
+        Express child execution, in the order they were recorded.
+    """
+    task_ids = []
+    for event in history_events:
+        for name, details in event.items():
+            if name.endswith("EventDetails") and isinstance(details, dict) and "output" in details:
+                _find_export_task_ids(details["output"], task_ids)
+    return task_ids
+
+
+def _find_export_task_ids(value, task_ids: list):
+    if isinstance(value, str):
+        if not value.lstrip().startswith(("{", "[")):
+            return
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return
+    if isinstance(value, dict):
+        task_id = value.get("export_image_task_id")
+        if isinstance(task_id, str) and task_id not in task_ids:
+            task_ids.append(task_id)
+        for nested in value.values():
+            if isinstance(nested, (dict, list, str)):
+                _find_export_task_ids(nested, task_ids)
+    elif isinstance(value, list):
+        for nested in value:
+            _find_export_task_ids(nested, task_ids)
+
+
+class ExportCanceller():
+    """
+        Cancels the exports of the executions of the State Machine.
+    """
+
+    def __init__(self, state_machine_arn: str, scheduler=None, stepfunctions_client=None, ec2_client=None, descriptors=None):
+        self.state_machine_arn = state_machine_arn
+        self.scheduler = scheduler
+        self.stepfunctions = stepfunctions_client or boto3.client('stepfunctions')
+        self.ec2 = ec2_client or boto3.client('ec2')
+        self.descriptors = descriptors
+
+    def running_executions(self) -> list:
+        executions = []
+        paginator = self.stepfunctions.get_paginator('list_executions')
+        for page in paginator.paginate(stateMachineArn=self.state_machine_arn, statusFilter='RUNNING'):
+            executions.extend(self.execution(execution['executionArn']) for execution in page['executions'])
+        return executions
+
+    def execution(self, execution_arn: str) -> dict:
+        description = self.stepfunctions.describe_execution(executionArn=execution_arn)
+        return {
+            "name": description['name'],
+            "executionArn": execution_arn,
+            "status": description['status'],
+            "image_build_version_arns": execution_image_build_version_arns(json.loads(description.get('input') or "{}"))
+        }
+
+    def find_execution(self, image_build_version_arn: str) -> dict:
+        for execution in self.running_executions():
+            if image_build_version_arn in execution["image_build_version_arns"]:
+                return execution
+        return None
+
+    def pipeline_arn(self, image_build_version_arn: str) -> str:
+        """
+            The pipeline that built the image, None when it is unknown so
+            that the build neither supersedes nor is superseded.
+        """
+        if self.descriptors is None:
+            self.descriptors = ImageDescriptorCache.from_environment()
+        try:
+            return self.descriptors.describe(image_build_version_arn).get('sourcePipelineArn')
+        except ClientError as err:
+            logger.warning(f"Unable to describe {image_build_version_arn}: {err}")
+            return None
+
+    def history_export_task_ids(self, execution_arn: str) -> list:
+        events = []
+        paginator = self.stepfunctions.get_paginator('get_execution_history')
+        for page in paginator.paginate(executionArn=execution_arn):
+            events.extend(page['events'])
+        return export_task_ids(events)
+
+    def cancel(self, execution: dict, error: str = CANCELLED_ERROR, cause: str = "Cancelled by request") -> list:
+        """
+            Stops the execution, cancels its export image tasks and releases
+            the export slots of its image builds. Returns the cancelled
+            export image task ids.
+        """
+        execution_arn = execution["executionArn"]
+        try:
+            self.stepfunctions.stop_execution(executionArn=execution_arn, error=error, cause=cause)
+            logger.info(f"Stopped {execution_arn}: {cause}")
+        except ClientError as err:
+            if err.response['Error']['Code'] != 'ExecutionDoesNotExist':
+                raise err
+            logger.warning(f"Execution {execution_arn} does not exist")
+
+        cancelled = []
+        for task_id in self.history_export_task_ids(execution_arn):
+            try:
+                self.ec2.cancel_export_task(ExportTaskId=task_id)
+                cancelled.append(task_id)
+                logger.info(f"Cancelled the export image task {task_id}")
+            except ClientError as err:
+                # completed, already cancelled or unknown export tasks
+                logger.warning(f"Unable to cancel the export image task {task_id}: {err}")
+
+        if self.scheduler is not None:
+            for arn in execution["image_build_version_arns"]:
+                self.scheduler.withdraw(arn)
+        return cancelled
+
+    def supersede(self, image_build_version_arn: str) -> tuple:
+        """
+            Applies the supersede policy for a new image build. Returns
+            (start, superseded execution arns).
+        """
+        start, stale = plan_supersede(image_build_version_arn, self.running_executions(), self.pipeline_arn)
+        for execution in stale:
+            self.cancel(execution, error=SUPERSEDED_ERROR, cause=f"Superseded by {image_build_version_arn}")
+        return start, [execution["executionArn"] for execution in stale]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+    export_events.py:
+    Builds and publishes the versioned "VMDK Export Completed" event to
+    the export EventBridge bus once the VMDK file has been published, and
+    the "VMDK Export Failed" event when the build or the export failed.
+
+    The details follow the JSON schemas registered with the stack
+    (resources/schemas/vmdk_export_*.json). Additive changes keep
+    the schema version, breaking changes bump the major version so that
+    rules can match on "detail.version".
+"""
+
+import json
+from datetime import datetime, timezone
+
+import boto3
+
+from vmexportcommon.export_progress import EVENT_SOURCE
+
+COMPLETED_DETAIL_TYPE = "VMDK Export Completed"
+FAILED_DETAIL_TYPE = "VMDK Export Failed"
+SCHEMA_VERSION = "1.0"
+
+
+def isoformat(epoch_seconds: float) -> str:
+    if epoch_seconds is None:
+        return None
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).isoformat()
+
+
+def object_checksum(head: dict) -> dict:
+    """
+        The strongest checksum S3 holds for the exported object. Export
+        image tasks upload in parts, so the ETag is usually a multipart
+        ETag rather than the MD5 of the file.
+    """
+    if head.get('ChecksumSHA256'):
+        return {"algorithm": "SHA256", "value": head['ChecksumSHA256']}
+    return {"algorithm": "S3_ETAG", "value": head.get('ETag', "").strip('"')}
+
+
+def completion_detail(event: dict, export_task: dict, key: str, head: dict, published_at: float) -> dict:
+    bucket = export_task['S3ExportLocation']['S3Bucket']
+    stage_times = event.get("stage_times", {})
+    started_at = stage_times.get("execution_started")
+    available_at = stage_times.get("ami_available")
+
+    return {
+        "version": SCHEMA_VERSION,
+        "image_build_version_arn": event.get("image_build_version_arn"),
+        "ami": {
+            "id": event["ami_id"],
+            "name": event["ami_name"]
+        },
+        "export": {
+            "task_id": export_task['ExportImageTaskId'],
+            "format": event.get("export_format", "VMDK"),
+            "bucket": bucket,
+            "key": key,
+            "uri": f"s3://{bucket}/{key}",
+            "size_bytes": head.get('ContentLength'),
+            "checksum": object_checksum(head)
+        },
+        "timings": {
+            "execution_started_at": isoformat(started_at),
+            "ami_available_at": isoformat(available_at),
+            "export_started_at": isoformat(stage_times.get("export_started")),
+            "export_completed_at": isoformat(stage_times.get("export_completed")),
+            "published_at": isoformat(published_at),
+            "available_to_published_seconds": round(published_at - available_at, 3) if available_at else None,
+            "total_seconds": round(published_at - started_at, 3) if started_at else None
+        }
+    }
+
+
+def failure_detail(event: dict, failed_at: float) -> dict:
+    failure = event.get("failure", {})
+    stage_times = event.get("stage_times", {})
+    started_at = stage_times.get("execution_started")
+
+    return {
+        "version": SCHEMA_VERSION,
+        "image_build_version_arn": event.get("image_build_version_arn"),
+        "ami": {
+            "id": event.get("ami_id"),
+            "name": event.get("ami_name")
+        },
+        "export_image_task_id": event.get("export_image_task_id"),
+        "failure": {
+            "stage": failure.get("stage", "unknown"),
+            "status": failure.get("status", "UNKNOWN"),
+            "reason": failure.get("reason", "")
+        },
+        "timings": {
+            "execution_started_at": isoformat(started_at),
+            "failed_at": isoformat(failed_at),
+            "total_seconds": round(failed_at - started_at, 3) if started_at else None
+        }
+    }
+
+
+def publish_completion_event(event_bus_name: str, detail: dict, events_client=None):
+    return publish_event(event_bus_name, COMPLETED_DETAIL_TYPE, detail, events_client)
+
+
+def publish_failure_event(event_bus_name: str, detail: dict, events_client=None):
+    return publish_event(event_bus_name, FAILED_DETAIL_TYPE, detail, events_client)
+
+
+def publish_event(event_bus_name: str, detail_type: str, detail: dict, events_client=None):
+    events = events_client or boto3.client('events')
+    response = events.put_events(
+        Entries=[
+            {
+                "Source": EVENT_SOURCE,
+                "DetailType": detail_type,
+                "Detail": json.dumps(detail),
+                "EventBusName": event_bus_name,
+                "Resources": [detail["image_build_version_arn"]] if detail.get("image_build_version_arn") else []
+            }
+        ]
+    )
+    if response.get('FailedEntryCount', 0) > 0:
+        raise RuntimeError(f"Unable to publish the {detail_type} event: {response['Entries']}")
+    return response
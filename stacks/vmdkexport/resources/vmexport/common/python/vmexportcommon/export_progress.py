@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+    export_progress.py:
+    Tracks the progress of an export image task across the polls of the
+    State Machine and publishes progress events to an EventBridge bus.
+
+    The progress state is carried in the State Machine payload under
+    "export_progress". An event is only published when the progress
+    percentage or the status of the task changes, so the event rate is
+    bounded by the poll rate and the number of distinct percentages.
+    Each event carries an ETA derived from the rate observed since the
+    first poll of the export.
+"""
+
+import json
+from datetime import datetime, timedelta, timezone
+
+import boto3
+
+EVENT_SOURCE = "vmdkexport"
+PROGRESS_DETAIL_TYPE = "VMDK Export Progress"
+
+
+def estimate_eta_seconds(first_progress: int, first_observed_at: float, progress: int, observed_at: float):
+    """
+        Seconds until the export reaches 100%, extrapolated from the rate
+        observed between the first and the current poll, or None while
+        no progress has been observed.
+    """
+    if progress >= 100:
+        return 0
+    elapsed = observed_at - first_observed_at
+    if elapsed <= 0 or progress <= first_progress:
+        return None
+    rate = (progress - first_progress) / elapsed
+    return int((100 - progress) / rate)
+
+
+def observe(previous: dict, status: str, progress: int, status_message: str, observed_at: float) -> dict:
+    """
+        Returns the progress state of the current poll, given the state
+        of the previous poll (None on the first poll).
+    """
+    previous = previous or {}
+    first_progress = previous.get("first_progress", progress)
+    first_observed_at = previous.get("first_observed_at", observed_at)
+    return {
+        "status": status,
+        "progress": progress,
+        "status_message": status_message,
+        "observed_at": observed_at,
+        "first_progress": first_progress,
+        "first_observed_at": first_observed_at,
+        "eta_seconds": estimate_eta_seconds(first_progress, first_observed_at, progress, observed_at),
+        "published_status": previous.get("published_status"),
+        "published_progress": previous.get("published_progress")
+    }
+
+
+def should_publish(state: dict) -> bool:
+    return state["progress"] != state["published_progress"] or state["status"] != state["published_status"]
+
+
+def progress_detail(event: dict, state: dict) -> dict:
+    detail = {
+        "image_build_version_arn": event.get("image_build_version_arn"),
+        "ami_id": event.get("ami_id"),
+        "export_image_task_id": event.get("export_image_task_id"),
+        "status": state["status"],
+        "status_message": state["status_message"],
+        "progress": state["progress"],
+        "observed_at": datetime.fromtimestamp(state["observed_at"], timezone.utc).isoformat(),
+        "eta_seconds": state["eta_seconds"],
+        "eta": None
+    }
+    if state["eta_seconds"] is not None:
+        detail["eta"] = (
+            datetime.fromtimestamp(state["observed_at"], timezone.utc) + timedelta(seconds=state["eta_seconds"])
+        ).isoformat()
+    return detail
+
+
+class ProgressPublisher():
+    """
+        Publishes export progress events to an EventBridge bus.
+    """
+
+    def __init__(self, event_bus_name: str, events_client=None):
+        self.event_bus_name = event_bus_name
+        self.events = events_client or boto3.client('events')
+
+    def publish(self, event: dict, state: dict) -> dict:
+        """
+            Publishes the progress state if it changed since the last
+            published event and returns the state to carry forward.
+        """
+        if not should_publish(state):
+            return state
+
+        self.events.put_events(
+            Entries=[
+                {
+                    "Source": EVENT_SOURCE,
+                    "DetailType": PROGRESS_DETAIL_TYPE,
+                    "Detail": json.dumps(progress_detail(event, state)),
+                    "EventBusName": self.event_bus_name,
+                    "Resources": [event["image_build_version_arn"]] if event.get("image_build_version_arn") else []
+                }
+            ]
+        )
+        return dict(state, published_status=state["status"], published_progress=state["progress"])
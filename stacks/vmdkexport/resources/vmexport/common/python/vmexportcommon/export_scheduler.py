@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+
+"""
+    export_scheduler.py:
+    Quota-aware scheduler for EC2 export image tasks.
+
+    EC2 limits the number of concurrent export image tasks per region.
+    The scheduler keeps a counting semaphore per region in the export
+    control table; the holders of the export slots are stored in a map
+    on the semaphore item together with the time the slot was acquired,
+    so that slots held by executions that died are reclaimed once the
+    lease expires.
+
+    Exports that cannot get a slot wait in a per-region priority queue,
+    stored as items sorted by "<priority>#<enqueued at>#<holder>". Only
+    the head of the queue may take the free slots, release builds are
+    ordered ahead of nightly builds. Queue entries carry a lease which
+    the waiter refreshes on every poll, the entries of waiters that died
+    (timed out or aborted executions) are skipped and deleted once their
+    lease expires, so that they do not block the queue.
+"""
+
+import logging
+import time
+from decimal import Decimal
+
+import boto3
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+PRIORITIES = {
+    "release": 0,
+    "default": 5,
+    "nightly": 9
+}
+
+DEFAULT_SLOT_LIMIT = 5
+
+# longer than the time budget of a single export, a slot held for longer
+# than this is considered leaked by a dead execution
+DEFAULT_LEASE_SECONDS = 3 * 60 * 60
+
+# a waiter polls for a slot every minute, its queue entry is reclaimed
+# after this many seconds without a poll
+DEFAULT_QUEUE_LEASE_SECONDS = 10 * 60
+
+# expired queue entries are also removed by the table TTL
+QUEUE_RETENTION_SECONDS = 24 * 60 * 60
+
+
+def priority_for(event: dict) -> int:
+    priority_class = str(event.get("export_priority", "default")).lower()
+    return PRIORITIES.get(priority_class, PRIORITIES["default"])
+
+
+def queue_key(priority: int, enqueued_at: float, holder: str) -> str:
+    return f"{priority}#{int(enqueued_at * 1000):015d}#{holder}"
+
+
+def slot_available(holders: dict, queue_head: list, key: str, slot_limit: int) -> bool:
+    """
+        A queued export may take a slot when a slot is free and the export
+        is within the first <free slots> entries of the priority queue.
+    """
+    free_slots = slot_limit - len(holders)
+    if free_slots <= 0:
+        return False
+    return key in queue_head[:free_slots]
+
+
+class ExportScheduler():
+    """
+        Per-region export slot semaphore and priority queue backed by
+        the export control table.
+    """
+
+    def __init__(
+            self,
+            table_name: str,
+            region: str,
+            slot_limit: int = DEFAULT_SLOT_LIMIT,
+            lease_seconds: int = DEFAULT_LEASE_SECONDS,
+            queue_lease_seconds: int = DEFAULT_QUEUE_LEASE_SECONDS,
+            dynamodb_resource=None
+        ):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.slot_limit = slot_limit
+        self.lease_seconds = lease_seconds
+        self.queue_lease_seconds = queue_lease_seconds
+        self.slots_key = {'pk': f"SLOTS#{region}", 'sk': "SLOTS"}
+        self.queue_pk = f"QUEUE#{region}"
+
+    def enqueue(self, holder: str, priority: int) -> str:
+        key = queue_key(priority, time.time(), holder)
+        self._put_queue_item(holder, key)
+        logger.info(f"Queued {holder} for an export slot with key {key}")
+        return key
+
+    def refresh(self, holder: str, key: str):
+        """
+            Renews the lease of the queue entry on each poll, an entry which
+            was reclaimed in the meantime is put back at its position.
+        """
+        self._put_queue_item(holder, key)
+
+    def try_acquire(self, holder: str, key: str) -> bool:
+        holders = self._holders()
+
+        if holder in holders:
+            self._dequeue(key)
+            return True
+
+        free_slots = self.slot_limit - len(holders)
+        if free_slots <= 0:
+            logger.info(f"No free export slot, {len(holders)} of {self.slot_limit} in use")
+            return False
+
+        queue_head = self._queue_head(free_slots)
+        if not slot_available(holders, queue_head, key, self.slot_limit):
+            logger.info(f"{holder} is not at the head of the export queue")
+            return False
+
+        try:
+            self.table.update_item(
+                Key=self.slots_key,
+                UpdateExpression="SET holders.#h = :now",
+                ConditionExpression="attribute_not_exists(holders.#h) AND size(holders) < :limit",
+                ExpressionAttributeNames={'#h': holder},
+                ExpressionAttributeValues={':now': Decimal(int(time.time())), ':limit': self.slot_limit}
+            )
+        except ClientError as err:
+            if err.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                logger.info(f"Lost the race for an export slot for {holder}")
+                return False
+            raise err
+
+        self._dequeue(key)
+        logger.info(f"Acquired an export slot for {holder}")
+        return True
+
+    def release(self, holder: str):
+        self.table.update_item(
+            Key=self.slots_key,
+            UpdateExpression="REMOVE holders.#h",
+            ExpressionAttributeNames={'#h': holder}
+        )
+        logger.info(f"Released the export slot of {holder}")
+
+    def withdraw(self, holder: str):
+        """
+            Releases the slot and removes the queue entries of an export
+            which was cancelled before it could release them itself.
+        """
+        self.release(holder)
+        paginator = self.table.meta.client.get_paginator('query')
+        for page in paginator.paginate(
+            TableName=self.table.name,
+            KeyConditionExpression="pk = :pk",
+            ExpressionAttributeValues={':pk': self.queue_pk},
+            ProjectionExpression="sk, holder",
+            ConsistentRead=True
+        ):
+            for item in page['Items']:
+                if item.get('holder') == holder:
+                    self._dequeue(item['sk'])
+        logger.info(f"Withdrew {holder} from the export queue")
+
+    def _put_queue_item(self, holder: str, key: str):
+        now = int(time.time())
+        self.table.put_item(Item={
+            'pk': self.queue_pk,
+            'sk': key,
+            'holder': holder,
+            'lease_until': Decimal(now + self.queue_lease_seconds),
+            'expires_at': Decimal(now + self.queue_lease_seconds + QUEUE_RETENTION_SECONDS)
+        })
+
+    def _dequeue(self, key: str):
+        self.table.delete_item(Key={'pk': self.queue_pk, 'sk': key})
+
+    def _queue_head(self, count: int) -> list:
+        """
+            Returns the keys of the first <count> live queue entries,
+            deleting the expired entries in front of them.
+        """
+        head = []
+        now = int(time.time())
+        kwargs = {
+            'KeyConditionExpression': "pk = :pk",
+            'ExpressionAttributeValues': {':pk': self.queue_pk},
+            'ProjectionExpression': "sk, holder, lease_until",
+            'ConsistentRead': True,
+            'Limit': count
+        }
+        while len(head) < count:
+            response = self.table.query(**kwargs)
+            for item in response['Items']:
+                if int(item.get('lease_until', 0)) < now:
+                    self._reclaim_queue_item(item)
+                elif len(head) < count:
+                    head.append(item['sk'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return head
+
+    def _reclaim_queue_item(self, item: dict):
+        logger.warning(f"Reclaiming the expired export queue entry of {item.get('holder')}")
+        try:
+            # the waiter may have refreshed its lease since the query
+            self.table.delete_item(
+                Key={'pk': self.queue_pk, 'sk': item['sk']},
+                ConditionExpression="attribute_not_exists(lease_until) OR lease_until = :lease_until",
+                ExpressionAttributeValues={':lease_until': item.get('lease_until', Decimal(0))}
+            )
+        except ClientError as err:
+            if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise err
+
+    def _holders(self) -> dict:
+        """
+            Returns the current slot holders, creating the semaphore item on
+            first use and reclaiming slots whose lease has expired.
+        """
+        response = self.table.get_item(Key=self.slots_key, ConsistentRead=True)
+        if 'Item' not in response:
+            try:
+                self.table.put_item(
+                    Item={**self.slots_key, 'holders': {}},
+                    ConditionExpression="attribute_not_exists(pk)"
+                )
+            except ClientError as err:
+                if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise err
+            return {}
+
+        holders = dict(response['Item'].get('holders', {}))
+        now = int(time.time())
+        for holder, acquired_at in list(holders.items()):
+            if now - int(acquired_at) > self.lease_seconds:
+                logger.warning(f"Reclaiming the expired export slot of {holder}")
+                try:
+                    self.table.update_item(
+                        Key=self.slots_key,
+                        UpdateExpression="REMOVE holders.#h",
+                        ConditionExpression="holders.#h = :acquired_at",
+                        ExpressionAttributeNames={'#h': holder},
+                        ExpressionAttributeValues={':acquired_at': acquired_at}
+                    )
+                except ClientError as err:
+                    if err.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise err
+                del holders[holder]
+        return holders
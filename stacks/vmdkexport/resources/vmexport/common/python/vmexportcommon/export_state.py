@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+    export_state.py:
+    The typed state passed between the State Machine tasks.
+
+    Handlers decorated with @state_handler receive an ExportState
+    instead of the raw event and return it. Only the fields declared
+    here are carried from task to task, so the state no longer grows
+    with every step, and values of the wrong type fail the task at the
+    stage that set them instead of a later one.
+
+    In claim-check mode (CLAIM_CHECK_BUCKET set) the bulky fields of a
+    state larger than CLAIM_CHECK_THRESHOLD_BYTES are stored in S3 and
+    only a reference is passed on. The fields read by Choice states are
+    always kept inline.
+"""
+
+import functools
+import json
+import logging
+import os
+import uuid
+
+import boto3
+from vmexportcommon.checkpoint import RESUME_POINTS
+
+logger = logging.getLogger()
+
+CLAIM_CHECK_PREFIX = "claim-checks/"
+DEFAULT_CLAIM_CHECK_THRESHOLD_BYTES = 32768
+
+# field name -> accepted types, None means the field is not set
+FIELD_TYPES = {
+    "image_build_version_arn": (str,),
+    "execution": (dict,),
+    "export_priority": (str,),
+    "export_urgent": (str, bool),
+    "batch": (bool,),
+    "resume_from": (str,),
+    "ami_state": (str,),
+    "ami_id": (str,),
+    "ami_name": (str,),
+    "export_eligible": (bool,),
+    "export_queue_key": (str,),
+    "export_slot_status": (str,),
+    "export_image_task_id": (str,),
+    "export_format": (str,),
+    "vdmk_export_status": (str,),
+    "export_progress": (dict,),
+    "stage_times": (dict,),
+    "failure": (dict,),
+    "task_error": (dict,),
+    "completion_event_error": (str,),
+    "claim_check": (dict,)
+}
+
+# fields which may be moved to S3, all others are routing fields
+# or identifiers and are always passed inline
+CLAIM_CHECK_FIELDS = ("export_progress", "stage_times", "failure", "task_error")
+
+EXPORT_SLOT_STATUSES = ("ACQUIRED", "WAITING")
+
+
+class InvalidExportState(ValueError):
+    """
+        The event is not a valid export state.
+    """
+
+
+class ExportState():
+    __slots__ = tuple(FIELD_TYPES)
+
+    def __init__(self, **fields):
+        for name in FIELD_TYPES:
+            object.__setattr__(self, name, None)
+        for name, value in fields.items():
+            setattr(self, name, value)
+        if not self.image_build_version_arn:
+            raise InvalidExportState("image_build_version_arn is not present in request")
+
+    def __setattr__(self, name, value):
+        if name not in FIELD_TYPES:
+            raise InvalidExportState(f"{name} is not a field of the export state")
+        if value is not None and not isinstance(value, FIELD_TYPES[name]):
+            raise InvalidExportState(f"{name} must be of type {FIELD_TYPES[name][0].__name__}, got {type(value).__name__}")
+        if name == "export_slot_status" and value is not None and value not in EXPORT_SLOT_STATUSES:
+            raise InvalidExportState(f"export_slot_status must be one of {EXPORT_SLOT_STATUSES}, got {value}")
+        if name == "resume_from" and value is not None and value not in RESUME_POINTS:
+            raise InvalidExportState(f"resume_from must be one of {RESUME_POINTS}, got {value}")
+        object.__setattr__(self, name, value)
+
+    # mapping access, so the helpers shared with other callers
+    # (record_stage, completion_detail, ...) accept a state as well
+    def __getitem__(self, name):
+        value = getattr(self, name) if name in FIELD_TYPES else None
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return name in FIELD_TYPES and getattr(self, name) is not None
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
+
+    @classmethod
+    def from_event(cls, event: dict, s3_client=None):
+        """
+            The state of a task input, fields the state does not declare are
+            dropped and claim-checked fields are read back from S3.
+        """
+        if isinstance(event, ExportState):
+            return event
+        unknown = sorted(set(event) - set(FIELD_TYPES))
+        if unknown:
+            logger.warning(f"Dropping fields which are not part of the export state: {unknown}")
+        state = cls(**{name: value for name, value in event.items() if name in FIELD_TYPES})
+        if state.claim_check:
+            state.resolve_claim_check(s3_client or boto3.client('s3'))
+        return state
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in FIELD_TYPES if getattr(self, name) is not None}
+
+    def resolve_claim_check(self, s3_client):
+        claim_check = self.claim_check
+        response = s3_client.get_object(Bucket=claim_check["bucket"], Key=claim_check["key"])
+        for name, value in json.loads(response['Body'].read()).items():
+            setattr(self, name, value)
+        self.claim_check = None
+
+    def to_payload(self, bucket: str = None, threshold_bytes: int = DEFAULT_CLAIM_CHECK_THRESHOLD_BYTES, s3_client=None) -> dict:
+        """
+            The task output. With a bucket the claim-check fields of a payload
+            larger than the threshold are stored in S3 and replaced by a
+            reference.
+        """
+        payload = self.to_dict()
+        if not bucket or payload_size(payload) <= threshold_bytes:
+            return payload
+
+        checked = {name: payload.pop(name) for name in CLAIM_CHECK_FIELDS if name in payload}
+        if not checked:
+            return payload
+        execution_name = (self.execution or {}).get("name", "unknown")
+        key = f"{CLAIM_CHECK_PREFIX}{execution_name}/{uuid.uuid4()}.json"
+        s3_client = s3_client or boto3.client('s3')
+        s3_client.put_object(Bucket=bucket, Key=key, Body=json.dumps(checked).encode("utf-8"), ContentType="application/json")
+        payload["claim_check"] = {"bucket": bucket, "key": key, "fields": sorted(checked)}
+        logger.info(f"Stored {sorted(checked)} of the export state in s3://{bucket}/{key}")
+        return payload
+
+
+def payload_size(payload: dict) -> int:
+    return len(json.dumps(payload).encode("utf-8"))
+
+
+def state_handler(handler):
+    """
+        Decorates a lambda handler to receive the task input as an
+        ExportState and to return the state as the task output.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        state = handler(ExportState.from_event(event), context)
+        return state.to_payload(
+            bucket=os.environ.get('CLAIM_CHECK_BUCKET'),
+            threshold_bytes=int(os.environ.get('CLAIM_CHECK_THRESHOLD_BYTES', DEFAULT_CLAIM_CHECK_THRESHOLD_BYTES))
+        )
+    return wrapper
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+"""
+    image_descriptor.py:
+    Read-through cache of EC2 Image Builder image descriptors.
+
+    The descriptor (get_image) of an image that is AVAILABLE never
+    changes. It is cached in the memory of the lambda container and in
+    the export control table (pk "IMAGE#<image build version arn>") with
+    a TTL, so a built image is described once across the stages and
+    executions. Images in any other state are always described by
+    Image Builder.
+
+    The table tier is informational, failures to read or write it are
+    logged and fall back to Image Builder.
+"""
+
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+import boto3
+
+logger = logging.getLogger()
+
+CACHED_STATES = ("AVAILABLE",)
+DEFAULT_TTL_SECONDS = 30 * 86400
+MAX_MEMORY_ENTRIES = 256
+
+# descriptors cached by the lambda container, oldest first
+_memory = OrderedDict()
+
+
+def clear_memory():
+    _memory.clear()
+
+
+def is_immutable(image: dict) -> bool:
+    return str(image.get('state', {}).get('status', "")).upper() in CACHED_STATES
+
+
+def descriptor_key(image_build_version_arn: str) -> dict:
+    return {"pk": f"IMAGE#{image_build_version_arn}", "sk": "DESCRIPTOR"}
+
+
+class ImageDescriptorCache():
+
+    def __init__(self, table_name: str = None, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 imagebuilder_client=None, dynamodb_resource=None):
+        self.imagebuilder = imagebuilder_client or boto3.client('imagebuilder')
+        self.table = None
+        if table_name:
+            dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+            self.table = dynamodb.Table(table_name)
+        self.ttl_seconds = ttl_seconds
+
+    @classmethod
+    def from_environment(cls, imagebuilder_client=None):
+        return cls(
+            table_name=os.environ.get('IMAGE_DESCRIPTOR_TABLE'),
+            ttl_seconds=int(os.environ.get('IMAGE_DESCRIPTOR_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+            imagebuilder_client=imagebuilder_client
+        )
+
+    def describe(self, image_build_version_arn: str, now: float = None) -> dict:
+        """
+            The image descriptor, as returned in "image" by get_image.
+        """
+        if image_build_version_arn in _memory:
+            _memory.move_to_end(image_build_version_arn)
+            return _memory[image_build_version_arn]
+
+        image = self._read_table(image_build_version_arn)
+        if image is None:
+            image = self.imagebuilder.get_image(imageBuildVersionArn=image_build_version_arn)['image']
+            if is_immutable(image):
+                self._write_table(image_build_version_arn, image, now if now is not None else time.time())
+
+        if is_immutable(image):
+            _memory[image_build_version_arn] = image
+            while len(_memory) > MAX_MEMORY_ENTRIES:
+                _memory.popitem(last=False)
+        return image
+
+    def _read_table(self, image_build_version_arn: str) -> dict:
+        if self.table is None:
+            return None
+        try:
+            item = self.table.get_item(Key=descriptor_key(image_build_version_arn)).get('Item')
+        except Exception as e:
+            logger.warning(f"Unable to read the cached descriptor of {image_build_version_arn}: {e}")
+            return None
+        return json.loads(item["descriptor"]) if item else None
+
+    def _write_table(self, image_build_version_arn: str, image: dict, now: float):
+        if self.table is None:
+            return
+        try:
+            self.table.put_item(Item=dict(
+                descriptor_key(image_build_version_arn),
+                descriptor=json.dumps(image, default=str),
+                expires_at=int(now) + self.ttl_seconds
+            ))
+        except Exception as e:
+            logger.warning(f"Unable to cache the descriptor of {image_build_version_arn}: {e}")
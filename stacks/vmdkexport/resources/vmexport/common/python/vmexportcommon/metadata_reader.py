@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""
+    metadata_reader.py:
+    Cached reader of the export metadata in SSM parameter store, for the
+    consumers of the exports.
+
+    A snapshot of a pipeline and recipe version is read with paginated
+    get_parameters_by_path calls instead of one get_parameter call per
+    key: the top level parameters, which hold the latest pointer, and
+    the namespace of the build the pointer refers to (see ssm_metadata).
+    Deployments without build namespaces are read from the flat legacy
+    parameters.
+
+    Subtrees are cached in process, in a size bounded LRU. The top level
+    parameters expire after ttl_seconds. A build namespace is read again
+    when the version of the latest parameter changes, and otherwise after
+    namespace_ttl_seconds: failed and resumed exports write to a namespace
+    without moving the latest parameter. With a cache_dir, build
+    namespaces are also kept on disk and shared by processes, under the
+    same rules; at most max_disk_entries files are kept, the least
+    recently written ones are removed first.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import boto3
+from botocore.config import Config
+from vmexportcommon.ssm_metadata import LATEST, metadata_root
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_NAMESPACE_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 128
+DEFAULT_MAX_DISK_ENTRIES = 1024
+
+# back off on throttling instead of adding to it during fleet rollouts
+SSM_CLIENT_CONFIG = Config(retries={"mode": "adaptive", "max_attempts": 10})
+
+
+class MetadataReader():
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 cache_dir: str = None, ssm_client=None, clock=time.monotonic,
+                 namespace_ttl_seconds: float = DEFAULT_NAMESPACE_TTL_SECONDS,
+                 max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES, wall_clock=time.time):
+        self.ttl_seconds = ttl_seconds
+        self.namespace_ttl_seconds = namespace_ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.cache_dir = cache_dir
+        self.ssm = ssm_client or boto3.client('ssm', config=SSM_CLIENT_CONFIG)
+        self.clock = clock
+        # the disk entries are shared by processes, they are timed by the wall clock
+        self.wall_clock = wall_clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def snapshot(self, pipeline_name: str, recipe_version: str) -> dict:
+        """
+            The metadata of the latest export of the recipe version, as
+            {"AMI_ID": ..., "export/ImagePath": ..., ...}.
+        """
+        root = metadata_root(pipeline_name, recipe_version)
+        top = self._parameters(root, recursive=False)
+        if LATEST not in top:
+            # deployments without build namespaces
+            export = self._parameters(f"{root}/export", recursive=True)
+            return dict(
+                {name: parameter["Value"] for name, parameter in top.items()},
+                **{f"export/{name}": parameter["Value"] for name, parameter in export.items()}
+            )
+        pointer = top[LATEST]
+        return self._namespace(pointer["Value"], pointer["Version"])
+
+    def get(self, pipeline_name: str, recipe_version: str, name: str, default: str = None) -> str:
+        return self.snapshot(pipeline_name, recipe_version).get(name, default)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _namespace(self, path: str, version: int) -> dict:
+        key = ("namespace", path, version)
+        values = self._cached(key)
+        if values is not None:
+            return values
+
+        values = self._read_disk(path, version)
+        if values is None:
+            values = {name: parameter["Value"] for name, parameter in self._fetch(path, recursive=True).items()}
+            self._write_disk(path, version, values)
+        self._store(key, values, self.namespace_ttl_seconds)
+        return values
+
+    def _parameters(self, path: str, recursive: bool) -> dict:
+        key = ("path", path, recursive)
+        parameters = self._cached(key)
+        if parameters is None:
+            parameters = self._fetch(path, recursive)
+            self._store(key, parameters, self.ttl_seconds)
+        return parameters
+
+    def _fetch(self, path: str, recursive: bool) -> dict:
+        parameters = {}
+        paginator = self.ssm.get_paginator('get_parameters_by_path')
+        for page in paginator.paginate(Path=path, Recursive=recursive):
+            for parameter in page['Parameters']:
+                name = parameter['Name'][len(path):].lstrip("/")
+                parameters[name] = {"Value": parameter['Value'], "Version": parameter.get('Version')}
+        return parameters
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _store(self, key, value, ttl_seconds: float):
+        with self._lock:
+            self._entries[key] = (self.clock() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _disk_file(self, path: str) -> str:
+        return os.path.join(self.cache_dir, f"{hashlib.sha256(path.encode('utf-8')).hexdigest()}.json")
+
+    def _read_disk(self, path: str, version: int) -> dict:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_file(path), "r") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if entry.get("path") != path or entry.get("version") != version:
+            return None
+        if self.wall_clock() - entry.get("written_at", float("-inf")) >= self.namespace_ttl_seconds:
+            return None
+        return entry["values"]
+
+    def _write_disk(self, path: str, version: int, values: dict):
+        if not self.cache_dir:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # replace the entry atomically, concurrent readers see the old or the new one
+        handle, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(handle, "w") as file:
+            json.dump({"path": path, "version": version, "written_at": self.wall_clock(), "values": values}, file)
+        os.replace(temp_path, self._disk_file(path))
+        self._evict_disk(keep=self._disk_file(path))
+
+    def _evict_disk(self, keep: str):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            file_path = os.path.join(self.cache_dir, name)
+            if not name.endswith(".json") or file_path == keep:
+                continue
+            try:
+                entries.append((os.path.getmtime(file_path), file_path))
+            except OSError:
+                # removed by another process
+                continue
+        entries.sort()
+        # the entry just written is kept
+        for _, file_path in entries[:max(len(entries) + 1 - self.max_disk_entries, 0)]:
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+    notification_digest.py:
+    Buffers the notifications of completed exports in the export control
+    table so that a scheduled aggregator can send a single digest message
+    per window instead of one email per export.
+
+    Buffered notifications are stored under pk "DIGEST" with a sort key
+    ordered by the time the export was published. They are only deleted
+    once the digest containing them has been sent, so a failed send is
+    retried by the next window.
+"""
+
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Key
+
+DIGEST_PARTITION = "DIGEST"
+DEFAULT_BUFFER_DAYS = 7
+MAX_EXPORTS_PER_MESSAGE = 100
+
+URGENT_VALUES = ("true", "yes", "1")
+
+
+def is_urgent(event: dict) -> bool:
+    """
+        Exports started with the "export_urgent" message attribute are
+        notified right away, also in digest mode.
+    """
+    return str(event.get("export_urgent", "")).lower() in URGENT_VALUES
+
+
+def digest_sort_key(published_at: float, export_image_task_id: str) -> str:
+    return f"{int(published_at * 1000):015d}#{export_image_task_id}"
+
+
+class NotificationDigest():
+
+    def __init__(self, table_name: str, dynamodb_resource=None):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+
+    def add(self, export_image_task_id: str, params: dict, published_at: float = None):
+        published_at = published_at if published_at is not None else time.time()
+        self.table.put_item(Item={
+            "pk": DIGEST_PARTITION,
+            "sk": digest_sort_key(published_at, export_image_task_id),
+            "params": params,
+            "expires_at": int(published_at) + DEFAULT_BUFFER_DAYS * 86400
+        })
+
+    def pending(self) -> list:
+        """
+            The buffered notifications, oldest first.
+        """
+        items = []
+        kwargs = {"KeyConditionExpression": Key("pk").eq(DIGEST_PARTITION)}
+        while True:
+            response = self.table.query(**kwargs)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                return items
+            kwargs["ExclusiveStartKey"] = response['LastEvaluatedKey']
+
+    def remove(self, items: list):
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.delete_item(Key={"pk": item["pk"], "sk": item["sk"]})
+
+
+def chunk(items: list, size: int = MAX_EXPORTS_PER_MESSAGE) -> list:
+    return [items[i:i + size] for i in range(0, len(items), size)]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+    resilience.py:
+    Error classification and a shared circuit breaker for the export
+    lambda functions.
+
+    Handlers decorated with @resilient_handler raise UpstreamThrottled or
+    UpstreamUnavailable for throttling and transient AWS API errors
+    instead of the generic ClientError, so that the Retry policy of the
+    State Machine tasks can retry them with exponential backoff while
+    permanent errors (i.e. AccessDenied) fail fast.
+
+    Throttling errors are also counted per upstream API operation in the
+    export control table (pk "BREAKER#<region>", sk the operation name).
+    When an operation is throttled more than the threshold within the
+    window the breaker opens for the cooldown, and the export slot stage
+    pauses new exports until it closes again.
+"""
+
+import functools
+import logging
+import os
+import time
+
+import boto3
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+THROTTLING_ERROR_CODES = (
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+    "SlowDown"
+)
+
+TRANSIENT_ERROR_CODES = (
+    "InternalError",
+    "InternalFailure",
+    "InternalServerError",
+    "InternalServerException",
+    "ServiceUnavailable",
+    "ServiceUnavailableException",
+    "ServiceException",
+    "RequestTimeout",
+    "RequestTimeoutException"
+)
+
+DEFAULT_THROTTLE_THRESHOLD = 10
+DEFAULT_WINDOW_SECONDS = 300
+DEFAULT_COOLDOWN_SECONDS = 600
+
+
+class UpstreamThrottled(Exception):
+    """
+        An upstream AWS API throttled the request, retried by the State Machine.
+    """
+
+
+class UpstreamUnavailable(Exception):
+    """
+        An upstream AWS API failed with a transient error, retried by the State Machine.
+    """
+
+
+def classify_client_error(error: ClientError):
+    """
+        Returns the retryable exception for the error, or None if the
+        error is permanent.
+    """
+    code = error.response.get('Error', {}).get('Code', "")
+    status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+    message = f"{error.operation_name}: {code}: {error.response.get('Error', {}).get('Message', '')}"
+    if code in THROTTLING_ERROR_CODES or status == 429:
+        return UpstreamThrottled(message)
+    if code in TRANSIENT_ERROR_CODES or status >= 500:
+        return UpstreamUnavailable(message)
+    return None
+
+
+def breaker_is_open(item: dict, now: float) -> bool:
+    return float(item.get("open_until", 0)) > now
+
+
+class CircuitBreaker():
+
+    def __init__(self, table_name: str, region: str,
+                 threshold: int = DEFAULT_THROTTLE_THRESHOLD,
+                 window_seconds: int = DEFAULT_WINDOW_SECONDS,
+                 cooldown_seconds: int = DEFAULT_COOLDOWN_SECONDS,
+                 dynamodb_resource=None):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.pk = f"BREAKER#{region}"
+        self.threshold = threshold
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+
+    @classmethod
+    def from_environment(cls):
+        return cls(
+            table_name=os.environ['EXPORT_CONTROL_TABLE'],
+            region=os.environ['AWS_REGION'],
+            threshold=int(os.environ.get('BREAKER_THROTTLE_THRESHOLD', DEFAULT_THROTTLE_THRESHOLD)),
+            window_seconds=int(os.environ.get('BREAKER_WINDOW_SECONDS', DEFAULT_WINDOW_SECONDS)),
+            cooldown_seconds=int(os.environ.get('BREAKER_COOLDOWN_SECONDS', DEFAULT_COOLDOWN_SECONDS))
+        )
+
+    def record_throttle(self, operation: str, now: float = None) -> bool:
+        """
+            Counts a throttling error of the operation and opens the breaker
+            when the threshold is reached. Returns whether the breaker opened.
+        """
+        now = now if now is not None else time.time()
+        key = {"pk": self.pk, "sk": operation}
+        try:
+            response = self.table.update_item(
+                Key=key,
+                UpdateExpression="ADD throttles :one",
+                ConditionExpression="window_start > :window_floor",
+                ExpressionAttributeValues={":one": 1, ":window_floor": int(now) - self.window_seconds},
+                ReturnValues="ALL_NEW"
+            )
+            throttles = int(response['Attributes']['throttles'])
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # first throttle of a new window
+            self.table.update_item(
+                Key=key,
+                UpdateExpression="SET window_start = :now, throttles = :one, expires_at = :expires",
+                ExpressionAttributeValues={":now": int(now), ":one": 1, ":expires": int(now) + 86400}
+            )
+            throttles = 1
+
+        if throttles < self.threshold:
+            return False
+
+        logger.warning(f"{operation} throttled {throttles} times, pausing new exports for {self.cooldown_seconds}s")
+        self.table.update_item(
+            Key=key,
+            UpdateExpression="SET open_until = :open_until",
+            ExpressionAttributeValues={":open_until": int(now) + self.cooldown_seconds}
+        )
+        return True
+
+    def open_operations(self, now: float = None) -> list:
+        """
+            The operations whose breaker is currently open.
+        """
+        now = now if now is not None else time.time()
+        response = self.table.query(KeyConditionExpression=Key("pk").eq(self.pk))
+        return [item["sk"] for item in response['Items'] if breaker_is_open(item, now)]
+
+
+def resilient_handler(handler):
+    """
+        Decorates a lambda handler to raise UpstreamThrottled and
+        UpstreamUnavailable for retryable AWS API errors and to feed
+        throttling errors to the circuit breaker.
+    """
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        try:
+            return handler(event, context)
+        except ClientError as e:
+            classified = classify_client_error(e)
+            if classified is None:
+                raise
+            if isinstance(classified, UpstreamThrottled) and 'EXPORT_CONTROL_TABLE' in os.environ:
+                try:
+                    CircuitBreaker.from_environment().record_throttle(e.operation_name)
+                except Exception as breaker_error:
+                    logger.warning(f"Unable to record the throttling of {e.operation_name}: {breaker_error}")
+            raise classified from e
+    return wrapper
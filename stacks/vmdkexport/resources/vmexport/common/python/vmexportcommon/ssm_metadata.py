@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+"""
+    ssm_metadata.py:
+    Writes the build and export metadata of an image build to SSM
+    parameter store.
+
+    Every image build writes its metadata under its own namespace,
+    /{pipeline}/{version}/builds/{build}, where the version and build are
+    derived from the image build version arn (i.e. "1.0.0" and
+    "recipe-1.0.0-3"). The AMI metadata and
+    export stages of an execution, and a resumed execution, write to the
+    same namespace. Once an export has published all its metadata, the
+    single /{pipeline}/{version}/latest parameter is pointed at its
+    namespace. A reader gets a consistent snapshot with two reads,
+    get_parameter(latest) and get_parameters_by_path(<namespace>),
+    however many exports of the recipe version run concurrently.
+
+    The latest pointer only moves forward: it is not pointed at an older
+    build than the one it names, which is read from the
+    ImageBuildVersionArn parameter of its namespace. SSM has no
+    conditional writes, so the version of the pointer is compared before
+    and after the write, and a newer build written in between by another
+    export is written back.
+
+    The flat /{pipeline}/{version}/... parameters of earlier releases are
+    still written when LEGACY_SSM_PATHS is "true", they are overwritten
+    by concurrent exports and may mix values of different builds.
+"""
+
+import logging
+import os
+import re
+
+import boto3
+from vmexportcommon.export_cancellation import supersedes
+
+logger = logging.getLogger()
+
+BUILDS = "builds"
+LATEST = "latest"
+IMAGE_BUILD_VERSION_ARN = "ImageBuildVersionArn"
+
+# writes of the latest pointer when other exports write it concurrently
+LATEST_WRITE_ATTEMPTS = 5
+
+
+def metadata_root(pipeline_name: str, recipe_version: str) -> str:
+    return f"/{pipeline_name}/{recipe_version}"
+
+
+def build_id(image_build_version_arn: str) -> str:
+    """
+        The namespace of an image build, its recipe, version and build
+        number with the characters SSM does not accept replaced.
+    """
+    resource = image_build_version_arn.split(":image/")[-1]
+    return re.sub(r"[^a-zA-Z0-9_.-]", "-", resource.replace("/", "-"))
+
+
+def recipe_version(image_build_version_arn: str) -> str:
+    """
+        The recipe version of an image build, i.e. "1.0.0".
+    """
+    parts = image_build_version_arn.split(":image/")[-1].split("/")
+    if len(parts) != 3:
+        raise ValueError(f"Invalid image build version arn: {image_build_version_arn}")
+    return parts[1]
+
+
+def build_path(root: str, image_build_version_arn: str) -> str:
+    return f"{root}/{BUILDS}/{build_id(image_build_version_arn)}"
+
+
+class MetadataWriter():
+
+    def __init__(self, pipeline_name: str, recipe_version: str, image_build_version_arn: str,
+                 legacy_paths: bool = False, ssm_client=None):
+        self.root = metadata_root(pipeline_name, recipe_version)
+        self.image_build_version_arn = image_build_version_arn
+        self.path = build_path(self.root, image_build_version_arn)
+        self.legacy_paths = legacy_paths
+        self.ssm = ssm_client or boto3.client('ssm')
+
+    @classmethod
+    def from_environment(cls, event, ssm_client=None):
+        return cls(
+            os.environ['PIPELINE_NAME'],
+            recipe_version(event["image_build_version_arn"]),
+            event["image_build_version_arn"],
+            legacy_paths=os.environ.get('LEGACY_SSM_PATHS', "false").lower() == "true",
+            ssm_client=ssm_client
+        )
+
+    def put(self, name: str, value: str):
+        """
+            Writes the parameter, i.e. "export/ImagePath", in the namespace
+            of the image build.
+        """
+        self._put(f"{self.path}/{name}", value)
+        if self.legacy_paths:
+            self._put(f"{self.root}/{name}", value)
+
+    def publish_latest(self) -> bool:
+        """
+            Points the latest parameter at the namespace of the image build,
+            written last once every parameter of the build is in place.
+            Returns False when latest is left at a newer build.
+        """
+        name = f"{self.root}/{LATEST}"
+        self._put(f"{self.path}/{IMAGE_BUILD_VERSION_ARN}", self.image_build_version_arn)
+
+        arn, path = self.image_build_version_arn, self.path
+        for _ in range(LATEST_WRITE_ATTEMPTS):
+            current = self._get(name)
+            version = current['Version'] if current else 0
+            if current is not None and current['Value'] == path:
+                break
+            if current is not None:
+                current_arn = self._namespace_arn(current['Value'])
+                if current_arn is not None and not supersedes(arn, current_arn):
+                    logger.info(f"{name} points to {current['Value']}, not moving it back to {path}")
+                    return False
+
+            written = self._put(name, path)
+            if written == version + 1:
+                logger.info(f"{name} points to {path}")
+                break
+            # other exports wrote the pointer between the read and the
+            # write, the newest of their builds is written back
+            for value in self._history(name, version, written):
+                value_arn = self._namespace_arn(value)
+                if value_arn is not None and supersedes(value_arn, arn):
+                    arn, path = value_arn, value
+            logger.info(f"{name} was written concurrently, re-checking it for {path}")
+        else:
+            raise RuntimeError(f"Unable to publish {name} after {LATEST_WRITE_ATTEMPTS} attempts")
+        return path == self.path
+
+    def _namespace_arn(self, path: str) -> str:
+        # namespaces written before the pointer was ordered have no arn
+        parameter = self._get(f"{path}/{IMAGE_BUILD_VERSION_ARN}")
+        return parameter['Value'] if parameter else None
+
+    def _get(self, name: str) -> dict:
+        try:
+            return self.ssm.get_parameter(Name=name)['Parameter']
+        except self.ssm.exceptions.ParameterNotFound:
+            return None
+
+    def _history(self, name: str, after: int, before: int) -> list:
+        values = []
+        paginator = self.ssm.get_paginator('get_parameter_history')
+        for page in paginator.paginate(Name=name):
+            values.extend(
+                parameter['Value'] for parameter in page['Parameters']
+                if after < parameter['Version'] < before
+            )
+        return values
+
+    def _put(self, name: str, value: str) -> int:
+        logger.debug(f"Writing {name} with the value: {value} to ssm")
+        return self.ssm.put_parameter(Name=name, Value=value, Type='String', Overwrite=True)['Version']
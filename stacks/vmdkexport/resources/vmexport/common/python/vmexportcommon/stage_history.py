@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+    stage_history.py:
+    Records the time at which each execution of the export State Machine
+    passes each stage in the export history table.
+
+    One item per execution is stored in the partition of the day the
+    execution started (pk "EXECUTIONS#yyyy-mm-dd", sk the execution id,
+    followed by "#<item>" for each export of a batch execution), so that
+    a time window can be reported with one query per day instead of a
+    table scan. Each stage is a flat "stage_<name>" attribute holding the
+    epoch seconds of the first time the stage was reached, retries of a
+    stage keep the original timestamp.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import boto3
+
+EXECUTION_STARTED = "execution_started"
+AMI_AVAILABLE = "ami_available"
+EXPORT_STARTED = "export_started"
+EXPORT_COMPLETED = "export_completed"
+METADATA_PUBLISHED = "metadata_published"
+FAILED = "failed"
+
+STAGES = (EXECUTION_STARTED, AMI_AVAILABLE, EXPORT_STARTED, EXPORT_COMPLETED, METADATA_PUBLISHED, FAILED)
+
+DEFAULT_RETENTION_DAYS = 400
+
+logger = logging.getLogger()
+
+
+def partition_key(day: str) -> str:
+    return f"EXECUTIONS#{day}"
+
+
+def stage_attribute(stage: str) -> str:
+    return f"stage_{stage}"
+
+
+def execution_context(event: dict) -> dict:
+    """
+        The execution id and start time injected into the payload by the
+        first state of the State Machine.
+    """
+    return event.get("execution") or {}
+
+
+def execution_sort_key(context: dict) -> str:
+    if context.get("item") is None:
+        return context["id"]
+    return f"{context['id']}#{context['item']}"
+
+
+class StageHistory():
+
+    def __init__(self, table_name: str, retention_days: int = DEFAULT_RETENTION_DAYS, dynamodb_resource=None):
+        dynamodb = dynamodb_resource or boto3.resource('dynamodb')
+        self.table = dynamodb.Table(table_name)
+        self.retention_days = retention_days
+
+    def record(self, event: dict, stage: str, at: float = None, **attributes):
+        """
+            Records that the execution of the event reached the stage, the
+            attributes (pipeline, format, region, ...) are stored alongside.
+        """
+        context = execution_context(event)
+        if not context.get("id") or not context.get("started_at"):
+            logger.warning(f"No execution context in the event, {stage} is not recorded")
+            return
+
+        at = at if at is not None else time.time()
+        names = {"#stage": stage_attribute(stage), "#image": "image_build_version_arn", "#expires": "expires_at"}
+        values = {
+            ":at": Decimal(str(round(at, 3))),
+            ":image": event.get("image_build_version_arn", ""),
+            ":expires": int(at) + self.retention_days * 86400
+        }
+        updates = ["#stage = if_not_exists(#stage, :at)", "#image = :image", "#expires = :expires"]
+        for i, (name, value) in enumerate(sorted(attributes.items())):
+            names[f"#a{i}"] = name
+            values[f":a{i}"] = value
+            updates.append(f"#a{i} = :a{i}")
+
+        self.table.update_item(
+            Key={"pk": partition_key(context["started_at"][:10]), "sk": execution_sort_key(context)},
+            UpdateExpression="SET " + ", ".join(updates),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+
+
+def record_stage(event: dict, stage: str, at: float = None, **attributes):
+    """
+        Records the stage in the table named by the EXPORT_HISTORY_TABLE
+        environment variable and in the "stage_times" of the event. The
+        history is informational, failures are logged and never fail the
+        export.
+    """
+    at = at if at is not None else time.time()
+    event.setdefault("stage_times", {}).setdefault(stage, round(at, 3))
+    try:
+        StageHistory(os.environ['EXPORT_HISTORY_TABLE']).record(event, stage, at, **attributes)
+    except Exception as e:
+        logger.warning(f"Unable to record stage {stage}: {e}")
+
+
+def parse_timestamp(value: str) -> float:
+    """
+        Epoch seconds of a State Machine context timestamp,
+        i.e. 2021-10-01T10:15:00.123Z
+    """
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
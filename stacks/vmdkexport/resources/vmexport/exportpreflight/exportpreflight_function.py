@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+
+"""
+    exportpreflight_function.py:
+    AWS Step Functions State Machine Lambda Handler which
+    checks that the AMI can be exported before an export slot is
+    taken and the export image task is started, so that exports
+    EC2 would reject fail within seconds with actionable reasons:
+
+    * the AMI is available, EBS backed and has no product codes
+      (marketplace or billing codes) or licensed platform,
+    * its boot mode is supported by the export,
+    * its block devices are EBS volumes of a supported type, and
+      encrypted snapshots use the key shared with the export,
+    * the vmimport role exists, trusts vmie.amazonaws.com with the
+      vmimport external id and may write to the export bucket.
+"""
+
+import json
+import logging
+import os
+import time
+from urllib.parse import unquote
+
+import boto3
+from botocore.exceptions import ClientError
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.resilience import resilient_handler
+
+# set logging
+logger = logging.getLogger()
+logger.setLevel(logging.DEBUG)
+
+DEFAULT_BOOT_MODES = ("legacy-bios",)
+DEFAULT_VOLUME_TYPES = ("standard", "gp2", "gp3", "io1", "io2")
+
+# platforms of AMIs without license included software
+EXPORTABLE_PLATFORMS = ("Linux/UNIX",)
+
+EXPORT_PREFIX = "exports/"
+VMIE_SERVICE = "vmie.amazonaws.com"
+VMIE_EXTERNAL_ID = "vmimport"
+
+# S3 permissions the vmimport role needs on the export bucket
+# see https://docs.aws.amazon.com/vm-import/latest/userguide/vmie_prereqs.html#vmimport-role
+BUCKET_ACTIONS = ("s3:GetBucketLocation", "s3:GetBucketAcl", "s3:ListBucket")
+OBJECT_ACTIONS = ("s3:GetObject", "s3:PutObject")
+
+# the role is the same for every export, a successful check is
+# reused by the container for this long
+ROLE_CHECK_TTL_SECONDS = 900
+_role_checked_at = {}
+
+
+def split_setting(value: str, default: tuple) -> tuple:
+    return tuple(item.strip() for item in value.split(",") if item.strip()) if value else default
+
+
+def encrypted_snapshot_ids(image: dict) -> list:
+    return [
+        mapping['Ebs']['SnapshotId']
+        for mapping in image.get('BlockDeviceMappings', [])
+        if mapping.get('Ebs', {}).get('Encrypted') and mapping['Ebs'].get('SnapshotId')
+    ]
+
+
+def snapshot_kms_key_ids(ec2_client, image: dict) -> dict:
+    """
+        The KMS key of each encrypted snapshot of the AMI, by snapshot id.
+        describe_images does not return the key of the block devices, it
+        is read from the snapshots.
+    """
+    snapshot_ids = encrypted_snapshot_ids(image)
+    if not snapshot_ids:
+        return {}
+    snapshots = ec2_client.describe_snapshots(SnapshotIds=snapshot_ids)['Snapshots']
+    return {snapshot['SnapshotId']: snapshot.get('KmsKeyId') for snapshot in snapshots}
+
+
+def image_reasons(image: dict, boot_modes: tuple, volume_types: tuple, kms_key_arns: tuple, kms_key_ids: dict = None) -> list:
+    """
+        Why the AMI cannot be exported, empty when it can be. kms_key_ids
+        holds the KMS key of each encrypted snapshot (snapshot_kms_key_ids).
+    """
+    kms_key_ids = kms_key_ids or {}
+    reasons = []
+    image_id = image.get('ImageId')
+    if image.get('State') != "available":
+        reasons.append(f"AMI {image_id} is {image.get('State')}, only available AMIs can be exported")
+    if image.get('RootDeviceType', "ebs") != "ebs":
+        reasons.append(f"AMI {image_id} is {image.get('RootDeviceType')} backed, only EBS backed AMIs can be exported")
+
+    product_codes = [code.get('ProductCodeId') for code in image.get('ProductCodes', [])]
+    if product_codes:
+        reasons.append(f"AMI {image_id} has product codes {', '.join(product_codes)}, AMIs with marketplace or billing codes cannot be exported")
+    platform = image.get('PlatformDetails', "Linux/UNIX")
+    if platform not in EXPORTABLE_PLATFORMS and "BYOL" not in platform:
+        reasons.append(f"AMI {image_id} runs {platform}, AMIs with license included software cannot be exported")
+
+    boot_mode = image.get('BootMode', "legacy-bios")
+    if boot_mode not in boot_modes:
+        reasons.append(f"AMI {image_id} boots with {boot_mode}, the export supports {', '.join(boot_modes)}")
+
+    for mapping in image.get('BlockDeviceMappings', []):
+        device = mapping.get('DeviceName')
+        if 'VirtualName' in mapping:
+            reasons.append(f"Device {device} is the instance store volume {mapping['VirtualName']}, remove it from the AMI block device mapping")
+            continue
+        ebs = mapping.get('Ebs')
+        if ebs is None:
+            continue
+        volume_type = ebs.get('VolumeType', "standard")
+        if volume_type not in volume_types:
+            reasons.append(f"Device {device} is a {volume_type} volume, the export supports {', '.join(volume_types)}")
+        kms_key_id = kms_key_ids.get(ebs.get('SnapshotId'))
+        if ebs.get('Encrypted') and kms_key_id not in kms_key_arns:
+            reasons.append(
+                f"Snapshot {ebs.get('SnapshotId')} of {device} is encrypted with {kms_key_id or 'an unknown key'}, "
+                f"encrypt the AMI with the export key {', '.join(kms_key_arns) or '(none)'}"
+            )
+    return reasons
+
+
+def policy_document(document) -> dict:
+    # get_role returns the decoded document, other callers the url encoded json
+    return json.loads(unquote(document)) if isinstance(document, str) else document
+
+
+def trusts_vmie(trust_policy: dict) -> bool:
+    statements = trust_policy.get('Statement', [])
+    for statement in statements if isinstance(statements, list) else [statements]:
+        services = statement.get('Principal', {}).get('Service', [])
+        services = services if isinstance(services, list) else [services]
+        actions = statement.get('Action', [])
+        actions = actions if isinstance(actions, list) else [actions]
+        conditions = {
+            key.lower(): value
+            for key, value in statement.get('Condition', {}).get('StringEquals', {}).items()
+        }
+        if (statement.get('Effect') == "Allow"
+                and VMIE_SERVICE in services
+                and "sts:AssumeRole" in actions
+                and conditions.get("sts:externalid") == VMIE_EXTERNAL_ID):
+            return True
+    return False
+
+
+def role_reasons(iam_client, s3_client, role_name: str, bucket: str) -> list:
+    """
+        Why the vmimport role cannot export to the bucket, empty when it can.
+    """
+    try:
+        role = iam_client.get_role(RoleName=role_name)['Role']
+    except iam_client.exceptions.NoSuchEntityException:
+        return [f"The {role_name} role does not exist, redeploy the stack to create it"]
+
+    reasons = []
+    if not trusts_vmie(policy_document(role['AssumeRolePolicyDocument'])):
+        reasons.append(
+            f"The {role_name} role does not trust {VMIE_SERVICE} with the external id {VMIE_EXTERNAL_ID}, "
+            f"restore its trust policy"
+        )
+
+    bucket_policy = {}
+    try:
+        bucket_policy = {'ResourcePolicy': s3_client.get_bucket_policy(Bucket=bucket)['Policy']}
+    except ClientError as err:
+        if err.response['Error']['Code'] != 'NoSuchBucketPolicy':
+            raise err
+
+    denied = []
+    for actions, resource in [
+        (BUCKET_ACTIONS, f"arn:aws:s3:::{bucket}"),
+        (OBJECT_ACTIONS, f"arn:aws:s3:::{bucket}/{EXPORT_PREFIX}*")
+    ]:
+        response = iam_client.simulate_principal_policy(
+            PolicySourceArn=role['Arn'],
+            ActionNames=list(actions),
+            ResourceArns=[resource],
+            **bucket_policy
+        )
+        denied.extend(
+            result['EvalActionName']
+            for result in response['EvaluationResults']
+            if result['EvalDecision'] != "allowed"
+        )
+    if denied:
+        reasons.append(f"The {role_name} role is not allowed {', '.join(denied)} on the bucket {bucket}, grant them to the role")
+    return reasons
+
+
+def checked_role_reasons(role_name: str, bucket: str, now: float) -> list:
+    key = (role_name, bucket)
+    if now - _role_checked_at.get(key, float("-inf")) < ROLE_CHECK_TTL_SECONDS:
+        return []
+    reasons = role_reasons(boto3.client('iam'), boto3.client('s3'), role_name, bucket)
+    if not reasons:
+        _role_checked_at[key] = now
+    return reasons
+
+
+@resilient_handler
+@state_handler
+def lambda_handler(event, context):
+    # print the event details
+    logger.debug(json.dumps(event.to_dict(), indent=2))
+
+    # get env vars
+    export_bucket = os.environ['EXPORT_BUCKET']
+    export_role = os.environ['EXPORT_ROLE']
+    boot_modes = split_setting(os.environ.get('PREFLIGHT_BOOT_MODES'), DEFAULT_BOOT_MODES)
+    volume_types = split_setting(os.environ.get('PREFLIGHT_VOLUME_TYPES'), DEFAULT_VOLUME_TYPES)
+    kms_key_arns = split_setting(os.environ.get('EXPORT_KMS_KEY_ARNS'), ())
+
+    ami_id = event["ami_id"]
+    ec2_client = boto3.client('ec2')
+    images = ec2_client.describe_images(ImageIds=[ami_id])['Images']
+    if images:
+        kms_key_ids = snapshot_kms_key_ids(ec2_client, images[0])
+        reasons = image_reasons(images[0], boot_modes, volume_types, kms_key_arns, kms_key_ids)
+    else:
+        reasons = [f"AMI {ami_id} was not found"]
+    reasons.extend(checked_role_reasons(export_role, export_bucket, time.time()))
+
+    event["export_eligible"] = not reasons
+    if reasons:
+        logger.warning(f"AMI {ami_id} cannot be exported: {reasons}")
+        event["failure"] = {
+            "stage": "preflight",
+            "status": "INELIGIBLE",
+            "reason": "; ".join(reasons)[:1024]
+        }
+    else:
+        logger.info(f"AMI {ami_id} passed the export preflight checks")
+
+    return event
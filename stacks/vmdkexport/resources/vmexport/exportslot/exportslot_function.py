@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""
+    exportslot_function.py:
+    AWS Step Functions State Machine Lambda Handler which
+    acquires an export image task slot for the region before the
+    VMExport process is started. Exports without a free slot are
+    queued by priority and the state machine retries until a slot
+    is acquired. While the circuit breaker of an upstream API is
+    open no new export is started.
+"""
+
+import json
+import logging
+import os
+
+from vmexportcommon.export_scheduler import ExportScheduler, priority_for
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.resilience import CircuitBreaker, resilient_handler
+
+
+@resilient_handler
+@state_handler
+def lambda_handler(event, context):
+    # set logging
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    # print the event details
+    logger.debug(json.dumps(event.to_dict(), indent=2))
+
+    # get env vars
+    scheduler = ExportScheduler(
+        table_name=os.environ['EXPORT_CONTROL_TABLE'],
+        region=os.environ['AWS_REGION'],
+        slot_limit=int(os.environ['EXPORT_SLOT_LIMIT'])
+    )
+
+    holder = event["image_build_version_arn"]
+
+    # join the priority queue on the first attempt, keep the entry alive on the next ones
+    if "export_queue_key" not in event:
+        event["export_queue_key"] = scheduler.enqueue(holder, priority_for(event))
+    else:
+        scheduler.refresh(holder, event["export_queue_key"])
+
+    # pause new exports while an upstream API keeps throttling
+    open_operations = CircuitBreaker.from_environment().open_operations()
+    if open_operations:
+        logger.warning(f"Circuit breaker open for {open_operations}, not starting new exports")
+        event["export_slot_status"] = "WAITING"
+    elif scheduler.try_acquire(holder, event["export_queue_key"]):
+        event["export_slot_status"] = "ACQUIRED"
+    else:
+        event["export_slot_status"] = "WAITING"
+
+    logger.info(f"Export slot status for {holder}: {event['export_slot_status']}")
+
+    return event
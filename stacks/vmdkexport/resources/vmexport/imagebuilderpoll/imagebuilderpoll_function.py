@@ -3,7 +3,10 @@
 """
     imagebuilderpoll_function.py:
     AWS Step Functions State Machine Lambda Handler which 
-    polls EC2 Image Builder to determine the availability of an AMI.
+    polls EC2 Image Builder to determine the availability of an AMI
+    and resolves the AMI id and name once it is available.
+    Builds in a terminal failure state are reported with a failure
+    payload so that the State Machine stops polling them.
 """
 
 import json
@@ -11,29 +14,57 @@ import logging
 import os
 
 import boto3
+from vmexportcommon.checkpoint import save_checkpoint
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.image_descriptor import ImageDescriptorCache
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.stage_history import AMI_AVAILABLE, record_stage
 
+AMI_FAILED_STATES = ("FAILED", "CANCELLED", "DELETED")
 
+
+@resilient_handler
+@state_handler
 def lambda_handler(event, context):
     # set logging
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
 
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
+    logger.debug(json.dumps(event.to_dict(), indent=2))
 
     image_build_version_arn = event["image_build_version_arn"]
 
+    # available images are described once and then read from the cache
     imagebuilder_client = boto3.client('imagebuilder')
-    response = imagebuilder_client.get_image(
-        imageBuildVersionArn=image_build_version_arn
-    )
+    image = ImageDescriptorCache.from_environment(imagebuilder_client).describe(image_build_version_arn)
 
-    ami_state = response['image']['state']['status']
+    ami_state = image['state']['status']
     event["ami_state"] = str(ami_state).upper()
     event["image_build_version_arn"] = image_build_version_arn
 
-    return {
-        'statusCode': 200,
-        'body': event,
-        'headers': {'Content-Type': 'application/json'}
-    }
+    if event["ami_state"] in AMI_FAILED_STATES:
+        event["failure"] = {
+            "stage": "ami_build",
+            "status": event["ami_state"],
+            "reason": image['state'].get('reason', f"Image build {event['ami_state'].lower()}")
+        }
+
+    if event["ami_state"] == "AVAILABLE":
+        # resolve the AMI here, the export and the AMI metadata
+        # publishing both start from it without another lookup
+        ami = image['outputResources']['amis'][0]
+        event["ami_id"] = ami['image']
+        event["ami_name"] = ami['name']
+        logger.info(f"AMI {event['ami_id']} is available")
+
+        source_pipeline_arn = image.get('sourcePipelineArn', "")
+        record_stage(
+            event,
+            AMI_AVAILABLE,
+            pipeline=source_pipeline_arn.split("/")[-1],
+            region=os.environ['AWS_REGION']
+        )
+        save_checkpoint(event, AMI_AVAILABLE, ami_id=event["ami_id"], ami_name=event["ami_name"])
+
+    return event
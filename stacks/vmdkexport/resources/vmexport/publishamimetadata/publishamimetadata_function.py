@@ -3,58 +3,47 @@
 """
     publishamimetadata_function.py:
     AWS Step Functions State Machine Lambda Handler which 
-    publishes AMI creation metadata to SSM parameter store.
+    publishes AMI creation metadata to SSM parameter store,
+    in the namespace of the image build.
 """
 
 import json
 import logging
-import os
 from datetime import datetime
 
-import boto3
+from vmexportcommon.checkpoint import AMI_METADATA_PUBLISHED, save_checkpoint
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.image_descriptor import ImageDescriptorCache
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.ssm_metadata import MetadataWriter
 
 # set logging
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-imagebuilder_client = boto3.client('imagebuilder')
-
-def put_ssm_parameter(ssm_param_name: str, ssm_param_val: str):
-    logger.debug(f"Writing {ssm_param_name} with the value: {ssm_param_val} to ssm")
-    ssm_client = boto3.client('ssm')
-    parameter = ssm_client.put_parameter(Name=ssm_param_name, Value=ssm_param_val, Type='String', Overwrite=True)
-    return parameter['Version']
-
+@resilient_handler
+@state_handler
 def lambda_handler(event, context):
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
-
-    # get env vars
-    pipeline_name = os.environ['PIPELINE_NAME']
-    recipie_version = os.environ['RECIPIE_VERSION']
-
-    # grab the ami id
-    image_build_version_arn = event["image_build_version_arn"]
-    imagebuilder_client = boto3.client('imagebuilder')
-    response = imagebuilder_client.get_image(
-        imageBuildVersionArn=image_build_version_arn
-    )
-    ami_id = response['image']['outputResources']['amis'][0]['image']
-    ami_name = response['image']['outputResources']['amis'][0]['name']
+    logger.debug(json.dumps(event.to_dict(), indent=2))
+
+    # grab the ami id resolved by the AMI poll, or read it through the
+    # descriptor cache for states which do not carry it
+    if "ami_id" not in event:
+        image = ImageDescriptorCache.from_environment().describe(event["image_build_version_arn"])
+        event["ami_id"] = image['outputResources']['amis'][0]['image']
+        event["ami_name"] = image['outputResources']['amis'][0]['name']
+    ami_id = event["ami_id"]
+    ami_name = event["ami_name"]
     logger.info(f"ami_id = {ami_id}")
     logger.info(f"ami_name = {ami_name}")
 
-    ssm_path=f"/{pipeline_name}/{recipie_version}"
-    put_ssm_parameter(f"{ssm_path}/Build", "Success")
-    put_ssm_parameter(f"{ssm_path}/BuildTimeStamp", f"{datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
-    put_ssm_parameter(f"{ssm_path}/AMI_ID", f"{ami_id}")
-    put_ssm_parameter(f"{ssm_path}/AMI_NAME", f"{ami_name}")
-
-    event["ami_id"] = ami_id
-    event["ami_name"] = ami_name
-    
-    return {
-        'statusCode': 200,
-        'body': event,
-        'headers': {'Content-Type': 'application/json'}
-    }
+    metadata = MetadataWriter.from_environment(event)
+    metadata.put("Build", "Success")
+    metadata.put("BuildTimeStamp", f"{datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    metadata.put("AMI_ID", f"{ami_id}")
+    metadata.put("AMI_NAME", f"{ami_name}")
+
+    save_checkpoint(event, AMI_METADATA_PUBLISHED, ami_id=ami_id)
+
+    return event
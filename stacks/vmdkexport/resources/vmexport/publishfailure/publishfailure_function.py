@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+    publishfailure_function.py:
+    AWS Step Functions State Machine Lambda Handler which
+    publishes the failure metadata of a failed, cancelled or
+    deleted AMI build or export, or of a task that failed after
+    its retries, to SSM parameter store and the export event bus,
+    and sends a failure notification to a SNS topic.
+
+    An export image task still running when the execution failed, i.e.
+    when the export poll or the export start failed after the task was
+    started, is cancelled before its export slot is released. If it
+    cannot be cancelled the slot is kept, and reclaimed by its lease.
+"""
+
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import boto3
+from botocore.exceptions import ClientError
+from jinja2 import BaseLoader, Environment, select_autoescape
+from vmexportcommon.export_events import failure_detail, publish_failure_event
+from vmexportcommon.export_scheduler import ExportScheduler
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.ssm_metadata import MetadataWriter
+from vmexportcommon.stage_history import FAILED, record_stage
+
+# set logging
+logger = logging.getLogger()
+logger.setLevel(logging.DEBUG)
+
+# export image tasks that still use the export quota
+ACTIVE_TASK_STATES = ("active",)
+
+# inline email template
+email_template="""
+Hi there!
+
+Unfortunately the export of your AMI to VMDK format has failed.
+
+Below are some key details of the failure:
+
+    * Image build: {{ params['image_build_version_arn'] }}
+    * AMI Id: {{ params['ami_id'] }}
+    * Export task id: {{ params['export_image_task_id'] }}
+    * Failed stage: {{ params['stage'] }}
+    * Status: {{ params['status'] }}
+    * Reason: {{ params['reason'] }}
+    * Failed on: {{ params['failure_date'] }}
+
+That's all folks!
+"""
+
+def active_export_task_ids(ec2_client, event) -> list:
+    """
+        The export image tasks of the image build that are still running,
+        found by their id, or by the AMI when the export start failed
+        before the id was recorded.
+    """
+    if event.get("export_image_task_id"):
+        try:
+            tasks = ec2_client.describe_export_image_tasks(
+                ExportImageTaskIds=[event["export_image_task_id"]]
+            )['ExportImageTasks']
+        except ClientError as err:
+            logger.warning(f"Unable to describe the export image task {event['export_image_task_id']}: {err}")
+            return []
+    elif event.get("ami_id"):
+        tasks = []
+        paginator = ec2_client.get_paginator('describe_export_image_tasks')
+        for page in paginator.paginate():
+            tasks.extend(task for task in page['ExportImageTasks'] if task.get('ImageId') == event["ami_id"])
+    else:
+        return []
+    return [task['ExportImageTaskId'] for task in tasks if str(task.get('Status', "")).lower() in ACTIVE_TASK_STATES]
+
+
+def cancel_running_exports(ec2_client, event) -> bool:
+    """
+        Cancels the running export image tasks of the image build. Returns
+        False when one of them could not be cancelled.
+    """
+    cancelled = True
+    for task_id in active_export_task_ids(ec2_client, event):
+        try:
+            ec2_client.cancel_export_task(ExportTaskId=task_id)
+            logger.info(f"Cancelled the running export image task {task_id}")
+        except ClientError as err:
+            logger.warning(f"Unable to cancel the export image task {task_id}: {err}")
+            cancelled = False
+    return cancelled
+
+
+def sns_publish_message(sns_topic, params):
+    template = Environment(
+        loader=BaseLoader(),
+        autoescape=select_autoescape(['html', 'xml'])
+    ).from_string(email_template)
+    message = template.render(params=params)
+
+    sns_client = boto3.client('sns')
+    response = sns_client.publish(
+        TopicArn=sns_topic,
+        Message=message,
+        Subject="VMDK Export has failed"
+    )
+    return response
+
+@resilient_handler
+@state_handler
+def lambda_handler(event, context):
+    # print the event details
+    logger.debug(json.dumps(event.to_dict(), indent=2))
+
+    # get env vars
+    sns_topic = os.environ['SNS_TOPIC']
+
+    # tasks that failed after their retries are caught with the error
+    if "failure" not in event and "task_error" in event:
+        event["failure"] = {
+            "stage": "task",
+            "status": event["task_error"].get("Error", "States.TaskFailed"),
+            "reason": str(event["task_error"].get("Cause", ""))[:1024]
+        }
+    failure = event.get("failure", {})
+    failed_at = time.time()
+    failure_date = datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+    logger.info(f"Export of {event.get('image_build_version_arn')} failed: {failure}")
+
+    # failure metadata, next to the success metadata of each stage, the
+    # latest pointer keeps pointing to the last successful export
+    metadata = MetadataWriter.from_environment(event)
+    if failure.get("stage") == "ami_build":
+        metadata.put("Build", "Failed")
+        metadata.put("BuildTimeStamp", failure_date)
+        metadata.put("BuildFailureReason", failure.get("reason") or "unknown")
+    metadata.put("export/status", "Failed")
+    metadata.put("export/FailureReason", failure.get("reason") or "unknown")
+    metadata.put("export/Date", failure_date)
+
+    # give the export slot back if the execution failed while holding it,
+    # once its export is no longer running, or leave the queue if it
+    # failed while waiting for one
+    if event.get("export_slot_status") == "ACQUIRED":
+        if cancel_running_exports(boto3.client('ec2'), event):
+            scheduler = ExportScheduler(
+                table_name=os.environ['EXPORT_CONTROL_TABLE'],
+                region=os.environ['AWS_REGION']
+            )
+            scheduler.release(event["image_build_version_arn"])
+        else:
+            logger.warning(f"Keeping the export slot of {event['image_build_version_arn']} until its lease expires")
+    elif "export_queue_key" in event:
+        scheduler = ExportScheduler(
+            table_name=os.environ['EXPORT_CONTROL_TABLE'],
+            region=os.environ['AWS_REGION']
+        )
+        scheduler.withdraw(event["image_build_version_arn"])
+
+    publish_failure_event(os.environ['EXPORT_EVENT_BUS'], failure_detail(event, failed_at))
+
+    params = {}
+    params['image_build_version_arn'] = event.get("image_build_version_arn")
+    params['ami_id'] = event.get("ami_id", "n/a")
+    params['export_image_task_id'] = event.get("export_image_task_id", "n/a")
+    params['stage'] = failure.get("stage", "unknown")
+    params['status'] = failure.get("status", "UNKNOWN")
+    params['reason'] = failure.get("reason", "")
+    params['failure_date'] = failure_date
+
+    # failures are always notified right away, also in digest mode,
+    # the exports of a batch are notified in the summary of the batch
+    if not event.get("batch"):
+        sns_publish_message(sns_topic, params)
+
+    record_stage(event, FAILED, at=failed_at, failure_stage=params['stage'])
+
+    return event
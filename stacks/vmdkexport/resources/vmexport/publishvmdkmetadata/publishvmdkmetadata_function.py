@@ -6,16 +6,28 @@
     creates and publishes notifications to a SNS topic.
     The notification contains details about the generated
     AMI and a S3 bucket location where the exported VMDK file
-    can be downloaded.
+    can be downloaded. In digest mode the notifications
+    of non urgent exports are buffered and sent by the
+    vmdkdigest function once per window, the exports of
+    a batch are notified by the vmdkbatchsummary function.
 """
 
 import json
 import logging
 import os
+import time
 from datetime import datetime
 
 import boto3
 from jinja2 import BaseLoader, Environment, select_autoescape
+from vmexportcommon.checkpoint import save_checkpoint
+from vmexportcommon.export_events import (completion_detail,
+                                          publish_completion_event)
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.notification_digest import NotificationDigest, is_urgent
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.ssm_metadata import MetadataWriter
+from vmexportcommon.stage_history import METADATA_PUBLISHED, record_stage
 
 # set logging
 logger = logging.getLogger()
@@ -42,12 +54,6 @@ The VMDK file can be downloaded from the AWS console at the following S3 Bucket
 That's all folks!
 """
 
-def put_ssm_parameter(ssm_param_name: str, ssm_param_val: str):
-    logger.debug(f"Writing {ssm_param_name} with the value: {ssm_param_val} to ssm")
-    ssm_client = boto3.client('ssm')
-    parameter = ssm_client.put_parameter(Name=ssm_param_name, Value=ssm_param_val, Type='String', Overwrite=True)
-    return parameter['Version']
-
 def sns_publish_message(sns_topic, params):
     template = Environment(
         loader=BaseLoader(),
@@ -63,14 +69,15 @@ def sns_publish_message(sns_topic, params):
     )
     return response
 
+@resilient_handler
+@state_handler
 def lambda_handler(event, context):
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
+    logger.debug(json.dumps(event.to_dict(), indent=2))
 
     # get env vars
-    pipeline_name = os.environ['PIPELINE_NAME']
-    recipie_version = os.environ['RECIPIE_VERSION']
     sns_topic = os.environ['SNS_TOPIC']
+    notification_mode = os.environ.get('NOTIFICATION_MODE', 'immediate')
 
     # grab the event parameters
     ami_id = event["ami_id"]
@@ -107,12 +114,29 @@ def lambda_handler(event, context):
     logger.debug(f"export_bucket_prefix = {export_bucket_prefix}")
     logger.debug(f"image_path = {image_path}")
 
-    ssm_path=f"/{pipeline_name}/{recipie_version}"
-    put_ssm_parameter(f"{ssm_path}/export/status", "Success")
-    put_ssm_parameter(f"{ssm_path}/export/ExportAMI", f"{image_id}")
-    put_ssm_parameter(f"{ssm_path}/export/Bucket", f"{export_bucket}")
-    put_ssm_parameter(f"{ssm_path}/export/ImagePath", f"{image_path}")
-    put_ssm_parameter(f"{ssm_path}/export/Date", f"{datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+    # the metadata of the image build, the latest pointer to it is
+    # moved once every other step of the stage has succeeded
+    metadata = MetadataWriter.from_environment(event)
+    metadata.put("export/status", "Success")
+    metadata.put("export/ExportAMI", f"{image_id}")
+    metadata.put("export/Bucket", f"{export_bucket}")
+    metadata.put("export/ImagePath", f"{image_path}")
+    metadata.put("export/Date", f"{datetime.now().strftime('%d/%m/%Y %H:%M:%S')}")
+
+    # publish the structured completion event for automation, the export
+    # has succeeded, so the event is published best effort and an error
+    # is recorded instead of failing the export
+    published_at = time.time()
+    image_key = f"{export_bucket_prefix}{image_id}"
+    try:
+        s3_client = boto3.client('s3')
+        head = s3_client.head_object(Bucket=export_bucket, Key=image_key, ChecksumMode='ENABLED')
+        detail = completion_detail(event, ami_export_task, image_key, head, published_at)
+        publish_completion_event(os.environ['EXPORT_EVENT_BUS'], detail)
+        logger.info(f"Published completion event for {image_path}")
+    except Exception as e:
+        logger.warning(f"Unable to publish the completion event for {image_path}: {e}")
+        event["completion_event_error"] = str(e)[:1024]
 
     params = {}
     params['ami_id'] = ami_id
@@ -121,10 +145,17 @@ def lambda_handler(event, context):
     params['s3_image_path'] = image_path
     params['export_date'] = f"{datetime.now().strftime('%d/%m/%Y %H:%M:%S')}"
 
-    sns_publish_message(sns_topic, params)
+    if event.get("batch"):
+        logger.info(f"{image_id} is notified in the summary of the batch")
+    elif notification_mode == "digest" and not is_urgent(event):
+        logger.info(f"Buffering the notification of {image_id} for the next digest")
+        NotificationDigest(os.environ['EXPORT_CONTROL_TABLE']).add(export_image_task_id, params, published_at)
+    else:
+        sns_publish_message(sns_topic, params)
+
+    metadata.publish_latest()
+
+    record_stage(event, METADATA_PUBLISHED, at=published_at)
+    save_checkpoint(event, METADATA_PUBLISHED, s3_image_path=image_path)
     
-    return {
-        'statusCode': 200,
-        'body': event,
-        'headers': {'Content-Type': 'application/json'}
-    }
+    return event
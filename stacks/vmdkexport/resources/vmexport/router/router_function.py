@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+    router_function.py:
+    AWS Step Functions State Machine Lambda Handler which
+    serves every stage of the AMI -> VMDK export process from a
+    single function, deployed when the lambdaLayout is "router".
+    The task input holds the stage to run in "action" and the
+    export state in "state", which is passed to the handler of
+    the stage unchanged.
+"""
+
+import importlib.util
+import logging
+import os
+
+# action -> asset directory of the stage handler
+ROUTES = {
+    "entry_point": "vmdkexportentrypoint",
+    "ami_poll": "imagebuilderpoll",
+    "ami_metadata": "publishamimetadata",
+    "export_preflight": "exportpreflight",
+    "export_slot": "exportslot",
+    "export": "vmdkexport",
+    "export_poll": "vmdkexportcompleted",
+    "export_metadata": "publishvmdkmetadata",
+    "failure": "publishfailure",
+    "batch_summary": "vmdkbatchsummary"
+}
+
+handlers_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# stage handlers loaded by the container, a stage is loaded on its first call
+handlers = {}
+
+
+def handler_for(action: str):
+    if action not in ROUTES:
+        raise ValueError(f"Unknown action: {action}")
+    if action not in handlers:
+        name = f"{ROUTES[action]}_function"
+        spec = importlib.util.spec_from_file_location(name, os.path.join(handlers_dir, ROUTES[action], f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        handlers[action] = module.lambda_handler
+    return handlers[action]
+
+
+def lambda_handler(event, context):
+    logger = logging.getLogger()
+    logger.setLevel(logging.DEBUG)
+
+    action = event.get("action")
+    logger.info(f"Routing action {action}")
+
+    return handler_for(action)(event["state"], context)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""
+    vmdkbatchsummary_function.py:
+    AWS Step Functions State Machine Lambda Handler which
+    summarizes the results of the exports of an execution once
+    the Map state has exported every image build, and sends a
+    single summary notification for batch executions to a SNS
+    topic instead of one notification per export.
+"""
+
+import logging
+import os
+
+import boto3
+from jinja2 import BaseLoader, Environment, select_autoescape
+from vmexportcommon.export_state import ExportState
+from vmexportcommon.resilience import resilient_handler
+
+# set logging
+logger = logging.getLogger()
+logger.setLevel(logging.DEBUG)
+
+# inline email template
+email_template="""
+Hi there!
+
+{{ summary['succeeded'] }} of {{ summary['total'] }} AMI exports to VMDK format have completed successfully.
+{% for export in exports %}
+    * Image build: {{ export['image_build_version_arn'] }}
+      Status: {{ export['status'] }}
+      AMI Id: {{ export['ami_id'] }}
+      Export task id: {{ export['export_image_task_id'] }}{% if export['reason'] %}
+      Reason: {{ export['reason'] }}{% endif %}
+{% endfor %}
+The export details of each image build are published to SSM parameter store.
+
+That's all folks!
+"""
+
+def export_result(state: ExportState) -> dict:
+    failure = state.get("failure")
+    return {
+        "image_build_version_arn": state.image_build_version_arn,
+        "status": "FAILED" if failure or state.vdmk_export_status != "COMPLETED" else "COMPLETED",
+        "ami_id": state.get("ami_id", "n/a"),
+        "export_image_task_id": state.get("export_image_task_id", "n/a"),
+        "reason": (failure or {}).get("reason", "")
+    }
+
+def summarize(exports: list) -> dict:
+    failed = [export["image_build_version_arn"] for export in exports if export["status"] != "COMPLETED"]
+    return {
+        "total": len(exports),
+        "succeeded": len(exports) - len(failed),
+        "failed": len(failed),
+        "failed_image_build_version_arns": failed
+    }
+
+def sns_publish_summary(sns_topic, summary, exports):
+    template = Environment(
+        loader=BaseLoader(),
+        autoescape=select_autoescape(['html', 'xml'])
+    ).from_string(email_template)
+    message = template.render(summary=summary, exports=exports)
+
+    sns_client = boto3.client('sns')
+    response = sns_client.publish(
+        TopicArn=sns_topic,
+        Message=message,
+        Subject=f"VMDK Export batch: {summary['succeeded']} of {summary['total']} exports are ready"
+    )
+    return response
+
+@resilient_handler
+def lambda_handler(event, context):
+    exports = [export_result(ExportState.from_event(result)) for result in event.get("results", [])]
+    summary = summarize(exports)
+    logger.info(f"Export summary: {summary}")
+
+    # single exports are notified by the export or the failure stage
+    if event.get("batch"):
+        sns_publish_summary(os.environ['SNS_TOPIC'], summary, exports)
+
+    return summary
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+
+"""
+    vmdkdigest_function.py:
+    Scheduled Lambda Handler which sends the notifications of the
+    exports buffered in digest mode as a single message per window
+    to a SNS topic.
+"""
+
+import json
+import logging
+import os
+
+import boto3
+from jinja2 import BaseLoader, Environment, select_autoescape
+from vmexportcommon.notification_digest import NotificationDigest, chunk
+
+# set logging
+logger = logging.getLogger()
+logger.setLevel(logging.DEBUG)
+
+# inline email template
+email_template="""
+Hi there!
+
+{{ exports|length }} AMIs have been exported to VMDK format since the last digest.
+{% for params in exports %}
+    * AMI Id: {{ params['ami_id'] }}
+      AMI Name: {{ params['ami_name'] }}
+      VMDK id: {{ params['vmdk_id'] }}
+      Exported on: {{ params['export_date'] }}
+      S3 Bucket path: {{ params['s3_image_path'] }}
+{% endfor %}
+The VMDK files can be downloaded from the AWS console at the S3 Bucket paths above.
+
+That's all folks!
+"""
+
+def sns_publish_digest(sns_topic, exports):
+    template = Environment(
+        loader=BaseLoader(),
+        autoescape=select_autoescape(['html', 'xml'])
+    ).from_string(email_template)
+    message = template.render(exports=exports)
+
+    sns_client = boto3.client('sns')
+    response = sns_client.publish(
+        TopicArn=sns_topic,
+        Message=message,
+        Subject=f"VMDK Export digest: {len(exports)} exports are ready"
+    )
+    return response
+
+def lambda_handler(event, context):
+    # print the event details
+    logger.debug(json.dumps(event, indent=2))
+
+    # get env vars
+    sns_topic = os.environ['SNS_TOPIC']
+
+    digest = NotificationDigest(os.environ['EXPORT_CONTROL_TABLE'])
+    items = digest.pending()
+    logger.info(f"{len(items)} buffered export notifications")
+
+    # the buffered notifications are only removed once they have been sent
+    for items_chunk in chunk(items):
+        sns_publish_digest(sns_topic, [item['params'] for item in items_chunk])
+        digest.remove(items_chunk)
+
+    return {
+        'statusCode': 200,
+        'body': {"exports": len(items)},
+        'headers': {'Content-Type': 'application/json'}
+    }
@@ -5,26 +5,73 @@
     AWS Step Functions State Machine Lambda Handler which 
     executes the VMExport process in order to export an
     AMI to VMDK format.
+
+    The export is idempotent: an active or completed export image task
+    of the AMI to the export location is reused, and the export is
+    started with a client token derived from the execution and the AMI,
+    so a retried invocation never starts a second export.
 """
 
+import hashlib
 import json
 import logging
 import os
 
 import boto3
+from vmexportcommon.checkpoint import save_checkpoint
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.stage_history import (EXPORT_STARTED,
+                                          execution_sort_key, record_stage)
+
+EXPORT_PREFIX = "exports/"
+
+# export image tasks which hold or will hold the exported image
+REUSABLE_TASK_STATES = ("active", "completed")
+
+
+def client_token(event, ami_id: str) -> str:
+    """
+        Deterministic export_image client token of the export of the AMI by
+        the execution (and Map item), at most 64 characters.
+    """
+    execution = event.get("execution") or {}
+    owner = execution_sort_key(execution) if execution.get("id") else event["image_build_version_arn"]
+    return hashlib.sha256(f"{owner}#{ami_id}".encode("utf-8")).hexdigest()
+
 
+def find_export_task(ec2_client, ami_id: str, bucket: str, prefix: str) -> dict:
+    """
+        An active or completed export image task of the AMI to the bucket
+        and prefix, if any.
+    """
+    paginator = ec2_client.get_paginator('describe_export_image_tasks')
+    for page in paginator.paginate():
+        for task in page['ExportImageTasks']:
+            location = task.get('S3ExportLocation', {})
+            if (task.get('ImageId') == ami_id
+                    and str(task.get('Status', "")).lower() in REUSABLE_TASK_STATES
+                    and location.get('S3Bucket') == bucket
+                    and location.get('S3Prefix', "") == prefix):
+                return task
+    return None
 
+
+
+@resilient_handler
+@state_handler
 def lambda_handler(event, context):
     # set logging
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
     
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
+    logger.debug(json.dumps(event.to_dict(), indent=2))
 
     # get env vars
     export_bucket = os.environ['EXPORT_BUCKET']
     export_role = os.environ['EXPORT_ROLE']
+    export_format = 'VMDK'
 
     # grab the event parameters
     ami_id = event["ami_id"]
@@ -32,25 +79,39 @@ def lambda_handler(event, context):
     logger.debug(f"ami_id = {ami_id}")
     logger.debug(f"ami_name = {ami_name}")
 
-    # export the ami image to vmdk
+    # reuse the export of a retried or re-driven execution
     ec2_client = boto3.client('ec2')
-    response = ec2_client.export_image(
-        DiskImageFormat='VMDK',
-        ImageId=ami_id,
-        S3ExportLocation={
-            'S3Bucket': export_bucket,
-            'S3Prefix': 'exports/'
-        },
-        RoleName=export_role
-    )
+    export_task = find_export_task(ec2_client, ami_id, export_bucket, EXPORT_PREFIX)
+    if export_task is not None:
+        export_image_task_id = export_task['ExportImageTaskId']
+        logger.info(f"Reusing the {export_task['Status']} export image task {export_image_task_id} of {ami_id}")
+    else:
+        # export the ami image to vmdk
+        response = ec2_client.export_image(
+            ClientToken=client_token(event, ami_id),
+            DiskImageFormat=export_format,
+            ImageId=ami_id,
+            S3ExportLocation={
+                'S3Bucket': export_bucket,
+                'S3Prefix': EXPORT_PREFIX
+            },
+            RoleName=export_role
+        )
+        export_image_task_id = response['ExportImageTaskId']
+        logger.info(f"Image {ami_id} is being exported to s3 bucket {export_bucket}/{EXPORT_PREFIX}")
 
-    logger.info(f"Image {ami_id} is being exported to s3 bucket {export_bucket}/exports")
-    logger.info(f"Export image task id: {response['ExportImageTaskId']}")
+    logger.info(f"Export image task id: {export_image_task_id}")
 
-    event["export_image_task_id"] = response['ExportImageTaskId']
+    event["export_image_task_id"] = export_image_task_id
+    event["export_format"] = export_format
+
+    record_stage(event, EXPORT_STARTED, format=export_format)
+    save_checkpoint(
+        event,
+        EXPORT_STARTED,
+        export_image_task_id=event["export_image_task_id"],
+        export_format=export_format,
+        s3_export_location=f"s3://{export_bucket}/{EXPORT_PREFIX}"
+    )
     
-    return {
-        'statusCode': 200,
-        'body': event,
-        'headers': {'Content-Type': 'application/json'}
-    }
+    return event
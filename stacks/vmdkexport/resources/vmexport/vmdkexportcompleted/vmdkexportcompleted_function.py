@@ -4,22 +4,39 @@
     vmdkexportcompleted_function.py:
     AWS Step Functions State Machine Lambda Handler which 
     polls the VMImport/Export service in order to determine
-    when an export job has completed.
+    when an export job has completed and publishes the
+    progress of the export job as it changes. Exports that
+    were deleted or cancelled, or whose task no longer exists,
+    are reported as FAILED with a failure payload.
 """
 
 import json
 import logging
+import os
+import time
 
 import boto3
+from vmexportcommon.checkpoint import clear_checkpoints, save_checkpoint
+from vmexportcommon.export_progress import ProgressPublisher, observe
+from vmexportcommon.export_scheduler import ExportScheduler
+from vmexportcommon.export_state import state_handler
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.stage_history import (EXPORT_COMPLETED, EXPORT_STARTED,
+                                          record_stage)
 
+# export image task states in which the export will never complete
+EXPORT_FAILED_STATES = ("DELETING", "DELETED")
 
+
+@resilient_handler
+@state_handler
 def lambda_handler(event, context):
     # set logging
     logger = logging.getLogger()
     logger.setLevel(logging.DEBUG)
     
     # print the event details
-    logger.debug(json.dumps(event, indent=2))
+    logger.debug(json.dumps(event.to_dict(), indent=2))
 
     # grab the event details
     export_image_task_id = event["export_image_task_id"]
@@ -38,21 +55,69 @@ def lambda_handler(event, context):
     
     # return a NOT_COMPLETED state if the ami export is not completed
     vdmk_export_status = "NOT_COMPLETED"
+    progress = 0
+    status_message = ""
+    task_found = False
+    s3_export_location = {}
 
     if len(response['ExportImageTasks']) > 0:
         for export_task in response['ExportImageTasks']:
             if export_task['ExportImageTaskId'] == export_image_task_id:
                 logger.info(f"Got task id match: {export_task['ExportImageTaskId']}")
+                task_found = True
                 vdmk_export_status = str(export_task['Status']).upper()
-                logger.info(f"Current AMI export state: {vdmk_export_status}")
+                progress = int(export_task.get('Progress', 100 if vdmk_export_status == "COMPLETED" else 0))
+                status_message = export_task.get('StatusMessage', "")
+                s3_export_location = export_task.get('S3ExportLocation', {})
+                logger.info(f"Current AMI export state: {vdmk_export_status} {progress}% {status_message}")
                 break
 
+    if not task_found:
+        event["failure"] = {
+            "stage": "export",
+            "status": "NOT_FOUND",
+            "reason": f"Export image task {export_image_task_id} not found"
+        }
+        vdmk_export_status = "FAILED"
+    elif vdmk_export_status in EXPORT_FAILED_STATES:
+        event["failure"] = {
+            "stage": "export",
+            "status": vdmk_export_status,
+            "reason": status_message or f"Export image task {export_image_task_id} {vdmk_export_status.lower()}"
+        }
+        vdmk_export_status = "FAILED"
+
+    # publish the export progress when it changed since the previous poll
+    progress_state = observe(event.get("export_progress"), vdmk_export_status, progress, status_message, time.time())
+    try:
+        publisher = ProgressPublisher(os.environ['EXPORT_EVENT_BUS'])
+        progress_state = publisher.publish(event, progress_state)
+    except Exception as e:
+        # progress events are informational, never fail the export on them
+        logger.warning(f"Unable to publish export progress: {e}")
+    event["export_progress"] = progress_state
+
+    # give the export slot back to the scheduler once the export is done
+    if vdmk_export_status in ("COMPLETED", "FAILED"):
+        scheduler = ExportScheduler(
+            table_name=os.environ['EXPORT_CONTROL_TABLE'],
+            region=os.environ['AWS_REGION']
+        )
+        scheduler.release(event["image_build_version_arn"])
+
+    if vdmk_export_status == "COMPLETED":
+        record_stage(event, EXPORT_COMPLETED)
+        save_checkpoint(
+            event,
+            EXPORT_COMPLETED,
+            s3_image_path=f"s3://{s3_export_location.get('S3Bucket')}/{s3_export_location.get('S3Prefix', '')}{export_image_task_id}.vmdk"
+        )
+    elif vdmk_export_status == "FAILED":
+        # a resumed execution starts a new export instead of polling this one
+        clear_checkpoints(event, EXPORT_STARTED)
+
     logger.info(f"Returning vdmk_export_status: {vdmk_export_status}")
 
     event["vdmk_export_status"] = vdmk_export_status
     
-    return {
-        'statusCode': 200,
-        'body': event,
-        'headers': {'Content-Type': 'application/json'}
-    }
+    return event
@@ -2,14 +2,64 @@
 
 """
     vmdkexportentrypoint_function.py:
-    AWS Step Functions State Machine Lambda Handler which 
+    AWS Step Functions State Machine Lambda Handler which
     serves as the entry point to the AMI -> VMDK export process.
+    The request holds a single "image_build_version_arn" or, for
+    batch exports, a list of "image_build_version_arns". Each image
+    build becomes an item with its own export state, which the
+    State Machine exports in a Map state.
+
+    Resumed requests ("resume": true) restore the state of each image
+    build from its checkpoints, so the export continues from the last
+    completed stage.
 """
 
 import json
 import logging
+import os
+
+from vmexportcommon.checkpoint import (RESUME_AMI_POLL, CheckpointStore,
+                                      resume_state)
+from vmexportcommon.export_state import ExportState
+from vmexportcommon.resilience import resilient_handler
+from vmexportcommon.stage_history import (EXECUTION_STARTED,
+                                          execution_context, parse_timestamp,
+                                          record_stage)
+
+# the request fields every item of a batch inherits
+ITEM_FIELDS = ("export_priority", "export_urgent")
+
+# the largest batch the state machine timeout is sized for
+DEFAULT_MAX_BATCH_SIZE = 20
+
+
+def image_build_version_arns(event: dict) -> list:
+    """
+        The image builds of the request, in request order without duplicates.
+        Batches larger than MAX_BATCH_SIZE are rejected, as their exports
+        would not complete within the state machine timeout.
+    """
+    if "image_build_version_arns" in event:
+        arns = event["image_build_version_arns"]
+        if not isinstance(arns, list) or not arns:
+            raise ValueError("image_build_version_arns must be a non empty list")
+    elif event.get("image_build_version_arn") is not None:
+        arns = [event["image_build_version_arn"]]
+    else:
+        raise ValueError("image_build_version_arn is not present in request")
 
+    for arn in arns:
+        if not isinstance(arn, str) or not arn.startswith("arn:"):
+            raise ValueError(f"Invalid image build version arn: {arn}")
+    arns = list(dict.fromkeys(arns))
 
+    max_batch_size = int(os.environ.get('MAX_BATCH_SIZE', DEFAULT_MAX_BATCH_SIZE))
+    if len(arns) > max_batch_size:
+        raise ValueError(f"Batch of {len(arns)} image builds exceeds the maximum batch size of {max_batch_size}, split it into smaller batches")
+    return arns
+
+
+@resilient_handler
 def lambda_handler(event, context):
     # set logging
     logger = logging.getLogger()
@@ -18,13 +68,36 @@ def lambda_handler(event, context):
     # print the event details
     logger.debug(json.dumps(event, indent=2))
 
-    image_build_version_arn = event["image_build_version_arn"]
+    batch = "image_build_version_arns" in event
+    execution = execution_context(event)
+    started_at = execution.get("started_at")
 
-    if image_build_version_arn is not None:
-        return {
-            'statusCode': 200,
-            'body': event,
-            'headers': {'Content-Type': 'application/json'}
-        }
-    else:
-        raise ValueError("image_build_version_arn is not present in request")
+    checkpoints = CheckpointStore(os.environ['EXPORT_CONTROL_TABLE']) if event.get("resume") else None
+
+    items = []
+    for index, arn in enumerate(image_build_version_arns(event)):
+        state = ExportState(
+            image_build_version_arn=arn,
+            execution=dict(execution, item=index) if batch else execution or None,
+            batch=batch,
+            resume_from=RESUME_AMI_POLL,
+            **{name: event[name] for name in ITEM_FIELDS if name in event}
+        )
+        if checkpoints is not None:
+            resume_state(state, checkpoints.load(arn))
+            logger.info(f"Resuming the export of {arn} from {state.resume_from}")
+        record_stage(
+            state,
+            EXECUTION_STARTED,
+            at=parse_timestamp(started_at) if started_at else None,
+            region=os.environ['AWS_REGION']
+        )
+        items.append(state.to_dict())
+
+    logger.info(f"Exporting {len(items)} image build(s)")
+
+    return {
+        "execution": execution,
+        "batch": batch,
+        "items": items
+    }
@@ -1,9 +1,18 @@
 #!/usr/bin/env python
 
 """
-    vmdkexportcompleted_function.py:
+    vmdknotify_function.py:
     Lambda Handler which executes the AWS Step Functions State Machine
     which controls the AMI -> VMDK export process.
+
+    At most MAX_RUNNING_EXECUTIONS executions run at once (0 for no
+    limit), further export requests are queued and started in order
+    when an execution ends, which invokes the handler again through an
+    EventBridge rule.
+
+    With the supersede policy a newer build of a recipe cancels the
+    running export of an older build of the same recipe and pipeline,
+    and replaces the queued requests of the older builds.
 """
 
 ##################################################
@@ -15,6 +24,14 @@ import logging
 import os
 
 import boto3
+from vmexportcommon.execution_queue import ExecutionQueue, start_queued
+from vmexportcommon.export_cancellation import (ExportCanceller,
+                                                is_image_build_version_arn,
+                                                supersedes)
+from vmexportcommon.export_scheduler import ExportScheduler
+
+# the single running execution of earlier releases
+DEFAULT_MAX_RUNNING_EXECUTIONS = 1
 
 
 def lambda_handler(event, context):
@@ -27,22 +44,50 @@ def lambda_handler(event, context):
 
     # get state machine arn from env vars
     state_machine_arn = os.environ['STATE_MACHINE_ARN']
+    max_running = int(os.environ.get('MAX_RUNNING_EXECUTIONS', DEFAULT_MAX_RUNNING_EXECUTIONS))
+
+    stepfunctions_client = boto3.client('stepfunctions')
+    queue = ExecutionQueue(os.environ['EXPORT_CONTROL_TABLE'])
+
+    # an execution ended, only the queued requests are started
+    if "Records" not in event:
+        logger.info(f"Execution {event.get('detail', {}).get('executionArn')} ended")
+        return start_queued(stepfunctions_client, state_machine_arn, queue, max_running)
 
     image_build_version_arn = event["Records"][0]["Sns"]["Message"]
+    message_attributes = event["Records"][0]["Sns"].get("MessageAttributes", {})
 
-    stepfunctions_client = boto3.client('stepfunctions')
+    execution_input = {"image_build_version_arn": image_build_version_arn}
+
+    # optional export priority, i.e. release builds ahead of nightly builds
+    if "export_priority" in message_attributes:
+        execution_input["export_priority"] = message_attributes["export_priority"]["Value"]
 
-    response = stepfunctions_client.list_executions(
-        stateMachineArn=state_machine_arn,
-        statusFilter='RUNNING',
-        maxResults=1000
-    )
+    # optional urgent flag, urgent exports are notified right away in digest mode
+    if "export_urgent" in message_attributes:
+        execution_input["export_urgent"] = message_attributes["export_urgent"]["Value"]
 
-    if len(response['executions']) > 0:
-        return image_build_version_arn
+    if os.environ.get('SUPERSEDE_RUNNING_EXPORTS', "false").lower() == "true":
+        canceller = ExportCanceller(
+            state_machine_arn,
+            scheduler=ExportScheduler(table_name=os.environ['EXPORT_CONTROL_TABLE'], region=os.environ['AWS_REGION']),
+            stepfunctions_client=stepfunctions_client
+        )
+        start, superseded = canceller.supersede(image_build_version_arn)
+        if superseded:
+            logger.info(f"{image_build_version_arn} superseded {superseded}")
+        if not start:
+            return image_build_version_arn
+        for item in queue.pending():
+            if not is_image_build_version_arn(item['sk']):
+                continue
+            if supersedes(item['sk'], image_build_version_arn, canceller.pipeline_arn):
+                logger.info(f"A newer build than {image_build_version_arn} is queued: {item['sk']}")
+                return image_build_version_arn
+            if supersedes(image_build_version_arn, item['sk'], canceller.pipeline_arn):
+                logger.info(f"{image_build_version_arn} superseded the queued export of {item['sk']}")
+                queue.remove(item)
 
-    response = stepfunctions_client.start_execution(
-        stateMachineArn=state_machine_arn,
-        input="{\"image_build_version_arn\" : \"" + image_build_version_arn + "\"}"
-    )
+    queue.add(image_build_version_arn, execution_input)
+    start_queued(stepfunctions_client, state_machine_arn, queue, max_running)
     return image_build_version_arn
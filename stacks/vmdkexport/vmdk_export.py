@@ -6,7 +6,13 @@
     required for the ec2-imagebuilder-vmdk-export project.
 """
 
+import math
+
+from aws_cdk import aws_dynamodb as dynamodb
 from aws_cdk import aws_ec2 as ec2
+from aws_cdk import aws_events as events
+from aws_cdk import aws_events_targets as events_targets
+from aws_cdk import aws_eventschemas as eventschemas
 from aws_cdk import aws_iam as iam
 from aws_cdk import aws_imagebuilder as imagebuilder
 from aws_cdk import aws_kms as kms
@@ -29,6 +35,28 @@ class VmdkExportStack(core.Stack):
 
     LAMBDA_TIMEOUT_DEFAULT = core.Duration.seconds(20)
 
+    # maximum length of the value of a standard tier SSM parameter
+    SSM_PARAMETER_MAX_LENGTH = 4096
+
+    # time budget of the AMI build and the export of a single image build
+    EXPORT_TIMEOUT_MINUTES = 120
+
+    # errors of the lambda service and of the upstream AWS APIs (raised by
+    # vmexportcommon.resilience) which are retried by every lambda task
+    RETRYABLE_LAMBDA_TASK_ERRORS = [
+        "Lambda.ServiceException",
+        "Lambda.AWSLambdaException",
+        "Lambda.SdkClientException",
+        "Lambda.TooManyRequestsException",
+        "UpstreamThrottled",
+        "UpstreamUnavailable"
+    ]
+
+    RETRYABLE_START_EXECUTION_ERRORS = [
+        "StepFunctions.SdkClientException",
+        "StepFunctions.ExecutionLimitExceededException"
+    ]
+
     def __init__(self, scope: core.Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
@@ -68,6 +96,12 @@ class VmdkExportStack(core.Stack):
             ),
             encryption=s3.BucketEncryption.S3_MANAGED
         )
+        # large State Machine payloads stored in claim-check mode
+        s3_bucket.add_lifecycle_rule(
+            prefix="claim-checks/",
+            expiration=core.Duration.days(7),
+            noncurrent_version_expiration=core.Duration.days(1)
+        )
 
         # below role is assumed by the ImageBuilder ec2 instance
         ami_share_image_role = iam.Role(self, f"ami-share-image-role-{CdkUtils.stack_tag}", assumed_by=iam.ServicePrincipal("ec2.amazonaws.com"))
@@ -242,6 +276,16 @@ class VmdkExportStack(core.Stack):
                 ]
             )
         )
+        # read the live distribution settings, so that unchanged settings are not re-written
+        amidistribution_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[ami_share_distribution_config.attr_arn],
+                actions=[
+                    "imagebuilder:GetDistributionConfiguration"
+                ]
+            )
+        )
         amidistribution_lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
@@ -274,18 +318,84 @@ class VmdkExportStack(core.Stack):
         )
 
         # Create a SSM Parameters for AMI Publishing and Sharing Ids
-        # so as not to hardcode the account id values in the Lambda
-        ssm_ami_publishing_target_ids = ssm.StringListParameter(
-            self, f"AmiPublishingTargetIds-{CdkUtils.stack_tag}",
-            parameter_name=f'/{CdkUtils.stack_tag}-AmiSharing/AmiPublishingTargetIds',
-            string_list_value=config['imagebuilder']['amiPublishingTargetIds']
+        # so as not to hardcode the account id values in the Lambda.
+        # Large account lists can instead be read from a S3 object.
+        ami_publishing_target_ids_source = config['imagebuilder'].get('amiPublishingTargetIdsS3Uri') or self.account_list_source(
+            f"AmiPublishingTargetIds-{CdkUtils.stack_tag}",
+            f'/{CdkUtils.stack_tag}-AmiSharing/AmiPublishingTargetIds',
+            config['imagebuilder']['amiPublishingTargetIds']
+        )
+
+        ami_sharing_ids_source = config['imagebuilder'].get('amiSharingIdsS3Uri') or self.account_list_source(
+            f"AmiSharingAccountIds-{CdkUtils.stack_tag}",
+            f'/{CdkUtils.stack_tag}-AmiSharing/AmiSharingAccountIds',
+            config['imagebuilder']['amiSharingIds']
+        )
+
+        # Create a role for the ami sharing lambda function, which shares the
+        # AMIs with the accounts beyond the launch permission limit of a distribution
+        amisharing_lambda_role = iam.Role(
+            scope=self,
+            id=f"amisharingLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        amisharing_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "ec2:ModifyImageAttribute"
+                ]
+            )
+        )
+        amisharing_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{CdkUtils.stack_tag}-AmiSharing/*"],
+                actions=[
+                        "ssm:GetParameter",
+                        "ssm:GetParameters",
+                        "ssm:GetParametersByPath"
+                ]
+            )
         )
 
-        ssm_ami_sharing_ids = ssm.StringListParameter(
-            self, f"AmiSharingAccountIds-{CdkUtils.stack_tag}",
-            parameter_name=f'/{CdkUtils.stack_tag}-AmiSharing/AmiSharingAccountIds',
-            string_list_value=config['imagebuilder']['amiSharingIds']
+        for account_list_s3_uri, account_list_roles in [
+            (ami_publishing_target_ids_source, [amidistribution_lambda_role]),
+            (ami_sharing_ids_source, [amidistribution_lambda_role, amisharing_lambda_role])
+        ]:
+            if account_list_s3_uri.startswith("s3://"):
+                for account_list_role in account_list_roles:
+                    account_list_role.add_to_policy(
+                        iam.PolicyStatement(
+                            effect=iam.Effect.ALLOW,
+                            resources=[f"arn:aws:s3:::{account_list_s3_uri[len('s3://'):]}"],
+                            actions=[
+                                "s3:GetObject"
+                            ]
+                        )
+                    )
+
+        # shares each available image built by the pipeline, triggered by the
+        # EC2 Image Builder notification topic
+        ami_sharing_lambda = aws_lambda.Function(
+            scope=self,
+            id=f"amiSharingLambda-{CdkUtils.stack_tag}",
+            code=aws_lambda.Code.from_asset("stacks/vmdkexport/resources/amidistribution"),
+            handler="ami_sharing.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=amisharing_lambda_role,
+            environment={
+                "SHARING_ACCOUNT_IDS": ami_sharing_ids_source
+            },
+            timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
+        sns_topic.add_subscription(sns_subscriptions.LambdaSubscription(ami_sharing_lambda))
 
         # The custom resource that uses the ami distribution provider to supply values
         ami_distribution_custom_resource = core.CustomResource(
@@ -298,8 +408,8 @@ class VmdkExportStack(core.Stack):
                 'ImageBuilderName': f'AmiDistributionConfig-{CdkUtils.stack_tag}',
                 'AmiDistributionName': f"AmiShare-{CdkUtils.stack_tag}" + "-{{ imagebuilder:buildDate }}",
                 'AmiDistributionArn': ami_share_distribution_config.attr_arn,
-                'PublishingAccountIds': ssm_ami_publishing_target_ids.parameter_name,
-                'SharingAccountIds': ssm_ami_sharing_ids.parameter_name
+                'PublishingAccountIds': ami_publishing_target_ids_source,
+                'SharingAccountIds': ami_sharing_ids_source
             }
         )
 
@@ -307,12 +417,76 @@ class VmdkExportStack(core.Stack):
 
         # The result obtained from the output of custom resource
         ami_distriubtion_arn = core.CustomResource.get_att_string(ami_distribution_custom_resource, attribute_name='AmiDistributionArn')
+        ami_distribution_config_hash = core.CustomResource.get_att_string(ami_distribution_custom_resource, attribute_name='DistributionConfigHash')
 
 
         ##########################################################
         # <START> VMDK Export
         ##########################################################        
 
+        # Table shared by the export lambda functions to coordinate exports,
+        # i.e. the export slot semaphore and priority queue of each region
+        export_control_table = dynamodb.Table(
+            self, f"ExportControlTable-{CdkUtils.stack_tag}",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="sk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.CUSTOMER_MANAGED,
+            encryption_key=kms_key,
+            point_in_time_recovery=True,
+            time_to_live_attribute="expires_at",
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+
+        # Table recording when each execution passed each export stage,
+        # read by the stage latency report
+        export_history_table = dynamodb.Table(
+            self, f"ExportHistoryTable-{CdkUtils.stack_tag}",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            sort_key=dynamodb.Attribute(name="sk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            encryption=dynamodb.TableEncryption.CUSTOMER_MANAGED,
+            encryption_key=kms_key,
+            point_in_time_recovery=True,
+            time_to_live_attribute="expires_at",
+            removal_policy=core.RemovalPolicy.DESTROY
+        )
+
+        # Event bus to which the export progress events are published
+        vmdk_export_event_bus = events.EventBus(
+            self, f"VmdkExportEventBus-{CdkUtils.stack_tag}",
+            event_bus_name=f"VmdkExportEventBus-{CdkUtils.stack_tag}"
+        )
+
+        # Schemas of the versioned export completed and failed events,
+        # discoverable with code bindings in the EventBridge schema registry
+        vmdk_export_schema_registry = eventschemas.CfnRegistry(
+            self, f"VmdkExportSchemaRegistry-{CdkUtils.stack_tag}",
+            registry_name=f"VmdkExport-{CdkUtils.stack_tag}",
+            description="Schemas of the events published by the AMI to VMDK export"
+        )
+        for schema_name, schema_file_name in [
+            ("VmdkExportCompleted", "vmdk_export_completed.json"),
+            ("VmdkExportFailed", "vmdk_export_failed.json")
+        ]:
+            with open(f"stacks/vmdkexport/resources/schemas/{schema_file_name}", "r") as schema_file:
+                eventschemas.CfnSchema(
+                    self, f"{schema_name}Schema-{CdkUtils.stack_tag}",
+                    registry_name=vmdk_export_schema_registry.attr_registry_name,
+                    schema_name=f"vmdkexport@{schema_name}",
+                    type="JSONSchemaDraft4",
+                    content=schema_file.read(),
+                    description=f"{schema_name} event, version 1.0"
+                )
+
+        # Layer containing the code shared by the export lambda functions
+        vmdk_export_common_layer = aws_lambda.LayerVersion(
+            self, f"vmdkExportCommonLayer-{CdkUtils.stack_tag}",
+            code=aws_lambda.Code.from_asset("stacks/vmdkexport/resources/vmexport/common"),
+            compatible_runtimes=[aws_lambda.Runtime.PYTHON_3_9],
+            description="Code shared by the AMI to VMDK export lambda functions"
+        )
+
         # Create a role for the vmdk entry point lambda function
         vmdk_entry_point_lambda_role = iam.Role(
             scope=self,
@@ -333,8 +507,14 @@ class VmdkExportStack(core.Stack):
             handler="vmdkexportentrypoint_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             role=vmdk_entry_point_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name,
+                "MAX_BATCH_SIZE": str(config["vmdkExport"]["batch"]["maxSize"])
+            },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
+        export_history_table.grant_write_data(vmdk_entry_point_lambda_role)
 
         # Create a role for the imagebuilder poll lambda function
         imagebuilderpoll_lambda_role = iam.Role(
@@ -366,8 +546,13 @@ class VmdkExportStack(core.Stack):
             handler="imagebuilderpoll_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             role=imagebuilderpoll_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name
+            },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
+        export_history_table.grant_write_data(imagebuilderpoll_lambda_role)
 
         # Create a role for the ami publish metadata lambda function
         amipublishmetadata_lambda_role = iam.Role(
@@ -384,7 +569,7 @@ class VmdkExportStack(core.Stack):
         amipublishmetadata_lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{ami_share_pipeline.name}/{ami_share_recipe.version}/*"],
+                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{ami_share_pipeline.name}/*"],
                 actions=[
                     "ssm:PutParameter",
                 ]
@@ -409,9 +594,39 @@ class VmdkExportStack(core.Stack):
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             handler="publishamimetadata_function.lambda_handler",
             role=amipublishmetadata_lambda_role,
+            layers=[vmdk_export_common_layer],
             environment={
-                "PIPELINE_NAME": ami_share_pipeline.name,
-                "RECIPIE_VERSION": ami_share_recipe.version
+                "PIPELINE_NAME": ami_share_pipeline.name
+            },
+            timeout=self.LAMBDA_TIMEOUT_DEFAULT
+        )
+
+        # Create a role for the export slot lambda function
+        exportslot_lambda_role = iam.Role(
+            scope=self,
+            id=f"exportSlotLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        export_control_table.grant_read_write_data(exportslot_lambda_role)
+
+        # Create export slot lambda function, which limits the number of
+        # concurrent export image tasks to the EC2 quota of the region
+        exportslot_lambda = aws_lambda.Function(
+            scope=self,
+            id=f"exportSlotLambda-{CdkUtils.stack_tag}",
+            code=aws_lambda.Code.from_asset("stacks/vmdkexport/resources/vmexport/exportslot"),
+            handler="exportslot_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=exportslot_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "EXPORT_CONTROL_TABLE": export_control_table.table_name,
+                "EXPORT_SLOT_LIMIT": str(config["vmdkExport"]["exportSlotLimit"])
             },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
@@ -542,9 +757,65 @@ class VmdkExportStack(core.Stack):
             handler="vmdkexport_function.lambda_handler",
             role=vmdkexport_role,
             runtime=aws_lambda.Runtime.PYTHON_3_9,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "EXPORT_BUCKET": f"{s3_bucket.bucket_name}",
+                "EXPORT_ROLE": f"{vm_import_role.role_name}",
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name
+            },
+            timeout=self.LAMBDA_TIMEOUT_DEFAULT
+        )
+        export_history_table.grant_write_data(vmdkexport_role)
+
+        # Create a role for the export preflight lambda function
+        exportpreflight_lambda_role = iam.Role(
+            scope=self,
+            id=f"exportPreflightLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        # add the permissions to inspect the AMI, the vmimport role and the export bucket
+        exportpreflight_lambda_role.add_to_policy(iam.PolicyStatement(
+            resources=["*"],
+            actions=[
+                "ec2:DescribeImages",
+                "ec2:DescribeSnapshots"
+            ]
+        ))
+        exportpreflight_lambda_role.add_to_policy(iam.PolicyStatement(
+            resources=[vm_import_role.role_arn],
+            actions=[
+                "iam:GetRole",
+                "iam:SimulatePrincipalPolicy"
+            ]
+        ))
+        exportpreflight_lambda_role.add_to_policy(iam.PolicyStatement(
+            resources=[s3_bucket.bucket_arn],
+            actions=[
+                "s3:GetBucketPolicy"
+            ]
+        ))
+
+        # Create export preflight lambda function, which fails exports EC2
+        # would reject before an export slot is taken
+        exportpreflight_lambda = aws_lambda.Function(
+            scope=self,
+            id=f"exportPreflightLambda-{CdkUtils.stack_tag}",
+            code=aws_lambda.Code.from_asset("stacks/vmdkexport/resources/vmexport/exportpreflight"),
+            handler="exportpreflight_function.lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=exportpreflight_lambda_role,
+            layers=[vmdk_export_common_layer],
             environment={
                 "EXPORT_BUCKET": f"{s3_bucket.bucket_name}",
-                "EXPORT_ROLE": f"{vm_import_role.role_name}"
+                "EXPORT_ROLE": f"{vm_import_role.role_name}",
+                "EXPORT_KMS_KEY_ARNS": kms_key.key_arn,
+                "PREFLIGHT_BOOT_MODES": ",".join(config["vmdkExport"]["preflight"]["bootModes"]),
+                "PREFLIGHT_VOLUME_TYPES": ",".join(config["vmdkExport"]["preflight"]["volumeTypes"])
             },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
@@ -579,6 +850,12 @@ class VmdkExportStack(core.Stack):
             )
         )
 
+        # add permissions to release the export slot
+        export_control_table.grant_read_write_data(vmdkcompleted_lambda_role)
+
+        # add permissions to publish the export progress
+        vmdk_export_event_bus.grant_put_events_to(vmdkcompleted_lambda_role)
+
         # Create vmdkcompleted lambda function
         vmdkcompleted_lambda = aws_lambda.Function(
             scope=self,
@@ -587,8 +864,15 @@ class VmdkExportStack(core.Stack):
             handler="vmdkexportcompleted_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             role=vmdkcompleted_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "EXPORT_CONTROL_TABLE": export_control_table.table_name,
+                "EXPORT_EVENT_BUS": vmdk_export_event_bus.event_bus_name,
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name
+            },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
+        export_history_table.grant_write_data(vmdkcompleted_lambda_role)
 
         # Create a role for the vmdk publish metadata lambda function
         vmdkpublishmetadata_lambda_role = iam.Role(
@@ -601,13 +885,16 @@ class VmdkExportStack(core.Stack):
                 )
             ]
         )
-        # add permissions for VMDK metadata publishing
+        # add permissions for VMDK metadata publishing, the latest pointer
+        # is read back to only move it forward
         vmdkpublishmetadata_lambda_role.add_to_policy(
             iam.PolicyStatement(
                 effect=iam.Effect.ALLOW,
-                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{ami_share_pipeline.name}/{ami_share_recipe.version}/*"],
+                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{ami_share_pipeline.name}/*"],
                 actions=[
-                    "ssm:PutParameter"
+                    "ssm:PutParameter",
+                    "ssm:GetParameter",
+                    "ssm:GetParameterHistory"
                 ]
             )
         )
@@ -623,7 +910,9 @@ class VmdkExportStack(core.Stack):
 
         sns_topic.grant_publish(vmdkpublishmetadata_lambda_role)
         kms_key.grant_encrypt_decrypt(vmdkpublishmetadata_lambda_role)
+        export_control_table.grant_read_write_data(vmdkpublishmetadata_lambda_role)
         s3_bucket.grant_read_write(vmdkpublishmetadata_lambda_role)
+        vmdk_export_event_bus.grant_put_events_to(vmdkpublishmetadata_lambda_role)
 
         # Create vmdk metadata publishing lambda function
         vmdkpublishmetadata_lambda = aws_lambda_python.PythonFunction(
@@ -634,37 +923,271 @@ class VmdkExportStack(core.Stack):
             handler="lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             role=vmdkpublishmetadata_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "PIPELINE_NAME": ami_share_pipeline.name,
+                "SNS_TOPIC": sns_topic.topic_arn,
+                "NOTIFICATION_MODE": config["vmdkExport"]["notificationMode"],
+                "EXPORT_CONTROL_TABLE": export_control_table.table_name,
+                "EXPORT_EVENT_BUS": vmdk_export_event_bus.event_bus_name,
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name
+            },
+            timeout=self.LAMBDA_TIMEOUT_DEFAULT
+        )
+        export_history_table.grant_write_data(vmdkpublishmetadata_lambda_role)
+
+        # Create a role for the failure publishing lambda function
+        publishfailure_lambda_role = iam.Role(
+            scope=self,
+            id=f"publishFailureLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        # add permissions for failure metadata publishing
+        publishfailure_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:aws:ssm:{core.Aws.REGION}:{core.Aws.ACCOUNT_ID}:parameter/{ami_share_pipeline.name}/*"],
+                actions=[
+                    "ssm:PutParameter"
+                ]
+            )
+        )
+        # add permissions to cancel the running export of a failed execution
+        publishfailure_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "ec2:DescribeExportImageTasks",
+                    "ec2:CancelExportTask"
+                ]
+            )
+        )
+        sns_topic.grant_publish(publishfailure_lambda_role)
+        kms_key.grant_encrypt_decrypt(publishfailure_lambda_role)
+        vmdk_export_event_bus.grant_put_events_to(publishfailure_lambda_role)
+        export_history_table.grant_write_data(publishfailure_lambda_role)
+
+        # Create failure publishing lambda function
+        publishfailure_lambda = aws_lambda_python.PythonFunction(
+            scope=self,
+            id=f"publishFailureLambda-{CdkUtils.stack_tag}",
+            entry="stacks/vmdkexport/resources/vmexport/publishfailure",
+            index="publishfailure_function.py",
+            handler="lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=publishfailure_lambda_role,
+            layers=[vmdk_export_common_layer],
             environment={
                 "PIPELINE_NAME": ami_share_pipeline.name,
-                "RECIPIE_VERSION": ami_share_recipe.version,
+                "SNS_TOPIC": sns_topic.topic_arn,
+                "EXPORT_EVENT_BUS": vmdk_export_event_bus.event_bus_name,
+                "EXPORT_HISTORY_TABLE": export_history_table.table_name
+            },
+            timeout=self.LAMBDA_TIMEOUT_DEFAULT
+        )
+
+        # Create a role for the batch summary lambda function
+        vmdkbatchsummary_lambda_role = iam.Role(
+            scope=self,
+            id=f"vmdkBatchSummaryLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        sns_topic.grant_publish(vmdkbatchsummary_lambda_role)
+        kms_key.grant_encrypt_decrypt(vmdkbatchsummary_lambda_role)
+
+        # Create batch summary lambda function, sending a single
+        # notification once every export of a batch is done
+        vmdkbatchsummary_lambda = aws_lambda_python.PythonFunction(
+            scope=self,
+            id=f"vmdkBatchSummaryLambda-{CdkUtils.stack_tag}",
+            entry="stacks/vmdkexport/resources/vmexport/vmdkbatchsummary",
+            index="vmdkbatchsummary_function.py",
+            handler="lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=vmdkbatchsummary_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
                 "SNS_TOPIC": sns_topic.topic_arn
             },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
 
+        # Create a role for the vmdk digest lambda function
+        vmdkdigest_lambda_role = iam.Role(
+            scope=self,
+            id=f"vmdkDigestLambdaRole-{CdkUtils.stack_tag}",
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                iam.ManagedPolicy.from_aws_managed_policy_name(
+                    "service-role/AWSLambdaBasicExecutionRole"
+                )
+            ]
+        )
+        sns_topic.grant_publish(vmdkdigest_lambda_role)
+        kms_key.grant_encrypt_decrypt(vmdkdigest_lambda_role)
+        export_control_table.grant_read_write_data(vmdkdigest_lambda_role)
+
+        # Create vmdk digest lambda function, sending the notifications
+        # buffered in digest mode once per window
+        vmdkdigest_lambda = aws_lambda_python.PythonFunction(
+            scope=self,
+            id=f"vmdkDigestLambda-{CdkUtils.stack_tag}",
+            entry="stacks/vmdkexport/resources/vmexport/vmdkdigest",
+            index="vmdkdigest_function.py",
+            handler="lambda_handler",
+            runtime=aws_lambda.Runtime.PYTHON_3_9,
+            role=vmdkdigest_lambda_role,
+            layers=[vmdk_export_common_layer],
+            environment={
+                "SNS_TOPIC": sns_topic.topic_arn,
+                "EXPORT_CONTROL_TABLE": export_control_table.table_name
+            },
+            timeout=core.Duration.minutes(1)
+        )
+
+        # the schedule only runs in digest mode, the function is always
+        # deployed so that switching modes does not replace resources
+        events.Rule(
+            self, f"vmdkDigestSchedule-{CdkUtils.stack_tag}",
+            schedule=events.Schedule.rate(core.Duration.minutes(config["vmdkExport"]["digestWindowMinutes"])),
+            enabled=config["vmdkExport"]["notificationMode"] == "digest",
+            targets=[events_targets.LambdaFunction(vmdkdigest_lambda)]
+        )
+
+        # In the router layout a single function serves every stage of the
+        # State Machine, so that one warm container answers all polls. It
+        # runs with the permissions of every stage. The stage functions stay
+        # deployed so that switching layouts does not replace resources.
+        # see benchmarks/router_layout_bench.py
+        router_lambda = None
+        if config["vmdkExport"]["lambdaLayout"] == "router":
+            router_lambda_role = iam.Role(
+                scope=self,
+                id=f"vmdkRouterLambdaRole-{CdkUtils.stack_tag}",
+                assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+                managed_policies=[
+                    iam.ManagedPolicy.from_aws_managed_policy_name(
+                        "service-role/AWSLambdaBasicExecutionRole"
+                    )
+                ]
+            )
+            for stage_role in [
+                vmdk_entry_point_lambda_role,
+                imagebuilderpoll_lambda_role,
+                amipublishmetadata_lambda_role,
+                exportpreflight_lambda_role,
+                exportslot_lambda_role,
+                vmdkexport_role,
+                vmdkcompleted_lambda_role,
+                vmdkpublishmetadata_lambda_role,
+                publishfailure_lambda_role,
+                vmdkbatchsummary_lambda_role
+            ]:
+                stage_role.node.find_child("DefaultPolicy").attach_to_role(router_lambda_role)
+
+            router_lambda = aws_lambda.Function(
+                scope=self,
+                id=f"vmdkRouterLambda-{CdkUtils.stack_tag}",
+                code=aws_lambda.Code.from_asset(
+                    "stacks/vmdkexport/resources/vmexport",
+                    exclude=["common", "createvmimportrole", "vmdkdigest", "vmdknotify", "**/__pycache__"],
+                    bundling=core.BundlingOptions(
+                        image=aws_lambda.Runtime.PYTHON_3_9.bundling_image,
+                        command=["bash", "-c", "pip install -r router/requirements.txt -t /asset-output && cp -au . /asset-output"]
+                    )
+                ),
+                handler="router/router_function.lambda_handler",
+                runtime=aws_lambda.Runtime.PYTHON_3_9,
+                role=router_lambda_role,
+                layers=[vmdk_export_common_layer],
+                environment={
+                    "PIPELINE_NAME": ami_share_pipeline.name,
+                    "SNS_TOPIC": sns_topic.topic_arn,
+                    "NOTIFICATION_MODE": config["vmdkExport"]["notificationMode"],
+                    "EXPORT_SLOT_LIMIT": str(config["vmdkExport"]["exportSlotLimit"]),
+                    "EXPORT_BUCKET": f"{s3_bucket.bucket_name}",
+                    "EXPORT_ROLE": f"{vm_import_role.role_name}",
+                    "EXPORT_KMS_KEY_ARNS": kms_key.key_arn,
+                    "PREFLIGHT_BOOT_MODES": ",".join(config["vmdkExport"]["preflight"]["bootModes"]),
+                    "PREFLIGHT_VOLUME_TYPES": ",".join(config["vmdkExport"]["preflight"]["volumeTypes"]),
+                    "EXPORT_EVENT_BUS": vmdk_export_event_bus.event_bus_name,
+                    "EXPORT_HISTORY_TABLE": export_history_table.table_name,
+                    "MAX_BATCH_SIZE": str(config["vmdkExport"]["batch"]["maxSize"])
+                },
+                timeout=self.LAMBDA_TIMEOUT_DEFAULT
+            )
+
+        # the state machine lambda functions retry throttled and transient
+        # AWS API calls with the SDK's exponential backoff with jitter, and
+        # feed throttling errors to the shared circuit breaker. In claim-check
+        # mode large state payloads are passed as references to the bucket
+        for state_machine_lambda in [
+            vmdk_entry_point_lambda,
+            imagebuilderpoll_lambda,
+            amipublishmetadata_lambda,
+            exportpreflight_lambda,
+            exportslot_lambda,
+            vmdkexport_lambda,
+            vmdkcompleted_lambda,
+            vmdkpublishmetadata_lambda,
+            publishfailure_lambda,
+            vmdkbatchsummary_lambda
+        ] + ([router_lambda] if router_lambda else []):
+            state_machine_lambda.add_environment("AWS_RETRY_MODE", "standard")
+            state_machine_lambda.add_environment("AWS_MAX_ATTEMPTS", str(config["vmdkExport"]["retry"]["sdkMaxAttempts"]))
+            state_machine_lambda.add_environment("EXPORT_CONTROL_TABLE", export_control_table.table_name)
+            state_machine_lambda.add_environment("BREAKER_THROTTLE_THRESHOLD", str(config["vmdkExport"]["circuitBreaker"]["throttleThreshold"]))
+            state_machine_lambda.add_environment("BREAKER_WINDOW_SECONDS", str(config["vmdkExport"]["circuitBreaker"]["windowSeconds"]))
+            state_machine_lambda.add_environment("BREAKER_COOLDOWN_SECONDS", str(config["vmdkExport"]["circuitBreaker"]["cooldownSeconds"]))
+            export_control_table.grant_read_write_data(state_machine_lambda)
+            if config["vmdkExport"]["claimCheck"]["enabled"]:
+                state_machine_lambda.add_environment("CLAIM_CHECK_BUCKET", s3_bucket.bucket_name)
+                state_machine_lambda.add_environment("CLAIM_CHECK_THRESHOLD_BYTES", str(config["vmdkExport"]["claimCheck"]["thresholdBytes"]))
+                s3_bucket.grant_read_write(state_machine_lambda, "claim-checks/*")
+
+        # the metadata of each image build is written to its own SSM namespace,
+        # the flat parameters of earlier releases are kept for existing readers
+        for metadata_lambda in [amipublishmetadata_lambda, vmdkpublishmetadata_lambda, publishfailure_lambda] + ([router_lambda] if router_lambda else []):
+            metadata_lambda.add_environment("LEGACY_SSM_PATHS", str(config["vmdkExport"]["ssmMetadata"]["legacyPaths"]).lower())
+
+        # the descriptors of available images are cached in the export control table
+        for descriptor_lambda in [imagebuilderpoll_lambda, amipublishmetadata_lambda] + ([router_lambda] if router_lambda else []):
+            descriptor_lambda.add_environment("IMAGE_DESCRIPTOR_TABLE", export_control_table.table_name)
+            descriptor_lambda.add_environment("IMAGE_DESCRIPTOR_TTL_SECONDS", str(config["vmdkExport"]["imageDescriptorCache"]["ttlDays"] * 86400))
+
         # step function definitions
-        entry_point_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "EntryPointLambdaTask", 
-            input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=vmdk_entry_point_lambda
+        # inject the execution id and start time for the stage history
+        execution_context_task = stepfunctions.Pass(
+            self,
+            "ExecutionContextTask",
+            parameters={
+                "id.$": "$$.Execution.Id",
+                "name.$": "$$.Execution.Name",
+                "started_at.$": "$$.Execution.StartTime"
+            },
+            result_path="$.execution"
         )
 
+        entry_point_lambda_task = self.stage_lambda_task("EntryPointLambdaTask", vmdk_entry_point_lambda, "entry_point", router_lambda)
+
         ami_available_wait_task = stepfunctions.Wait(
             self, 
             "AMIAvailableWaitTask", 
             time=stepfunctions.WaitTime.duration(core.Duration.minutes(3))
         )
 
-        ami_poll_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "AMIPollLambdaTask", 
-            input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=imagebuilderpoll_lambda
-
-        )
+        ami_poll_lambda_task = self.stage_lambda_task("AMIPollLambdaTask", imagebuilderpoll_lambda, "ami_poll", router_lambda)
 
         ami_poll_choice_task = stepfunctions.Choice(
             self,
@@ -673,35 +1196,42 @@ class VmdkExportStack(core.Stack):
             output_path="$"
         )
 
-        ami_publish_metadata_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "AMIMetadataLambdaTask", 
+        # fail exports EC2 would reject within seconds, before a slot is taken
+        export_preflight_lambda_task = self.stage_lambda_task("ExportPreflightLambdaTask", exportpreflight_lambda, "export_preflight", router_lambda)
+
+        export_preflight_choice_task = stepfunctions.Choice(
+            self,
+            "ExportPreflightCheckTask",
             input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=amipublishmetadata_lambda
+            output_path="$"
         )
 
-        vdmk_export_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "VDMKExportLambdaTask", 
+        export_slot_lambda_task = self.stage_lambda_task("ExportSlotLambdaTask", exportslot_lambda, "export_slot", router_lambda)
+
+        export_slot_choice_task = stepfunctions.Choice(
+            self,
+            "ExportSlotCheckTask",
             input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=vmdkexport_lambda
+            output_path="$"
+        )
+
+        export_slot_wait_task = stepfunctions.Wait(
+            self, 
+            "ExportSlotWaitTask", 
+            time=stepfunctions.WaitTime.duration(core.Duration.minutes(1))
         )
 
+        ami_publish_metadata_lambda_task = self.stage_lambda_task("AMIMetadataLambdaTask", amipublishmetadata_lambda, "ami_metadata", router_lambda)
+
+        vdmk_export_lambda_task = self.stage_lambda_task("VDMKExportLambdaTask", vmdkexport_lambda, "export", router_lambda)
+
         vmdk_export_wait_task = stepfunctions.Wait(
             self, 
             "VMDKExportWaitTask", 
             time=stepfunctions.WaitTime.duration(core.Duration.minutes(3))
         )
 
-        vmdk_poll_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "VMDKPollLambdaTask", 
-            input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=vmdkcompleted_lambda
-        )
+        vmdk_poll_lambda_task = self.stage_lambda_task("VMDKPollLambdaTask", vmdkcompleted_lambda, "export_poll", router_lambda)
 
         vmdk_poll_choice_task = stepfunctions.Choice(
             self,
@@ -710,12 +1240,42 @@ class VmdkExportStack(core.Stack):
             output_path="$"
         )
 
-        vmdk_publish_metadata_lambda_task = stepfunctions_tasks.LambdaInvoke(
-            self, 
-            "VMDKMetadataLambdaTask", 
+        vmdk_publish_metadata_lambda_task = self.stage_lambda_task("VMDKMetadataLambdaTask", vmdkpublishmetadata_lambda, "export_metadata", router_lambda)
+
+        # resumed exports skip the stages completed by a previous execution,
+        # see vmexportcommon/checkpoint.py
+        resume_choice_task = stepfunctions.Choice(
+            self,
+            "ResumeCheckTask",
+            input_path="$",
+            output_path="$"
+        )
+
+        resume_completed_task = stepfunctions.Pass(
+            self,
+            "ResumeCompletedTask"
+        )
+
+        # every image build of the request is exported in a Map iteration,
+        # an iteration ends with the metadata or the failure of its export
+        # so that a failed export does not stop the other exports
+        export_items_map_task = stepfunctions.Map(
+            self,
+            "ExportItemsMap",
+            items_path="$.items",
+            max_concurrency=config["vmdkExport"]["batch"]["maxConcurrency"],
+            result_path="$.results"
+        )
+
+        batch_summary_lambda_task = self.stage_lambda_task(
+            "BatchSummaryLambdaTask", vmdkbatchsummary_lambda, "batch_summary", router_lambda, result_path="$.summary"
+        )
+
+        export_result_choice_task = stepfunctions.Choice(
+            self,
+            "ExportResultCheckTask",
             input_path="$",
-            output_path="$.Payload.body",
-            lambda_function=vmdkpublishmetadata_lambda
+            output_path="$"
         )
 
         vmdk_export_success_task = stepfunctions.Succeed(
@@ -723,21 +1283,141 @@ class VmdkExportStack(core.Stack):
             "VMDKExportInvoked"
         )
 
-        ami_poll_choice_task.when(stepfunctions.Condition.string_equals('$.ami_state', "AVAILABLE"), ami_publish_metadata_lambda_task).otherwise(ami_available_wait_task)
+        # failed, cancelled or deleted builds and exports stop polling
+        # and release their execution instead of waiting for the timeout
+        publish_failure_lambda_task = self.stage_lambda_task("FailureMetadataLambdaTask", publishfailure_lambda, "failure", router_lambda)
 
-        ami_publish_metadata_lambda_task.next(vdmk_export_lambda_task)
+        vmdk_export_failed_task = stepfunctions.Fail(
+            self,
+            "VMDKExportFailed",
+            error="VMDKExportFailed",
+            cause="The AMI build or the VMDK export of an image build failed, see the summary and the results of the execution"
+        )
 
-        vdmk_export_lambda_task.next(vmdk_export_wait_task).next(vmdk_poll_lambda_task).next(vmdk_poll_choice_task)
+        # retry the lambda tasks of the nested Express workflow before it is
+        # rendered, failures are caught by the task starting it
+        for express_lambda_task in [ami_publish_metadata_lambda_task, vdmk_export_lambda_task]:
+            self.add_task_retry(express_lambda_task, self.RETRYABLE_LAMBDA_TASK_ERRORS, config["vmdkExport"]["retry"])
 
-        vmdk_poll_choice_task.when(stepfunctions.Condition.string_equals('$.vdmk_export_status', "COMPLETED"), vmdk_publish_metadata_lambda_task).otherwise(vmdk_export_wait_task)
+        # A failure to publish the AMI metadata after its retries must not
+        # fail the Parallel state while the export image task started by the
+        # other branch keeps running, the slot would be released and the
+        # export orphaned. The error is recorded in the branch output.
+        ami_publish_metadata_failed_task = stepfunctions.Pass(
+            self,
+            "AMIMetadataFailedTask"
+        )
+        ami_publish_metadata_lambda_task.add_catch(
+            ami_publish_metadata_failed_task, errors=["States.ALL"], result_path="$.ami_metadata_error"
+        )
 
-        vmdk_publish_metadata_lambda_task.next(vmdk_export_success_task)
+        # The export does not depend on the AMI metadata in SSM, both start
+        # from the AMI id resolved while polling. The output of the export
+        # branch, which holds the export task id, is carried forward.
+        # see benchmarks/parallel_start_bench.py
+        export_start_parallel_task = stepfunctions.Parallel(
+            self,
+            "ExportStartParallelTask",
+            input_path="$",
+            output_path="$[1]"
+        )
+        export_start_parallel_task.branch(ami_publish_metadata_lambda_task)
+        export_start_parallel_task.branch(vdmk_export_lambda_task)
+
+        # The AMI metadata publishing and export kick-off are short synchronous
+        # Lambda calls, they run in a nested Express workflow so that the
+        # Standard workflow only pays for a single transition for the stretch.
+        # see benchmarks/express_workflow_bench.py
+        export_start_state_machine = stepfunctions.StateMachine(
+            self, f"VMDKExportStartStateMachine-{CdkUtils.stack_tag}",
+            state_machine_type=stepfunctions.StateMachineType.EXPRESS,
+            timeout=core.Duration.minutes(5),
+            definition=export_start_parallel_task
+        )
+
+        export_start_express_task = stepfunctions_tasks.StepFunctionsStartExecution(
+            self,
+            "ExportStartExpressTask",
+            state_machine=export_start_state_machine,
+            integration_pattern=stepfunctions.IntegrationPattern.RUN_JOB,
+            input_path="$",
+            output_path="$.Output"
+        )
+
+        # retry every task on throttling and transient errors, tasks failing
+        # after their retries are published as failures
+        for lambda_task in [
+            ami_poll_lambda_task,
+            export_preflight_lambda_task,
+            export_slot_lambda_task,
+            vmdk_poll_lambda_task,
+            vmdk_publish_metadata_lambda_task
+        ]:
+            self.add_task_retry(lambda_task, self.RETRYABLE_LAMBDA_TASK_ERRORS, config["vmdkExport"]["retry"])
+            lambda_task.add_catch(publish_failure_lambda_task, errors=["States.ALL"], result_path="$.task_error")
+
+        self.add_task_retry(export_start_express_task, self.RETRYABLE_START_EXECUTION_ERRORS, config["vmdkExport"]["retry"])
+        export_start_express_task.add_catch(publish_failure_lambda_task, errors=["States.ALL"], result_path="$.task_error")
+
+        # the entry point, failure and summary tasks are not caught, invalid
+        # requests fail the execution before any export is started
+        self.add_task_retry(entry_point_lambda_task, self.RETRYABLE_LAMBDA_TASK_ERRORS, config["vmdkExport"]["retry"])
+        self.add_task_retry(publish_failure_lambda_task, self.RETRYABLE_LAMBDA_TASK_ERRORS, config["vmdkExport"]["retry"])
+        self.add_task_retry(batch_summary_lambda_task, self.RETRYABLE_LAMBDA_TASK_ERRORS, config["vmdkExport"]["retry"])
+
+        ami_poll_choice_task.when(stepfunctions.Condition.string_equals('$.ami_state', "AVAILABLE"), export_preflight_lambda_task).when(
+            stepfunctions.Condition.or_(
+                stepfunctions.Condition.string_equals('$.ami_state', "FAILED"),
+                stepfunctions.Condition.string_equals('$.ami_state', "CANCELLED"),
+                stepfunctions.Condition.string_equals('$.ami_state', "DELETED")
+            ),
+            publish_failure_lambda_task
+        ).otherwise(ami_available_wait_task)
+
+        export_preflight_lambda_task.next(export_preflight_choice_task)
+
+        export_preflight_choice_task.when(stepfunctions.Condition.boolean_equals('$.export_eligible', True), export_slot_lambda_task).otherwise(publish_failure_lambda_task)
+
+        # wait in the priority queue until an export slot is free
+        export_slot_lambda_task.next(export_slot_choice_task)
 
-        # step functions state machine
+        export_slot_choice_task.when(stepfunctions.Condition.string_equals('$.export_slot_status', "ACQUIRED"), export_start_express_task).otherwise(export_slot_wait_task)
+
+        export_slot_wait_task.next(export_slot_lambda_task)
+
+        export_start_express_task.next(vmdk_export_wait_task).next(vmdk_poll_lambda_task).next(vmdk_poll_choice_task)
+
+        vmdk_poll_choice_task.when(stepfunctions.Condition.string_equals('$.vdmk_export_status', "COMPLETED"), vmdk_publish_metadata_lambda_task).when(
+            stepfunctions.Condition.string_equals('$.vdmk_export_status', "FAILED"), publish_failure_lambda_task
+        ).otherwise(vmdk_export_wait_task)
+
+        resume_choice_task.when(stepfunctions.Condition.string_equals('$.resume_from', "completed"), resume_completed_task).when(
+            stepfunctions.Condition.string_equals('$.resume_from', "export_metadata"), vmdk_publish_metadata_lambda_task
+        ).when(
+            stepfunctions.Condition.string_equals('$.resume_from', "export_poll"), vmdk_poll_lambda_task
+        ).when(
+            stepfunctions.Condition.string_equals('$.resume_from', "export_slot"), export_preflight_lambda_task
+        ).otherwise(ami_available_wait_task)
+
+        ami_available_wait_task.next(ami_poll_lambda_task).next(ami_poll_choice_task)
+
+        export_items_map_task.iterator(resume_choice_task)
+
+        export_items_map_task.next(batch_summary_lambda_task).next(export_result_choice_task)
+
+        export_result_choice_task.when(stepfunctions.Condition.number_greater_than('$.summary.failed', 0), vmdk_export_failed_task).otherwise(vmdk_export_success_task)
+
+        # step functions state machine, whose timeout leaves every export of
+        # the largest batch its time budget: the exports run in rounds of as
+        # many as the Map concurrency and the export slots allow
+        export_rounds = math.ceil(config["vmdkExport"]["batch"]["maxSize"] / min(
+            config["vmdkExport"]["batch"]["maxConcurrency"],
+            config["vmdkExport"]["exportSlotLimit"]
+        ))
         vmdkexport_state_machine = stepfunctions.StateMachine(
             self, f"VMDKExportStateMachine-{CdkUtils.stack_tag}",
-            timeout=core.Duration.minutes(120),
-            definition=entry_point_lambda_task.next(ami_available_wait_task).next(ami_poll_lambda_task).next(ami_poll_choice_task)
+            timeout=core.Duration.minutes(self.EXPORT_TIMEOUT_MINUTES * export_rounds),
+            definition=execution_context_task.next(entry_point_lambda_task).next(export_items_map_task)
         )
 
         # Create a role for the vmdk notify lambda function
@@ -770,6 +1450,38 @@ class VmdkExportStack(core.Stack):
                 ]
             )
         )
+        # add permissions to supersede the running exports of older builds
+        vmdk_notify_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=[f"arn:{self.partition}:states:{self.region}:{self.account}:execution:{vmdkexport_state_machine.state_machine_name}:*"],
+                actions=[
+                    "states:DescribeExecution",
+                    "states:GetExecutionHistory",
+                    "states:StopExecution"
+                ]
+            )
+        )
+        vmdk_notify_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "ec2:CancelExportTask"
+                ]
+            )
+        )
+        # add permissions to read the pipeline of the builds
+        vmdk_notify_lambda_role.add_to_policy(
+            iam.PolicyStatement(
+                effect=iam.Effect.ALLOW,
+                resources=["*"],
+                actions=[
+                    "imagebuilder:GetImage"
+                ]
+            )
+        )
+        export_control_table.grant_read_write_data(vmdk_notify_lambda_role)
 
         # Create vmdk notify lambda function
         vmdk_notify_lambda = aws_lambda.Function(
@@ -779,8 +1491,14 @@ class VmdkExportStack(core.Stack):
             handler="vmdknotify_function.lambda_handler",
             runtime=aws_lambda.Runtime.PYTHON_3_9,
             role=vmdk_notify_lambda_role,
+            layers=[vmdk_export_common_layer],
             environment={
-                "STATE_MACHINE_ARN": vmdkexport_state_machine.state_machine_arn
+                "STATE_MACHINE_ARN": vmdkexport_state_machine.state_machine_arn,
+                "EXPORT_CONTROL_TABLE": export_control_table.table_name,
+                "SUPERSEDE_RUNNING_EXPORTS": str(config["vmdkExport"]["supersedeRunningExports"]).lower(),
+                "MAX_RUNNING_EXECUTIONS": str(config["vmdkExport"]["maxRunningExecutions"]),
+                "IMAGE_DESCRIPTOR_TABLE": export_control_table.table_name,
+                "IMAGE_DESCRIPTOR_TTL_SECONDS": str(config["vmdkExport"]["imageDescriptorCache"]["ttlDays"] * 86400)
             },
             timeout=self.LAMBDA_TIMEOUT_DEFAULT
         )
@@ -794,6 +1512,20 @@ class VmdkExportStack(core.Stack):
 
         vmdk_sns_topic.add_subscription(sns_subscriptions.LambdaSubscription(vmdk_notify_lambda))
 
+        # the queued export requests are started when an execution ends
+        events.Rule(
+            self, f"vmdkExecutionEndedRule-{CdkUtils.stack_tag}",
+            event_pattern=events.EventPattern(
+                source=["aws.states"],
+                detail_type=["Step Functions Execution Status Change"],
+                detail={
+                    "stateMachineArn": [vmdkexport_state_machine.state_machine_arn],
+                    "status": ["SUCCEEDED", "FAILED", "TIMED_OUT", "ABORTED"]
+                }
+            ),
+            targets=[events_targets.LambdaFunction(vmdk_notify_lambda)]
+        )
+
         ##########################################################
         # </END> VMDK Export
         ##########################################################
@@ -820,6 +1552,107 @@ class VmdkExportStack(core.Stack):
             description="Vmdk Export Notification Topic Arn"
         )
 
+        core.CfnOutput(
+            self,
+            id=f"export-state-machine-arn-{CdkUtils.stack_tag}",
+            export_name=f"VmdkExport-StateMachineArn-{CdkUtils.stack_tag}",
+            value=vmdkexport_state_machine.state_machine_arn,
+            description="Vmdk Export State Machine Arn"
+        )
+
+        core.CfnOutput(
+            self,
+            id=f"export-event-bus-name-{CdkUtils.stack_tag}",
+            export_name=f"VmdkExport-EventBusName-{CdkUtils.stack_tag}",
+            value=vmdk_export_event_bus.event_bus_name,
+            description="Vmdk Export Event Bus Name"
+        )
+
+        core.CfnOutput(
+            self,
+            id=f"export-history-table-name-{CdkUtils.stack_tag}",
+            export_name=f"VmdkExport-HistoryTableName-{CdkUtils.stack_tag}",
+            value=export_history_table.table_name,
+            description="Vmdk Export Stage History Table Name"
+        )
+
+        core.CfnOutput(
+            self,
+            id=f"export-control-table-name-{CdkUtils.stack_tag}",
+            export_name=f"VmdkExport-ControlTableName-{CdkUtils.stack_tag}",
+            value=export_control_table.table_name,
+            description="Vmdk Export Control Table Name"
+        )
+
+        core.CfnOutput(
+            self,
+            id=f"ami-distribution-config-hash-{CdkUtils.stack_tag}",
+            value=ami_distribution_config_hash,
+            description="Hash of the AMI distribution settings applied by the custom resource"
+        )
+
         ##################################################
         ## </END> CDK Outputs
         ##################################################
+
+    def stage_lambda_task(self, task_id: str, stage_lambda: aws_lambda.IFunction, action: str,
+                          router_lambda: aws_lambda.IFunction = None, result_path: str = "$") -> stepfunctions_tasks.LambdaInvoke:
+        """
+            Invokes the function of a stage with the state, or the router
+            function with the action of the stage in the router layout.
+        """
+        if router_lambda is None:
+            return stepfunctions_tasks.LambdaInvoke(
+                self,
+                task_id,
+                input_path="$",
+                payload_response_only=True,
+                result_path=result_path,
+                lambda_function=stage_lambda
+            )
+        return stepfunctions_tasks.LambdaInvoke(
+            self,
+            task_id,
+            input_path="$",
+            payload_response_only=True,
+            result_path=result_path,
+            lambda_function=router_lambda,
+            payload=stepfunctions.TaskInput.from_object({
+                "action": action,
+                "state.$": "$"
+            })
+        )
+
+    def add_task_retry(self, task: stepfunctions.TaskStateBase, errors: list, retry_config: dict):
+        """
+            Retries the task on the errors with exponential backoff, as
+            configured by the retry section of the vmdkExport settings.
+        """
+        task.add_retry(
+            errors=errors,
+            interval=core.Duration.seconds(retry_config["intervalSeconds"]),
+            max_attempts=retry_config["maxAttempts"],
+            backoff_rate=retry_config["backoffRate"]
+        )
+
+    def account_list_source(self, construct_id: str, parameter_name: str, account_ids: list) -> str:
+        """
+            Stores an account list in SSM and returns the source read by the
+            ami distribution custom resource. Lists that don't fit into a single
+            standard parameter are sharded across the parameters below a path.
+        """
+        if len(",".join(account_ids)) <= self.SSM_PARAMETER_MAX_LENGTH:
+            ssm.StringListParameter(
+                self, construct_id,
+                parameter_name=parameter_name,
+                string_list_value=account_ids
+            )
+            return parameter_name
+
+        for index, shard in enumerate(CdkUtils.shard_string_list(account_ids, self.SSM_PARAMETER_MAX_LENGTH)):
+            ssm.StringListParameter(
+                self, f"{construct_id}-{index}",
+                parameter_name=f"{parameter_name}/{index}",
+                string_list_value=shard
+            )
+        return f"{parameter_name}/"
@@ -1,12 +1,17 @@
 import fnmatch
 import json
 import os
+import sys
 
 import pytest
 
 cdk_out_dir = 'cdk.out'
 suffix = 'template.json'
 
+# make the code shared by the export lambda functions importable by the tests
+common_layer_dir = os.path.join(os.path.dirname(__file__), '..', '..', 'stacks', 'vmdkexport', 'resources', 'vmexport', 'common', 'python')
+sys.path.append(os.path.abspath(common_layer_dir))
+
 
 def find(pattern, path):
     result = []
@@ -0,0 +1,121 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+ami_distribution = load_lambda_module('stacks/vmdkexport/resources/amidistribution/ami_distribution.py')
+
+DISTRIBUTION_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:distribution-configuration/ami-share-distribution-config-main"
+LICENSE_ARN = "arn:aws:license-manager:eu-west-1:111122223333:license-configuration:lic-0123456789abcdef0123456789abcdef"
+
+
+def desired_distributions():
+    return ami_distribution.get_distributions_configurations(
+        aws_distribution_regions=["eu-west-1", "us-east-1"],
+        ami_distribution_name="AmiShare-main-{{ imagebuilder:buildDate }}",
+        publishing_account_ids=["111111111111", "222222222222"],
+        sharing_account_ids=["333333333333"]
+    )
+
+
+@pytest.fixture
+def imagebuilder(monkeypatch):
+    client = boto3.client('imagebuilder', region_name="eu-west-1")
+    monkeypatch.setattr(ami_distribution.boto3, "client", lambda *args, **kwargs: client)
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def live_configuration(distributions):
+    # the live configuration contains attributes not managed by the custom resource
+    live = []
+    for distribution in reversed(distributions):
+        ami_config = dict(distribution['amiDistributionConfiguration'])
+        ami_config['targetAccountIds'] = list(reversed(ami_config['targetAccountIds']))
+        ami_config['launchPermission'] = dict(ami_config['launchPermission'], userGroups=[])
+        live.append({'region': distribution['region'], 'amiDistributionConfiguration': ami_config, 'licenseConfigurationArns': [LICENSE_ARN]})
+    return {
+        'distributionConfiguration': {
+            'arn': DISTRIBUTION_ARN,
+            'name': "ami-share-distribution-config-main",
+            'description': "AMI Distribution settings for: test",
+            'distributions': live,
+            'timeoutMinutes': 720
+        }
+    }
+
+
+def test_hash_ignores_ordering_and_unmanaged_attributes():
+    distributions = desired_distributions()
+    live = live_configuration(distributions)['distributionConfiguration']
+    assert ami_distribution.distribution_configuration_hash(
+        ami_distribution.canonical_distribution_configuration("AMI Distribution settings for: test", distributions)
+    ) == ami_distribution.distribution_configuration_hash(
+        ami_distribution.canonical_distribution_configuration(live['description'], live['distributions'])
+    )
+
+
+def test_unchanged_configuration_is_not_written(imagebuilder):
+    distributions = desired_distributions()
+    imagebuilder.add_response('get_distribution_configuration', live_configuration(distributions))
+
+    config_hash = ami_distribution.update_distribution_configuration(
+        DISTRIBUTION_ARN, "AMI Distribution settings for: test", distributions
+    )
+
+    assert len(config_hash) == 64
+
+
+def test_changed_configuration_is_written(imagebuilder):
+    distributions = desired_distributions()
+    live = live_configuration(distributions)
+    live['distributionConfiguration']['distributions'][0]['amiDistributionConfiguration']['targetAccountIds'] = ["111111111111"]
+    imagebuilder.add_response('get_distribution_configuration', live)
+    imagebuilder.add_response(
+        'update_distribution_configuration',
+        {'distributionConfigurationArn': DISTRIBUTION_ARN},
+        {
+            'distributionConfigurationArn': DISTRIBUTION_ARN,
+            'description': "AMI Distribution settings for: test",
+            'distributions': distributions
+        }
+    )
+
+    ami_distribution.update_distribution_configuration(
+        DISTRIBUTION_ARN, "AMI Distribution settings for: test", distributions
+    )
+
+
+def test_large_sharing_lists_keep_one_distribution_per_region():
+    publishing = [f"{100000000000 + i:012d}" for i in range(1000)]
+    sharing = [f"{200000000000 + i:012d}" for i in range(2000)]
+    sharing.append("arn:aws:organizations::111122223333:ou/o-a1b2c3d4e5/ou-ab12-cdef5678")
+
+    distributions = ami_distribution.get_distributions_configurations(
+        aws_distribution_regions=["eu-west-1", "us-east-1"],
+        ami_distribution_name="AmiShare-main",
+        publishing_account_ids=publishing,
+        sharing_account_ids=sharing
+    )
+
+    assert [d['region'] for d in distributions] == ["eu-west-1", "us-east-1"]
+    ami_config = distributions[0]['amiDistributionConfiguration']
+    assert ami_config['targetAccountIds'] == publishing
+    assert ami_config['launchPermission']['userIds'] == sharing[:ami_distribution.MAX_LAUNCH_PERMISSION_USER_IDS]
+    assert ami_config['launchPermission']['organizationalUnitArns'] == [sharing[-1]]
+    assert all(len(value) <= ami_distribution.MAX_TAG_VALUE_LENGTH for value in ami_config['amiTags'].values())
+    # the remaining accounts are shared with after the build
+    assert ami_distribution.overflow_sharing_user_ids(sharing) == sharing[ami_distribution.MAX_LAUNCH_PERMISSION_USER_IDS:-1]
+
+
+def test_publishing_lists_beyond_the_limit_are_rejected():
+    publishing = [f"{100000000000 + i:012d}" for i in range(ami_distribution.MAX_TARGET_ACCOUNT_IDS + 1)]
+    with pytest.raises(ValueError):
+        ami_distribution.get_distributions_configurations(["eu-west-1"], "AmiShare-main", publishing, [])
+
+
+def test_account_lists_are_parsed_from_text_and_json():
+    assert ami_distribution.parse_account_list("111111111111, 222222222222\n333333333333\n") == ["111111111111", "222222222222", "333333333333"]
+    assert ami_distribution.parse_account_list('["111111111111", "222222222222"]') == ["111111111111", "222222222222"]
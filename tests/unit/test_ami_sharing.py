@@ -0,0 +1,63 @@
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import root_dir
+
+# ami_sharing imports ami_distribution from its asset directory
+sys.path.append(os.path.join(root_dir, 'stacks', 'vmdkexport', 'resources', 'amidistribution'))
+
+import ami_sharing  # noqa: E402
+
+SHARING_SOURCE = "/main-AmiSharing/AmiSharingAccountIds/"
+CONTEXT = SimpleNamespace(invoked_function_arn="arn:aws:lambda:eu-west-1:111122223333:function:amiSharingLambda")
+
+
+def notification(status: str) -> dict:
+    image = {
+        'arn': "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1",
+        'state': {'status': status},
+        'outputResources': {'amis': [
+            {'region': "eu-west-1", 'image': "ami-0123", 'accountId': "111122223333"},
+            {'region': "eu-west-1", 'image': "ami-0456", 'accountId': "444455556666"}
+        ]}
+    }
+    return {"Records": [{"Sns": {"Message": json.dumps(image)}}]}
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    client = boto3.client('ec2', region_name="eu-west-1")
+    monkeypatch.setattr(ami_sharing.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setenv("SHARING_ACCOUNT_IDS", SHARING_SOURCE)
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_accounts_beyond_the_distribution_are_shared_in_chunks(ec2, monkeypatch):
+    sharing = [f"{200000000000 + i:012d}" for i in range(2100)]
+    monkeypatch.setattr(ami_sharing, "load_account_lists", lambda sources, region: {SHARING_SOURCE: sharing})
+
+    overflow = sharing[1536:]
+    for chunk in [overflow[:500], overflow[500:]]:
+        ec2.add_response('modify_image_attribute', {}, {
+            'ImageId': "ami-0123",
+            'Attribute': "launchPermission",
+            'LaunchPermission': {'Add': [{'UserId': user_id} for user_id in chunk]}
+        })
+
+    ami_sharing.lambda_handler(notification("AVAILABLE"), CONTEXT)
+
+
+def test_lists_within_the_distribution_limit_are_not_shared_again(ec2, monkeypatch):
+    monkeypatch.setattr(ami_sharing, "load_account_lists", lambda sources, region: {SHARING_SOURCE: ["333333333333"]})
+
+    ami_sharing.lambda_handler(notification("AVAILABLE"), CONTEXT)
+    ami_sharing.lambda_handler(notification("FAILED"), CONTEXT)
@@ -0,0 +1,56 @@
+import boto3
+from botocore.stub import Stubber
+
+from tools.backfill import execution_name, run_export
+
+STATE_MACHINE_ARN = "arn:aws:states:eu-west-1:111122223333:stateMachine:VMDKExportStateMachine"
+EXECUTION_PREFIX = "arn:aws:states:eu-west-1:111122223333:execution:VMDKExportStateMachine"
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+
+
+def test_execution_names_keep_the_digest_of_long_recipes():
+    recipe = "a-very-long-recipe-name-shared-by-all-the-versions-of-the-image-recipe"
+    first = execution_name(f"arn:aws:imagebuilder:eu-west-1:111122223333:image/{recipe}/1.0.0/1")
+    second = execution_name(f"arn:aws:imagebuilder:eu-west-1:111122223333:image/{recipe}/1.0.1/1")
+    assert first != second
+    assert len(first) == 80 and first.startswith("backfill-a-very-long")
+    assert len(execution_name(IMAGE_ARN, 3)) <= 80 and execution_name(IMAGE_ARN, 3).endswith("-3")
+    assert " " not in execution_name("arn:aws:imagebuilder:eu-west-1:111122223333:image/my recipe/1.0.0/1")
+
+
+def start(stubber, name, error=None):
+    expected = {'stateMachineArn': STATE_MACHINE_ARN, 'name': name, 'input': f'{{"image_build_version_arn": "{IMAGE_ARN}"}}'}
+    if error:
+        stubber.add_client_error('start_execution', service_error_code=error, expected_params=expected)
+    else:
+        stubber.add_response('start_execution', {'executionArn': f"{EXECUTION_PREFIX}:{name}", 'startDate': 0}, expected)
+
+
+def describe(stubber, name, status):
+    stubber.add_response('describe_execution', {
+        'executionArn': f"{EXECUTION_PREFIX}:{name}",
+        'stateMachineArn': STATE_MACHINE_ARN,
+        'status': status,
+        'startDate': 0
+    }, {'executionArn': f"{EXECUTION_PREFIX}:{name}"})
+
+
+def test_a_succeeded_earlier_backfill_is_reported():
+    stepfunctions = boto3.client('stepfunctions', region_name='eu-west-1')
+    with Stubber(stepfunctions) as stubber:
+        start(stubber, execution_name(IMAGE_ARN), error='ExecutionAlreadyExists')
+        describe(stubber, execution_name(IMAGE_ARN), "SUCCEEDED")
+        assert run_export(stepfunctions, STATE_MACHINE_ARN, IMAGE_ARN, 0) == "SUCCEEDED"
+        stubber.assert_no_pending_responses()
+
+
+def test_a_failed_earlier_backfill_is_retried_under_the_next_attempt():
+    stepfunctions = boto3.client('stepfunctions', region_name='eu-west-1')
+    with Stubber(stepfunctions) as stubber:
+        start(stubber, execution_name(IMAGE_ARN), error='ExecutionAlreadyExists')
+        describe(stubber, execution_name(IMAGE_ARN), "FAILED")
+        start(stubber, execution_name(IMAGE_ARN, 1))
+        describe(stubber, execution_name(IMAGE_ARN, 1), "RUNNING")
+        describe(stubber, execution_name(IMAGE_ARN, 1), "SUCCEEDED")
+        assert run_export(stepfunctions, STATE_MACHINE_ARN, IMAGE_ARN, 0) == "SUCCEEDED"
+        stubber.assert_no_pending_responses()
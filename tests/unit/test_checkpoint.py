@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from vmexportcommon.checkpoint import (AMI_AVAILABLE, AMI_METADATA_PUBLISHED,
+                                       EXPORT_COMPLETED, EXPORT_STARTED,
+                                       METADATA_PUBLISHED, CheckpointStore,
+                                       resume_point, resume_state)
+from vmexportcommon.export_state import ExportState
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+CHECKPOINTS = {
+    AMI_AVAILABLE: {"ami_id": "ami-0123", "ami_name": "recipe"},
+    AMI_METADATA_PUBLISHED: {"ami_id": "ami-0123"},
+    EXPORT_STARTED: {"export_image_task_id": "export-ami-1", "export_format": "VMDK", "s3_export_location": "s3://bucket/exports/"},
+    EXPORT_COMPLETED: {"s3_image_path": "s3://bucket/exports/export-ami-1.vmdk"}
+}
+
+
+@pytest.mark.parametrize("stages, expected", [
+    ((), "ami_poll"),
+    ((AMI_AVAILABLE,), "export_slot"),
+    # the export is restarted when the AMI metadata was not published
+    ((AMI_AVAILABLE, EXPORT_STARTED), "export_slot"),
+    ((AMI_AVAILABLE, AMI_METADATA_PUBLISHED, EXPORT_STARTED), "export_poll"),
+    ((AMI_AVAILABLE, AMI_METADATA_PUBLISHED, EXPORT_STARTED, EXPORT_COMPLETED), "export_metadata"),
+    ((AMI_AVAILABLE, AMI_METADATA_PUBLISHED, EXPORT_STARTED, EXPORT_COMPLETED, METADATA_PUBLISHED), "completed")
+])
+def test_resume_point_is_the_first_incomplete_stage(stages, expected):
+    checkpoints = {stage: CHECKPOINTS.get(stage, {}) for stage in stages}
+    assert resume_point(checkpoints) == expected
+
+
+def test_resume_state_restores_the_completed_stages():
+    state = resume_state(ExportState(image_build_version_arn=IMAGE_ARN), CHECKPOINTS)
+    assert state.to_dict() == {
+        "image_build_version_arn": IMAGE_ARN,
+        "resume_from": "export_metadata",
+        "ami_state": "AVAILABLE",
+        "ami_id": "ami-0123",
+        "ami_name": "recipe",
+        "export_image_task_id": "export-ami-1",
+        "export_format": "VMDK",
+        "vdmk_export_status": "COMPLETED"
+    }
+
+
+def test_checkpoints_are_one_item_per_image_build():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    store = CheckpointStore("control", retention_days=1, dynamodb_resource=dynamodb)
+    key = {'pk': f"CHECKPOINT#{IMAGE_ARN}", 'sk': "CHECKPOINT"}
+
+    with Stubber(dynamodb.meta.client) as table:
+        table.add_response('update_item', {}, {
+            'TableName': 'control',
+            'Key': key,
+            'UpdateExpression': "SET #stage = :output, #expires = :expires",
+            'ExpressionAttributeNames': {"#stage": "checkpoint_ami_available", "#expires": "expires_at"},
+            'ExpressionAttributeValues': {":output": CHECKPOINTS[AMI_AVAILABLE], ":expires": 87400}
+        })
+        table.add_response('get_item', {'Item': {
+            'pk': {'S': key['pk']},
+            'sk': {'S': "CHECKPOINT"},
+            'checkpoint_ami_available': {'M': {'ami_id': {'S': "ami-0123"}, 'ami_name': {'S': "recipe"}}},
+            'expires_at': {'N': "87400"}
+        }}, {'TableName': 'control', 'Key': key, 'ConsistentRead': True})
+
+        store.save(IMAGE_ARN, AMI_AVAILABLE, CHECKPOINTS[AMI_AVAILABLE], at=1000)
+        assert store.load(IMAGE_ARN) == {AMI_AVAILABLE: CHECKPOINTS[AMI_AVAILABLE]}
+        table.assert_no_pending_responses()
@@ -0,0 +1,99 @@
+import json
+from decimal import Decimal
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+from vmexportcommon.execution_queue import (QUEUE_PK, ExecutionQueue,
+                                            execution_name, start_queued)
+
+STATE_MACHINE_ARN = "arn:aws:states:eu-west-1:111122223333:stateMachine:export"
+ARN_1 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+ARN_2 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/other/1.0.0/1"
+
+
+@pytest.fixture
+def stubbers():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    stepfunctions = boto3.client('stepfunctions', region_name='eu-west-1')
+    with Stubber(dynamodb.meta.client) as table, Stubber(stepfunctions) as states:
+        yield ExecutionQueue("control", dynamodb_resource=dynamodb), stepfunctions, table, states
+        table.assert_no_pending_responses()
+        states.assert_no_pending_responses()
+
+
+def queued(table, *entries):
+    # entries are (image build version arn, enqueued at), in table order
+    table.add_response('query', {'Items': [
+        {
+            'pk': {'S': QUEUE_PK},
+            'sk': {'S': arn},
+            'execution_input': {'S': json.dumps({"image_build_version_arn": arn})},
+            'enqueued_at': {'N': str(enqueued_at)}
+        } for arn, enqueued_at in entries
+    ]}, {
+        'TableName': "control",
+        'KeyConditionExpression': "pk = :pk",
+        'ExpressionAttributeValues': {':pk': QUEUE_PK},
+        'ConsistentRead': True
+    })
+
+
+def running(states, count):
+    states.add_response('list_executions', {'executions': [{
+        'executionArn': f"{STATE_MACHINE_ARN}:run-{i}", 'stateMachineArn': STATE_MACHINE_ARN, 'name': f"run-{i}",
+        'status': "RUNNING", 'startDate': "2021-10-01T10:00:00Z"
+    } for i in range(count)]}, {'stateMachineArn': STATE_MACHINE_ARN, 'statusFilter': "RUNNING"})
+
+
+def removed(table, arn, enqueued_at):
+    table.add_response('delete_item', {}, {
+        'TableName': "control",
+        'Key': {'pk': QUEUE_PK, 'sk': arn},
+        'ConditionExpression': "enqueued_at = :enqueued_at",
+        'ExpressionAttributeValues': {':enqueued_at': Decimal(str(enqueued_at))}
+    })
+
+
+def test_oldest_request_is_started_when_an_execution_ends(stubbers):
+    queue, stepfunctions, table, states = stubbers
+    queued(table, (ARN_2, 20), (ARN_1, 10))
+    running(states, 0)
+    states.add_response('start_execution', {'executionArn': f"{STATE_MACHINE_ARN}:queued", 'startDate': "2021-10-01T10:00:00Z"}, {
+        'stateMachineArn': STATE_MACHINE_ARN,
+        'name': execution_name({'sk': ARN_1, 'enqueued_at': Decimal("10")}),
+        'input': json.dumps({"image_build_version_arn": ARN_1})
+    })
+    removed(table, ARN_1, 10)
+
+    assert start_queued(stepfunctions, STATE_MACHINE_ARN, queue, max_running=1) == [ARN_1]
+
+
+def test_requests_stay_queued_while_the_limit_is_reached(stubbers):
+    queue, stepfunctions, table, states = stubbers
+    queued(table, (ARN_1, 10))
+    running(states, 1)
+
+    assert start_queued(stepfunctions, STATE_MACHINE_ARN, queue, max_running=1) == []
+
+
+def test_request_started_by_another_handler_is_removed(stubbers):
+    queue, stepfunctions, table, states = stubbers
+    queued(table, (ARN_1, 10), (ARN_2, 20))
+    states.add_client_error('start_execution', service_error_code='ExecutionAlreadyExists', expected_params={
+        'stateMachineArn': STATE_MACHINE_ARN, 'name': ANY, 'input': ANY
+    })
+    removed(table, ARN_1, 10)
+    states.add_response('start_execution', {'executionArn': f"{STATE_MACHINE_ARN}:queued", 'startDate': "2021-10-01T10:00:00Z"}, {
+        'stateMachineArn': STATE_MACHINE_ARN, 'name': ANY, 'input': ANY
+    })
+    removed(table, ARN_2, 20)
+
+    # without a limit every queued request is started
+    assert start_queued(stepfunctions, STATE_MACHINE_ARN, queue, max_running=0) == [ARN_1, ARN_2]
+
+
+def test_redelivered_requests_are_queued_once(stubbers):
+    queue, stepfunctions, table, states = stubbers
+    table.add_client_error('put_item', service_error_code='ConditionalCheckFailedException')
+    queue.add(ARN_1, {"image_build_version_arn": ARN_1}, now=10)
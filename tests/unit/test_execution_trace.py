@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+
+from tools.execution_trace import chrome_trace, read_histories
+
+START = datetime(2021, 10, 1, 10, 0, 0, tzinfo=timezone.utc)
+
+
+def history_event(event_id: int, seconds: float, event_type: str, previous: int = 0, **details) -> dict:
+    event = {"id": event_id, "previousEventId": previous, "timestamp": START + timedelta(seconds=seconds), "type": event_type}
+    event.update(details)
+    return event
+
+
+def poll_history() -> list:
+    lambda_arn = "arn:aws:lambda:eu-west-1:111122223333:function:imageBuilderPollLambda"
+    return [
+        history_event(1, 0, "ExecutionStarted"),
+        history_event(2, 0, "WaitStateEntered", 1, stateEnteredEventDetails={"name": "AMIAvailableWaitTask"}),
+        history_event(3, 180, "WaitStateExited", 2, stateExitedEventDetails={"name": "AMIAvailableWaitTask"}),
+        history_event(4, 180, "TaskStateEntered", 3, stateEnteredEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(5, 180.1, "LambdaFunctionScheduled", 4, lambdaFunctionScheduledEventDetails={"resource": lambda_arn}),
+        history_event(6, 180.2, "LambdaFunctionStarted", 5),
+        history_event(7, 180.9, "LambdaFunctionSucceeded", 6),
+        history_event(8, 181, "TaskStateExited", 7, stateExitedEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(9, 181, "ChoiceStateEntered", 8, stateEnteredEventDetails={"name": "AMIPollCheckTask"})
+    ]
+
+
+def spans(trace: dict) -> list:
+    return [(e["name"], e["cat"], e["tid"], e["ts"], e["dur"]) for e in trace["traceEvents"] if e["ph"] == "X"]
+
+
+def test_states_and_invocations_become_spans():
+    trace = chrome_trace([("run-1", poll_history())])
+    assert spans(trace) == [
+        ("AMIAvailableWaitTask", "Wait", 1, 0, 180_000_000),
+        ("imageBuilderPollLambda", "LambdaFunctionSucceeded", 2, 180_100_000, 800_000),
+        ("AMIPollLambdaTask", "Task", 1, 180_000_000, 1_000_000),
+        ("AMIPollCheckTask", "Choice", 1, 181_000_000, 0)
+    ]
+
+
+def test_executions_are_aligned_unless_absolute():
+    late = [dict(e, timestamp=e["timestamp"] + timedelta(hours=1)) for e in poll_history()]
+    trace = chrome_trace([("run-1", poll_history()), ("run-2", late)])
+    by_process = {}
+    for event in trace["traceEvents"]:
+        if event["ph"] == "X":
+            by_process.setdefault(event["pid"], []).append(event["ts"])
+    assert by_process[1] == by_process[2]
+
+    absolute = chrome_trace([("run-2", late)], absolute=True)
+    assert spans(absolute)[0][3] == int((START + timedelta(hours=1)).timestamp() * 1_000_000)
+
+
+def test_saved_histories_are_read_offline(tmp_path):
+    path = tmp_path / "run-1.json"
+    path.write_text('{"executionArn": "arn:aws:states:eu-west-1:111122223333:execution:sm:run-1", "events": ['
+                    '{"id": 1, "previousEventId": 0, "timestamp": "2021-10-01T10:00:00Z", "type": "ExecutionStarted"}]}')
+    assert read_histories([str(path)]) == [("run-1", [
+        {"id": 1, "previousEventId": 0, "timestamp": "2021-10-01T10:00:00Z", "type": "ExecutionStarted"}
+    ])]
+
+
+def test_interleaved_map_iterations_are_paired_by_their_event_chain():
+    iteration = "mapIterationStartedEventDetails"
+    history = [
+        history_event(1, 0, "ExecutionStarted"),
+        history_event(2, 0, "MapStateEntered", 1, stateEnteredEventDetails={"name": "ExportMap"}),
+        history_event(3, 0, "MapStateStarted", 2),
+        history_event(4, 0, "MapIterationStarted", 3, **{iteration: {"name": "ExportMap", "index": 0}}),
+        history_event(5, 0, "MapIterationStarted", 3, **{iteration: {"name": "ExportMap", "index": 1}}),
+        history_event(6, 0, "TaskStateEntered", 4, stateEnteredEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(7, 1, "TaskStateEntered", 5, stateEnteredEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(8, 5, "TaskStateExited", 7, stateExitedEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(9, 10, "TaskStateExited", 6, stateExitedEventDetails={"name": "AMIPollLambdaTask"}),
+        history_event(10, 10, "MapIterationSucceeded", 9),
+        history_event(11, 10, "MapIterationSucceeded", 8),
+        history_event(12, 11, "MapStateSucceeded", 11),
+        history_event(13, 11, "MapStateExited", 12, stateExitedEventDetails={"name": "ExportMap"})
+    ]
+
+    assert spans(chrome_trace([("batch", history)])) == [
+        ("AMIPollLambdaTask", "Task", 102, 1_000_000, 4_000_000),
+        ("AMIPollLambdaTask", "Task", 100, 0, 10_000_000),
+        ("ExportMap", "Map", 1, 0, 11_000_000)
+    ]
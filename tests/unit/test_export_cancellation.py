@@ -0,0 +1,97 @@
+import json
+from datetime import datetime
+
+import boto3
+from botocore.stub import Stubber
+from vmexportcommon.export_cancellation import (ExportCanceller,
+                                                export_task_ids,
+                                                plan_supersede, supersedes)
+
+RECIPE = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe"
+STATE_MACHINE_ARN = "arn:aws:states:eu-west-1:111122223333:stateMachine:export"
+EXECUTION_ARN = "arn:aws:states:eu-west-1:111122223333:execution:export:old"
+
+
+def running(name, *arns):
+    return {"name": name, "executionArn": f"{STATE_MACHINE_ARN}:{name}", "image_build_version_arns": list(arns)}
+
+
+def test_newer_builds_of_the_same_recipe_supersede():
+    assert supersedes(f"{RECIPE}/1.0.0/2", f"{RECIPE}/1.0.0/1")
+    assert supersedes(f"{RECIPE}/1.0.10/1", f"{RECIPE}/1.0.9/3")
+    assert not supersedes(f"{RECIPE}/1.0.0/1", f"{RECIPE}/1.0.0/2")
+    assert not supersedes(f"{RECIPE}-other/1.0.0/2", f"{RECIPE}/1.0.0/1")
+
+
+def test_plan_supersedes_only_single_exports_of_older_builds():
+    single = running("single", f"{RECIPE}/1.0.0/1")
+    batch = running("batch", f"{RECIPE}/1.0.0/1", f"{RECIPE}-other/1.0.0/1")
+    backfill = running("backfill-recipe-0123", f"{RECIPE}/0.9.0/1")
+    other = running("other", f"{RECIPE}-other/2.0.0/1")
+
+    start, stale = plan_supersede(f"{RECIPE}/1.0.0/2", [single, batch, backfill, other])
+    assert start
+    assert stale == [single]
+
+
+def test_builds_of_other_pipelines_are_not_superseded():
+    pipelines = {
+        f"{RECIPE}/1.0.0/1": "arn:aws:imagebuilder:eu-west-1:111122223333:image-pipeline/nightly",
+        f"{RECIPE}/1.0.0/2": "arn:aws:imagebuilder:eu-west-1:111122223333:image-pipeline/release",
+        f"{RECIPE}/1.0.0/3": "arn:aws:imagebuilder:eu-west-1:111122223333:image-pipeline/nightly"
+    }
+    nightly = running("nightly", f"{RECIPE}/1.0.0/1")
+
+    assert not supersedes(f"{RECIPE}/1.0.0/2", f"{RECIPE}/1.0.0/1", pipelines.get)
+    assert supersedes(f"{RECIPE}/1.0.0/3", f"{RECIPE}/1.0.0/1", pipelines.get)
+    assert plan_supersede(f"{RECIPE}/1.0.0/2", [nightly], pipelines.get) == (True, [])
+    assert plan_supersede(f"{RECIPE}/1.0.0/3", [nightly], pipelines.get) == (True, [nightly])
+
+
+def test_pipelines_are_read_from_the_image_descriptors():
+    class Descriptors():
+        def describe(self, arn):
+            return {"arn": arn, "sourcePipelineArn": "pipeline-" + arn[-1]}
+
+    canceller = ExportCanceller(STATE_MACHINE_ARN, stepfunctions_client=object(), ec2_client=object(), descriptors=Descriptors())
+    assert canceller.pipeline_arn(f"{RECIPE}/1.0.0/2") == "pipeline-2"
+
+
+def test_plan_skips_duplicate_and_stale_builds():
+    newer = running("newer", f"{RECIPE}/1.0.0/3")
+    assert plan_supersede(f"{RECIPE}/1.0.0/3", [newer]) == (False, [])
+    assert plan_supersede(f"{RECIPE}/1.0.0/2", [newer]) == (False, [])
+
+
+def test_export_task_ids_are_read_from_task_outputs():
+    events = [
+        {'type': 'ExecutionStarted', 'executionStartedEventDetails': {'input': '{}'}},
+        {'type': 'TaskSucceeded', 'taskSucceededEventDetails': {
+            'output': json.dumps({"Output": json.dumps({"export_image_task_id": "export-ami-1"})})
+        }},
+        {'type': 'LambdaFunctionSucceeded', 'lambdaFunctionSucceededEventDetails': {
+            'output': json.dumps({"export_image_task_id": "export-ami-1", "vdmk_export_status": "ACTIVE"})
+        }}
+    ]
+    assert export_task_ids(events) == ["export-ami-1"]
+
+
+def test_cancel_stops_the_execution_before_cancelling_the_export():
+    stepfunctions = boto3.client('stepfunctions', region_name='eu-west-1')
+    ec2 = boto3.client('ec2', region_name='eu-west-1')
+    canceller = ExportCanceller(STATE_MACHINE_ARN, stepfunctions_client=stepfunctions, ec2_client=ec2)
+    execution = {"name": "old", "executionArn": EXECUTION_ARN, "image_build_version_arns": [f"{RECIPE}/1.0.0/1"]}
+
+    with Stubber(stepfunctions) as states, Stubber(ec2) as ec2_stubber:
+        states.add_response('stop_execution', {'stopDate': datetime(2021, 9, 1)}, {
+            'executionArn': EXECUTION_ARN, 'error': "Superseded", 'cause': "Superseded by new"
+        })
+        states.add_response('get_execution_history', {'events': [{
+            'timestamp': datetime(2021, 9, 1), 'type': 'LambdaFunctionSucceeded', 'id': 9,
+            'lambdaFunctionSucceededEventDetails': {'output': json.dumps({"export_image_task_id": "export-ami-1"})}
+        }]}, {'executionArn': EXECUTION_ARN})
+        ec2_stubber.add_response('cancel_export_task', {}, {'ExportTaskId': "export-ami-1"})
+
+        assert canceller.cancel(execution, error="Superseded", cause="Superseded by new") == ["export-ami-1"]
+        states.assert_no_pending_responses()
+        ec2_stubber.assert_no_pending_responses()
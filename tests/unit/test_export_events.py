@@ -0,0 +1,71 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+from vmexportcommon.export_events import (COMPLETED_DETAIL_TYPE,
+                                          SCHEMA_VERSION, completion_detail,
+                                          failure_detail,
+                                          publish_completion_event)
+
+SCHEMA_PATH = "stacks/vmdkexport/resources/schemas/vmdk_export_completed.json"
+
+EVENT = {
+    "image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1",
+    "ami_id": "ami-0123456789abcdef0",
+    "ami_name": "AmiShare-main-2021-10-01",
+    "export_format": "VMDK",
+    "stage_times": {"execution_started": 1633082400.0, "ami_available": 1633084200.0}
+}
+EXPORT_TASK = {
+    "ExportImageTaskId": "export-ami-0123456789abcdef0",
+    "S3ExportLocation": {"S3Bucket": "exports-bucket", "S3Prefix": "exports/"}
+}
+
+
+def detail(head: dict) -> dict:
+    return completion_detail(EVENT, EXPORT_TASK, "exports/export-ami-0123456789abcdef0.vmdk", head, 1633087800.0)
+
+
+def test_completion_detail_fields():
+    result = detail({"ContentLength": 1073741824, "ETag": '"9b2cf535f27731c974343645a3985328-128"'})
+    assert result["version"] == SCHEMA_VERSION
+    assert result["export"]["uri"] == "s3://exports-bucket/exports/export-ami-0123456789abcdef0.vmdk"
+    assert result["export"]["size_bytes"] == 1073741824
+    assert result["export"]["checksum"] == {"algorithm": "S3_ETAG", "value": "9b2cf535f27731c974343645a3985328-128"}
+    assert result["timings"]["available_to_published_seconds"] == 3600
+    assert result["timings"]["total_seconds"] == 5400
+    assert result["timings"]["export_started_at"] is None
+
+
+def test_sha256_checksum_is_preferred():
+    result = detail({"ContentLength": 1, "ETag": '"abc"', "ChecksumSHA256": "n4bQgYhMfWWaL+qgxVrQFaO/TxsrC4Is0V1sFbDwCgg="})
+    assert result["export"]["checksum"]["algorithm"] == "SHA256"
+
+
+def test_completion_detail_matches_registered_schema():
+    jsonschema = pytest.importorskip("jsonschema")
+    with open(SCHEMA_PATH) as schema_file:
+        schema = json.load(schema_file)
+    jsonschema.validate({
+        "detail-type": COMPLETED_DETAIL_TYPE,
+        "source": "vmdkexport",
+        "detail": detail({"ContentLength": 1, "ETag": '"abc"'})
+    }, schema)
+
+
+def test_failed_entries_raise():
+    events = boto3.client('events', region_name='eu-west-1')
+    with Stubber(events) as stubber:
+        stubber.add_response('put_events', {'FailedEntryCount': 1, 'Entries': [{'ErrorCode': 'InternalFailure'}]}, {'Entries': ANY})
+        with pytest.raises(RuntimeError):
+            publish_completion_event("bus", detail({}), events_client=events)
+
+
+def test_failure_detail_carries_reason():
+    event = dict(EVENT, export_image_task_id="export-ami-1", failure={
+        "stage": "export", "status": "DELETED", "reason": "ClientError: Unsupported kernel version"
+    })
+    result = failure_detail(event, 1633087800.0)
+    assert result["failure"] == {"stage": "export", "status": "DELETED", "reason": "ClientError: Unsupported kernel version"}
+    assert result["timings"]["total_seconds"] == 5400
@@ -0,0 +1,51 @@
+import boto3
+from botocore.stub import ANY, Stubber
+from vmexportcommon.export_progress import (ProgressPublisher,
+                                            estimate_eta_seconds, observe,
+                                            progress_detail)
+
+EVENT = {
+    "image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1",
+    "ami_id": "ami-0123456789abcdef0",
+    "export_image_task_id": "export-ami-0123456789abcdef0"
+}
+
+
+def test_eta_from_observed_rate():
+    # 20% in 10 minutes leaves 60% for 30 minutes
+    assert estimate_eta_seconds(20, 0, 40, 600) == 1800
+    assert estimate_eta_seconds(20, 0, 20, 600) is None
+    assert estimate_eta_seconds(20, 0, 100, 600) == 0
+
+
+def test_progress_is_only_published_on_change():
+    events = boto3.client('events', region_name='eu-west-1')
+    publisher = ProgressPublisher("bus", events_client=events)
+
+    with Stubber(events) as stubber:
+        stubber.add_response('put_events', {'FailedEntryCount': 0, 'Entries': [{'EventId': '1'}]}, {
+            'Entries': [{
+                'Source': 'vmdkexport',
+                'DetailType': 'VMDK Export Progress',
+                'Detail': ANY,
+                'EventBusName': 'bus',
+                'Resources': [EVENT["image_build_version_arn"]]
+            }]
+        })
+        stubber.add_response('put_events', {'FailedEntryCount': 0, 'Entries': [{'EventId': '2'}]}, {'Entries': ANY})
+
+        state = publisher.publish(EVENT, observe(None, "ACTIVE", 10, "converting", 0))
+        state = publisher.publish(EVENT, observe(state, "ACTIVE", 10, "converting", 180))
+        state = publisher.publish(EVENT, observe(state, "ACTIVE", 25, "converting", 360))
+        stubber.assert_no_pending_responses()
+
+    assert state["published_progress"] == 25
+    assert state["eta_seconds"] == 1800
+
+
+def test_progress_detail_carries_eta():
+    state = observe(observe(None, "ACTIVE", 50, "", 0), "ACTIVE", 75, "", 600)
+    detail = progress_detail(EVENT, state)
+    assert detail["progress"] == 75
+    assert detail["eta_seconds"] == 600
+    assert detail["eta"] == "1970-01-01T00:20:00+00:00"
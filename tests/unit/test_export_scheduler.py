@@ -0,0 +1,149 @@
+from decimal import Decimal
+from types import SimpleNamespace
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+from vmexportcommon import export_scheduler
+from vmexportcommon.export_scheduler import (PRIORITIES, ExportScheduler,
+                                             priority_for, queue_key,
+                                             slot_available)
+
+
+def test_priority_defaults_for_unknown_classes():
+    assert priority_for({}) == PRIORITIES["default"]
+    assert priority_for({"export_priority": "weekly"}) == PRIORITIES["default"]
+    assert priority_for({"export_priority": "Release"}) == PRIORITIES["release"]
+
+
+def test_release_builds_are_queued_ahead_of_nightlies():
+    nightly = queue_key(priority_for({"export_priority": "nightly"}), 1000.0, "nightly-build")
+    release = queue_key(priority_for({"export_priority": "release"}), 2000.0, "release-build")
+    assert sorted([nightly, release]) == [release, nightly]
+
+
+def test_same_priority_is_first_in_first_out():
+    first = queue_key(5, 999.5, "b")
+    second = queue_key(5, 1000.25, "a")
+    assert sorted([second, first]) == [first, second]
+
+
+def test_slot_available_only_for_queue_head():
+    queue = [queue_key(0, 1, "a"), queue_key(5, 2, "b"), queue_key(9, 3, "c")]
+    holders = {"x": 1, "y": 1, "z": 1}
+    assert slot_available(holders, queue, queue[1], slot_limit=5)
+    assert not slot_available(holders, queue, queue[2], slot_limit=5)
+
+
+def test_no_slot_available_when_quota_is_used():
+    queue = [queue_key(0, 1, "a")]
+    holders = {f"holder-{i}": 1 for i in range(5)}
+    assert not slot_available(holders, queue, queue[0], slot_limit=5)
+
+
+NOW = 1_000_000
+DEAD_KEY = queue_key(0, 1, "dead")
+OWN_KEY = queue_key(5, 2, "own")
+SLOTS_KEY = {'pk': "SLOTS#eu-west-1", 'sk': "SLOTS"}
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(export_scheduler, "time", SimpleNamespace(time=lambda: float(NOW)))
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    with Stubber(dynamodb.meta.client) as stubber:
+        yield ExportScheduler("control", "eu-west-1", slot_limit=1, dynamodb_resource=dynamodb), stubber
+        stubber.assert_no_pending_responses()
+
+
+def holders(stubber, slots: dict):
+    stubber.add_response('get_item', {
+        'Item': {'pk': {'S': "SLOTS#eu-west-1"}, 'sk': {'S': "SLOTS"}, 'holders': {'M': {holder: {'N': str(at)} for holder, at in slots.items()}}}
+    }, {'TableName': "control", 'Key': SLOTS_KEY, 'ConsistentRead': True})
+
+
+def queue_page(stubber, entries: list, more: bool = False, next_page: bool = False):
+    response = {'Items': [
+        {'sk': {'S': key}, 'holder': {'S': key.split("#")[-1]}, 'lease_until': {'N': str(lease_until)}}
+        for key, lease_until in entries
+    ]}
+    if more:
+        response['LastEvaluatedKey'] = {'pk': {'S': "QUEUE#eu-west-1"}, 'sk': {'S': entries[-1][0]}}
+    stubber.add_response('query', response, {
+        'TableName': "control",
+        'KeyConditionExpression': "pk = :pk",
+        'ExpressionAttributeValues': {':pk': "QUEUE#eu-west-1"},
+        'ProjectionExpression': "sk, holder, lease_until",
+        'ConsistentRead': True,
+        'Limit': 1,
+        **({'ExclusiveStartKey': ANY} if next_page else {})
+    })
+
+
+ANY_PARAMS = {
+    'TableName': "control",
+    'Key': ANY,
+    'UpdateExpression': ANY,
+    'ConditionExpression': ANY,
+    'ExpressionAttributeNames': ANY,
+    'ExpressionAttributeValues': ANY
+}
+
+
+def test_expired_queue_entries_are_reclaimed_and_skipped(scheduler):
+    scheduler, stubber = scheduler
+    holders(stubber, {})
+    queue_page(stubber, [(DEAD_KEY, NOW - 1)], more=True)
+    stubber.add_response('delete_item', {}, {
+        'TableName': "control",
+        'Key': {'pk': "QUEUE#eu-west-1", 'sk': DEAD_KEY},
+        'ConditionExpression': "attribute_not_exists(lease_until) OR lease_until = :lease_until",
+        'ExpressionAttributeValues': {':lease_until': Decimal(NOW - 1)}
+    })
+    queue_page(stubber, [(OWN_KEY, NOW + 600)], next_page=True)
+    stubber.add_response('update_item', {}, ANY_PARAMS)
+    stubber.add_response('delete_item', {}, {'TableName': "control", 'Key': {'pk': "QUEUE#eu-west-1", 'sk': OWN_KEY}})
+
+    assert scheduler.try_acquire("own", OWN_KEY)
+
+
+def test_a_live_queue_head_keeps_later_exports_waiting(scheduler):
+    scheduler, stubber = scheduler
+    holders(stubber, {})
+    queue_page(stubber, [(DEAD_KEY, NOW + 60)])
+
+    assert not scheduler.try_acquire("own", OWN_KEY)
+
+
+def test_expired_slots_are_reclaimed(scheduler):
+    scheduler, stubber = scheduler
+    holders(stubber, {"dead": NOW - export_scheduler.DEFAULT_LEASE_SECONDS - 1})
+    stubber.add_response('update_item', {}, {
+        'TableName': "control",
+        'Key': SLOTS_KEY,
+        'UpdateExpression': "REMOVE holders.#h",
+        'ConditionExpression': "holders.#h = :acquired_at",
+        'ExpressionAttributeNames': {'#h': "dead"},
+        'ExpressionAttributeValues': {':acquired_at': Decimal(NOW - export_scheduler.DEFAULT_LEASE_SECONDS - 1)}
+    })
+    queue_page(stubber, [(OWN_KEY, NOW + 600)])
+    stubber.add_response('update_item', {}, ANY_PARAMS)
+    stubber.add_response('delete_item', {}, {'TableName': "control", 'Key': {'pk': "QUEUE#eu-west-1", 'sk': OWN_KEY}})
+
+    assert scheduler.try_acquire("own", OWN_KEY)
+
+
+def test_refresh_renews_the_queue_lease(scheduler):
+    scheduler, stubber = scheduler
+    stubber.add_response('put_item', {}, {
+        'TableName': "control",
+        'Item': {
+            'pk': "QUEUE#eu-west-1",
+            'sk': OWN_KEY,
+            'holder': "own",
+            'lease_until': Decimal(NOW + export_scheduler.DEFAULT_QUEUE_LEASE_SECONDS),
+            'expires_at': Decimal(NOW + export_scheduler.DEFAULT_QUEUE_LEASE_SECONDS + export_scheduler.QUEUE_RETENTION_SECONDS)
+        }
+    })
+
+    scheduler.refresh("own", OWN_KEY)
@@ -0,0 +1,63 @@
+import io
+import json
+
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+from vmexportcommon.export_state import ExportState, InvalidExportState
+from vmexportcommon.stage_history import record_stage
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+
+
+def test_state_drops_unknown_fields_and_validates_types():
+    state = ExportState.from_event({"image_build_version_arn": IMAGE_ARN, "statusCode": 200, "ami_id": "ami-0123"})
+    assert state.to_dict() == {"image_build_version_arn": IMAGE_ARN, "ami_id": "ami-0123"}
+
+    with pytest.raises(InvalidExportState):
+        state["export_slot_status"] = "MAYBE"
+    with pytest.raises(InvalidExportState):
+        state["ami_id"] = ["ami-0123"]
+    with pytest.raises(InvalidExportState):
+        state["headers"] = {}
+    with pytest.raises(InvalidExportState):
+        ExportState.from_event({"ami_id": "ami-0123"})
+
+
+def test_state_works_with_the_shared_helpers(monkeypatch):
+    monkeypatch.delenv("EXPORT_HISTORY_TABLE", raising=False)
+    state = ExportState(image_build_version_arn=IMAGE_ARN)
+    record_stage(state, "ami_available", at=1000.0)
+    assert state.stage_times == {"ami_available": 1000.0}
+    assert "ami_id" not in state
+    assert state.get("ami_id", "n/a") == "n/a"
+
+
+def test_large_states_are_claim_checked_and_restored():
+    s3 = boto3.client('s3', region_name='eu-west-1')
+    state = ExportState(
+        image_build_version_arn=IMAGE_ARN,
+        execution={"name": "run-1"},
+        vdmk_export_status="FAILED",
+        task_error={"Error": "States.TaskFailed", "Cause": "x" * 2048}
+    )
+
+    with Stubber(s3) as stubber:
+        stubber.add_response('put_object', {}, {'Bucket': 'bucket', 'Key': ANY, 'Body': ANY, 'ContentType': 'application/json'})
+        payload = state.to_payload(bucket="bucket", threshold_bytes=1024, s3_client=s3)
+        stubber.assert_no_pending_responses()
+
+    # routing fields stay inline for the Choice states
+    assert payload["vdmk_export_status"] == "FAILED"
+    assert "task_error" not in payload
+    assert payload["claim_check"]["key"].startswith("claim-checks/run-1/")
+    assert payload["claim_check"]["fields"] == ["task_error"]
+
+    stored = json.dumps({"task_error": state.task_error}).encode("utf-8")
+    with Stubber(s3) as stubber:
+        stubber.add_response('get_object', {'Body': io.BytesIO(stored)}, {'Bucket': 'bucket', 'Key': payload["claim_check"]["key"]})
+        restored = ExportState.from_event(payload, s3_client=s3)
+
+    assert restored.to_dict() == state.to_dict()
+    # small states are passed inline
+    assert "claim_check" not in ExportState(image_build_version_arn=IMAGE_ARN).to_payload(bucket="bucket", threshold_bytes=1024)
@@ -0,0 +1,110 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+exportpreflight = load_lambda_module(
+    'stacks/vmdkexport/resources/vmexport/exportpreflight/exportpreflight_function.py')
+
+KMS_KEY_ARN = "arn:aws:kms:eu-west-1:111122223333:key/export"
+ROLE_ARN = "arn:aws:iam::111122223333:role/vmimport"
+TRUST_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [{
+        "Effect": "Allow",
+        "Principal": {"Service": "vmie.amazonaws.com"},
+        "Action": "sts:AssumeRole",
+        "Condition": {"StringEquals": {"sts:Externalid": "vmimport"}}
+    }]
+}
+IMAGE = {
+    'ImageId': "ami-0123",
+    'State': "available",
+    'RootDeviceType': "ebs",
+    'PlatformDetails': "Linux/UNIX",
+    'BlockDeviceMappings': [{'DeviceName': "/dev/xvda", 'Ebs': {'SnapshotId': "snap-1", 'VolumeType': "gp3", 'Encrypted': True}}]
+}
+SNAPSHOT = {'SnapshotId': "snap-1", 'VolumeId': "vol-1", 'State': "completed", 'Encrypted': True, 'KmsKeyId': KMS_KEY_ARN}
+
+
+def reasons_of(image: dict, kms_key_ids: dict = None) -> list:
+    return exportpreflight.image_reasons(image, ("legacy-bios",), ("gp2", "gp3"), (KMS_KEY_ARN,), kms_key_ids or {"snap-1": KMS_KEY_ARN})
+
+
+def test_exportable_image_has_no_reasons():
+    assert reasons_of(IMAGE) == []
+
+
+@pytest.mark.parametrize("changes, reason", [
+    ({'ProductCodes': [{'ProductCodeId': "abc123", 'ProductCodeType': "marketplace"}]}, "product codes abc123"),
+    ({'PlatformDetails': "Windows"}, "license included"),
+    ({'BootMode': "uefi"}, "boots with uefi"),
+    ({'BlockDeviceMappings': [{'DeviceName': "/dev/sdb", 'VirtualName': "ephemeral0"}]}, "instance store"),
+    ({'BlockDeviceMappings': [{'DeviceName': "/dev/xvda", 'Ebs': {'VolumeType': "sc1"}}]}, "sc1 volume"),
+    ({'BlockDeviceMappings': [{'DeviceName': "/dev/xvda", 'Ebs': {'SnapshotId': "snap-2", 'VolumeType': "gp3", 'Encrypted': True}}]}, "unknown key")
+])
+def test_ineligible_images_name_the_reason(changes, reason):
+    reasons = reasons_of(dict(IMAGE, **changes))
+    assert len(reasons) == 1
+    assert reason in reasons[0]
+
+
+def test_snapshots_encrypted_with_another_key_are_reported():
+    ec2 = boto3.client('ec2', region_name="eu-west-1")
+    default_key = "arn:aws:kms:eu-west-1:111122223333:key/aws-ebs"
+    with Stubber(ec2) as stubber:
+        stubber.add_response('describe_snapshots', {'Snapshots': [dict(SNAPSHOT, KmsKeyId=default_key)]}, {'SnapshotIds': ["snap-1"]})
+        kms_key_ids = exportpreflight.snapshot_kms_key_ids(ec2, IMAGE)
+
+    assert kms_key_ids == {"snap-1": default_key}
+    reasons = reasons_of(IMAGE, kms_key_ids)
+    assert len(reasons) == 1
+    assert f"encrypted with {default_key}" in reasons[0]
+
+
+def test_trust_policy_requires_the_vmimport_external_id():
+    assert exportpreflight.trusts_vmie(TRUST_POLICY)
+    statement = dict(TRUST_POLICY["Statement"][0], Condition={})
+    assert not exportpreflight.trusts_vmie({"Statement": [statement]})
+
+
+def test_role_without_bucket_permissions_is_reported():
+    iam = boto3.client('iam', region_name="eu-west-1")
+    s3 = boto3.client('s3', region_name="eu-west-1")
+    with Stubber(iam) as iam_stubber, Stubber(s3) as s3_stubber:
+        iam_stubber.add_response('get_role', {'Role': {
+            'Path': "/", 'RoleName': "vmimport", 'RoleId': "AROAEXAMPLE000000000", 'Arn': ROLE_ARN,
+            'CreateDate': "2021-09-01T00:00:00Z", 'AssumeRolePolicyDocument': json.dumps(TRUST_POLICY)
+        }}, {'RoleName': "vmimport"})
+        s3_stubber.add_client_error('get_bucket_policy', service_error_code='NoSuchBucketPolicy')
+        iam_stubber.add_response('simulate_principal_policy', {'EvaluationResults': [
+            {'EvalActionName': action, 'EvalDecision': "allowed"} for action in exportpreflight.BUCKET_ACTIONS
+        ]})
+        iam_stubber.add_response('simulate_principal_policy', {'EvaluationResults': [
+            {'EvalActionName': "s3:GetObject", 'EvalDecision': "allowed"},
+            {'EvalActionName': "s3:PutObject", 'EvalDecision': "implicitDeny"}
+        ]})
+        reasons = exportpreflight.role_reasons(iam, s3, "vmimport", "bucket")
+    assert reasons == ["The vmimport role is not allowed s3:PutObject on the bucket bucket, grant them to the role"]
+
+
+def test_ineligible_ami_fails_the_preflight(monkeypatch):
+    ec2 = boto3.client('ec2', region_name="eu-west-1")
+    monkeypatch.setattr(exportpreflight.boto3, "client", lambda *args, **kwargs: ec2)
+    monkeypatch.setattr(exportpreflight, "checked_role_reasons", lambda *args: [])
+    monkeypatch.setenv("EXPORT_BUCKET", "bucket")
+    monkeypatch.setenv("EXPORT_ROLE", "vmimport")
+    monkeypatch.setenv("EXPORT_KMS_KEY_ARNS", KMS_KEY_ARN)
+    event = {"image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1", "ami_id": "ami-0123"}
+
+    with Stubber(ec2) as stubber:
+        stubber.add_response('describe_images', {'Images': [dict(IMAGE, BootMode="uefi")]}, {'ImageIds': ["ami-0123"]})
+        stubber.add_response('describe_snapshots', {'Snapshots': [SNAPSHOT]}, {'SnapshotIds': ["snap-1"]})
+        state = exportpreflight.lambda_handler(event, None)
+
+    assert state["export_eligible"] is False
+    assert state["failure"]["stage"] == "preflight"
+    assert "boots with uefi" in state["failure"]["reason"]
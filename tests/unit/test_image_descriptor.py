@@ -0,0 +1,52 @@
+import json
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+from vmexportcommon import image_descriptor
+from vmexportcommon.image_descriptor import ImageDescriptorCache
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+AVAILABLE = {'state': {'status': 'AVAILABLE'}, 'outputResources': {'amis': [{'image': 'ami-0123', 'name': 'recipe'}]}}
+
+
+@pytest.fixture(autouse=True)
+def clear_memory():
+    image_descriptor.clear_memory()
+
+
+def test_only_available_images_are_cached_in_memory():
+    client = boto3.client('imagebuilder', region_name='eu-west-1')
+    cache = ImageDescriptorCache(imagebuilder_client=client)
+
+    with Stubber(client) as stubber:
+        stubber.add_response('get_image', {'image': {'state': {'status': 'BUILDING'}}})
+        stubber.add_response('get_image', {'image': AVAILABLE})
+        assert cache.describe(IMAGE_ARN)['state']['status'] == "BUILDING"
+        assert cache.describe(IMAGE_ARN) == AVAILABLE
+        # described once, served from memory afterwards
+        assert cache.describe(IMAGE_ARN) == AVAILABLE
+        stubber.assert_no_pending_responses()
+
+
+def test_available_descriptors_are_shared_through_the_table():
+    client = boto3.client('imagebuilder', region_name='eu-west-1')
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    cache = ImageDescriptorCache("control", ttl_seconds=3600, imagebuilder_client=client, dynamodb_resource=dynamodb)
+    key = {'pk': f"IMAGE#{IMAGE_ARN}", 'sk': "DESCRIPTOR"}
+
+    with Stubber(client) as imagebuilder, Stubber(dynamodb.meta.client) as table:
+        table.add_response('get_item', {}, {'TableName': 'control', 'Key': key})
+        imagebuilder.add_response('get_image', {'image': AVAILABLE})
+        table.add_response('put_item', {}, {
+            'TableName': 'control',
+            'Item': dict(key, descriptor=json.dumps(AVAILABLE), expires_at=4600)
+        })
+        assert cache.describe(IMAGE_ARN, now=1000) == AVAILABLE
+        table.assert_no_pending_responses()
+
+    # another container reads the descriptor from the table
+    image_descriptor.clear_memory()
+    with Stubber(client), Stubber(dynamodb.meta.client) as table:
+        table.add_response('get_item', {'Item': {'pk': {'S': key['pk']}, 'sk': {'S': 'DESCRIPTOR'}, 'descriptor': {'S': json.dumps(AVAILABLE)}}})
+        assert cache.describe(IMAGE_ARN) == AVAILABLE
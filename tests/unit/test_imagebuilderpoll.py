@@ -0,0 +1,43 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+from vmexportcommon import image_descriptor
+
+from tests.utils.lambda_module import load_lambda_module
+
+imagebuilderpoll = load_lambda_module('stacks/vmdkexport/resources/vmexport/imagebuilderpoll/imagebuilderpoll_function.py')
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+
+
+@pytest.fixture
+def imagebuilder(monkeypatch):
+    client = boto3.client('imagebuilder', region_name="eu-west-1")
+    monkeypatch.setattr(imagebuilderpoll.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setattr(imagebuilderpoll, "record_stage", lambda *args, **kwargs: None)
+    monkeypatch.setattr(imagebuilderpoll, "save_checkpoint", lambda *args, **kwargs: None)
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    image_descriptor.clear_memory()
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+def poll(imagebuilder, image: dict) -> dict:
+    imagebuilder.add_response('get_image', {'image': image})
+    return imagebuilderpoll.lambda_handler({"image_build_version_arn": IMAGE_ARN}, None)
+
+
+def test_available_image_resolves_the_ami(imagebuilder):
+    state = poll(imagebuilder, {
+        'state': {'status': 'AVAILABLE'},
+        'outputResources': {'amis': [{'image': 'ami-0123456789abcdef0', 'name': 'recipe 2021-10-01'}]}
+    })
+    assert state["ami_state"] == "AVAILABLE"
+    assert state["ami_id"] == "ami-0123456789abcdef0"
+    assert state["ami_name"] == "recipe 2021-10-01"
+
+
+def test_building_image_keeps_polling(imagebuilder):
+    state = poll(imagebuilder, {'state': {'status': 'BUILDING'}})
+    assert state["ami_state"] == "BUILDING"
+    assert "ami_id" not in state
@@ -0,0 +1,172 @@
+import boto3
+from botocore.stub import Stubber
+from vmexportcommon.metadata_reader import MetadataReader
+
+ROOT = "/pipeline/1.0.0"
+BUILD_PATH = "/pipeline/1.0.0/builds/recipe-1.0.0-3"
+
+
+class Clock():
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def parameter(name, value, version=1):
+    return {'Name': name, 'Value': value, 'Version': version, 'Type': 'String'}
+
+
+def by_path(stubber, path, recursive, parameters, next_token=None, token=None):
+    request = {'Path': path, 'Recursive': recursive}
+    if token:
+        request['NextToken'] = token
+    response = {'Parameters': parameters}
+    if next_token:
+        response['NextToken'] = next_token
+    stubber.add_response('get_parameters_by_path', response, request)
+
+
+def top_level(stubber, latest_version=1, namespace=BUILD_PATH):
+    by_path(stubber, ROOT, False, [
+        parameter(f"{ROOT}/AMI_ID", "ami-legacy"),
+        parameter(f"{ROOT}/latest", namespace, latest_version)
+    ])
+
+
+def namespace(stubber, ami_id="ami-0123", path=BUILD_PATH):
+    # the namespace is read in pages
+    by_path(stubber, path, True, [parameter(f"{path}/AMI_ID", ami_id)], next_token="page-2")
+    by_path(stubber, path, True, [parameter(f"{path}/export/ImagePath", "s3://bucket/exports/export-ami-1.vmdk")], token="page-2")
+
+
+def test_snapshot_reads_the_latest_namespace_and_caches_it_for_the_ttl():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    clock = Clock()
+    reader = MetadataReader(ttl_seconds=60, ssm_client=ssm, clock=clock)
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        snapshot = reader.snapshot("pipeline", "1.0.0")
+        assert snapshot == {"AMI_ID": "ami-0123", "export/ImagePath": "s3://bucket/exports/export-ami-1.vmdk"}
+        assert reader.get("pipeline", "1.0.0", "AMI_ID") == "ami-0123"
+
+        # the latest pointer is read again once expired, the unchanged namespace is not
+        clock.now = 61
+        top_level(stubber)
+        assert reader.snapshot("pipeline", "1.0.0") == snapshot
+        stubber.assert_no_pending_responses()
+
+
+def test_a_new_latest_version_reads_the_namespace_again():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    clock = Clock()
+    reader = MetadataReader(ttl_seconds=60, ssm_client=ssm, clock=clock)
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        reader.snapshot("pipeline", "1.0.0")
+
+        clock.now = 61
+        top_level(stubber, latest_version=2)
+        namespace(stubber, ami_id="ami-0456")
+        assert reader.get("pipeline", "1.0.0", "AMI_ID") == "ami-0456"
+        stubber.assert_no_pending_responses()
+
+
+def test_the_namespace_is_read_again_after_its_ttl():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    clock = Clock()
+    reader = MetadataReader(ttl_seconds=60, namespace_ttl_seconds=600, ssm_client=ssm, clock=clock)
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        reader.snapshot("pipeline", "1.0.0")
+
+        # a resumed export wrote to the namespace without moving latest
+        clock.now = 601
+        top_level(stubber)
+        namespace(stubber, ami_id="ami-0456")
+        assert reader.get("pipeline", "1.0.0", "AMI_ID") == "ami-0456"
+        stubber.assert_no_pending_responses()
+
+
+def test_least_recently_used_subtrees_are_evicted():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    reader = MetadataReader(max_entries=2, ssm_client=ssm, clock=Clock())
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        reader.snapshot("pipeline", "1.0.0")
+
+        other = "/other/2.0.0"
+        by_path(stubber, other, False, [])
+        by_path(stubber, f"{other}/export", True, [])
+        reader.snapshot("other", "2.0.0")
+
+        top_level(stubber)
+        namespace(stubber)
+        reader.snapshot("pipeline", "1.0.0")
+        stubber.assert_no_pending_responses()
+
+
+def test_the_disk_cache_is_shared_until_the_metadata_changes(tmp_path):
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        MetadataReader(cache_dir=str(tmp_path), ssm_client=ssm).snapshot("pipeline", "1.0.0")
+
+        # another process only reads the latest pointer
+        top_level(stubber)
+        assert MetadataReader(cache_dir=str(tmp_path), ssm_client=ssm).get("pipeline", "1.0.0", "AMI_ID") == "ami-0123"
+
+        top_level(stubber, latest_version=2)
+        namespace(stubber, ami_id="ami-0456")
+        assert MetadataReader(cache_dir=str(tmp_path), ssm_client=ssm).get("pipeline", "1.0.0", "AMI_ID") == "ami-0456"
+        stubber.assert_no_pending_responses()
+
+
+def test_disk_entries_expire_and_are_bounded(tmp_path):
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    wall_clock = Clock()
+
+    def reader():
+        return MetadataReader(cache_dir=str(tmp_path), namespace_ttl_seconds=600, max_disk_entries=1,
+                              ssm_client=ssm, wall_clock=wall_clock)
+
+    with Stubber(ssm) as stubber:
+        top_level(stubber)
+        namespace(stubber)
+        reader().snapshot("pipeline", "1.0.0")
+
+        wall_clock.now = 601
+        top_level(stubber)
+        namespace(stubber, ami_id="ami-0456")
+        assert reader().get("pipeline", "1.0.0", "AMI_ID") == "ami-0456"
+
+        other = "/pipeline/1.0.0/builds/recipe-1.0.0-4"
+        top_level(stubber, latest_version=2, namespace=other)
+        namespace(stubber, path=other)
+        reader().snapshot("pipeline", "1.0.0")
+        stubber.assert_no_pending_responses()
+
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+
+def test_deployments_without_namespaces_read_the_legacy_paths():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    reader = MetadataReader(ssm_client=ssm)
+
+    with Stubber(ssm) as stubber:
+        by_path(stubber, ROOT, False, [parameter(f"{ROOT}/AMI_ID", "ami-0123")])
+        by_path(stubber, f"{ROOT}/export", True, [parameter(f"{ROOT}/export/status", "Success")])
+        assert reader.snapshot("pipeline", "1.0.0") == {"AMI_ID": "ami-0123", "export/status": "Success"}
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,34 @@
+import boto3
+from botocore.stub import Stubber
+from vmexportcommon.notification_digest import (NotificationDigest, chunk,
+                                                digest_sort_key, is_urgent)
+
+
+def test_urgent_flag_from_message_attribute():
+    assert is_urgent({"export_urgent": "true"})
+    assert is_urgent({"export_urgent": True})
+    assert not is_urgent({"export_urgent": "false"})
+    assert not is_urgent({})
+
+
+def test_buffered_notifications_are_ordered_by_publish_time():
+    keys = [digest_sort_key(1633087800.5, "export-b"), digest_sort_key(999999999.0, "export-a")]
+    assert sorted(keys) == [keys[1], keys[0]]
+
+
+def test_digest_messages_are_bounded():
+    assert [len(c) for c in chunk(list(range(250)))] == [100, 100, 50]
+
+
+def test_pending_pages_through_the_digest_partition():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    digest = NotificationDigest("control", dynamodb_resource=dynamodb)
+    item = {"pk": {"S": "DIGEST"}, "sk": {"S": "001633087800500#export-a"}, "params": {"M": {"ami_id": {"S": "ami-1"}}}}
+
+    with Stubber(dynamodb.meta.client) as stubber:
+        stubber.add_response('query', {"Items": [item], "LastEvaluatedKey": {"pk": {"S": "DIGEST"}, "sk": item["sk"]}})
+        stubber.add_response('query', {"Items": [dict(item, sk={"S": "001633087800600#export-b"})]})
+        pending = digest.pending()
+
+    assert [p["sk"] for p in pending] == ["001633087800500#export-a", "001633087800600#export-b"]
+    assert pending[0]["params"] == {"ami_id": "ami-1"}
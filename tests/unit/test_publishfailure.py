@@ -0,0 +1,90 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+pytest.importorskip("jinja2")
+
+publishfailure = load_lambda_module('stacks/vmdkexport/resources/vmexport/publishfailure/publishfailure_function.py')
+
+ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+TASK_ID = "export-ami-0123456789abcdef0"
+
+
+class FakeScheduler():
+    released = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def release(self, holder):
+        FakeScheduler.released.append(holder)
+
+
+class FakeMetadata():
+
+    def put(self, name, value):
+        pass
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    client = boto3.client('ec2', region_name="eu-west-1")
+    FakeScheduler.released = []
+    monkeypatch.setattr(publishfailure.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setattr(publishfailure, "ExportScheduler", FakeScheduler)
+    monkeypatch.setattr(publishfailure.MetadataWriter, "from_environment", classmethod(lambda cls, event: FakeMetadata()))
+    monkeypatch.setattr(publishfailure, "publish_failure_event", lambda *args, **kwargs: None)
+    monkeypatch.setattr(publishfailure, "record_stage", lambda *args, **kwargs: None)
+    for name in ("SNS_TOPIC", "EXPORT_CONTROL_TABLE", "EXPORT_EVENT_BUS"):
+        monkeypatch.setenv(name, name.lower())
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def failed_while_exporting(**fields):
+    return dict({
+        "image_build_version_arn": ARN,
+        "ami_id": "ami-0123",
+        "batch": True,
+        "export_slot_status": "ACQUIRED",
+        "task_error": {"Error": "States.TaskFailed", "Cause": "poll failed"}
+    }, **fields)
+
+
+def export_task(status):
+    return {'ExportImageTasks': [{'ExportImageTaskId': TASK_ID, 'ImageId': "ami-0123", 'Status': status}]}
+
+
+def test_running_export_is_cancelled_before_the_slot_is_released(ec2):
+    ec2.add_response('describe_export_image_tasks', export_task("active"), {'ExportImageTaskIds': [TASK_ID]})
+    ec2.add_response('cancel_export_task', {}, {'ExportTaskId': TASK_ID})
+
+    publishfailure.lambda_handler(failed_while_exporting(export_image_task_id=TASK_ID), None)
+    assert FakeScheduler.released == [ARN]
+
+
+def test_export_started_without_a_recorded_task_id_is_found_by_the_ami(ec2):
+    ec2.add_response('describe_export_image_tasks', export_task("active"), {})
+    ec2.add_response('cancel_export_task', {}, {'ExportTaskId': TASK_ID})
+
+    publishfailure.lambda_handler(failed_while_exporting(), None)
+    assert FakeScheduler.released == [ARN]
+
+
+def test_slot_is_kept_when_the_running_export_cannot_be_cancelled(ec2):
+    ec2.add_response('describe_export_image_tasks', export_task("active"), {'ExportImageTaskIds': [TASK_ID]})
+    ec2.add_client_error('cancel_export_task', service_error_code='IncorrectState', expected_params={'ExportTaskId': TASK_ID})
+
+    publishfailure.lambda_handler(failed_while_exporting(export_image_task_id=TASK_ID), None)
+    assert FakeScheduler.released == []
+
+
+def test_finished_export_releases_the_slot(ec2):
+    ec2.add_response('describe_export_image_tasks', export_task("deleted"), {'ExportImageTaskIds': [TASK_ID]})
+
+    publishfailure.lambda_handler(failed_while_exporting(export_image_task_id=TASK_ID), None)
+    assert FakeScheduler.released == [ARN]
@@ -0,0 +1,56 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+pytest.importorskip("jinja2")
+
+publishvmdkmetadata = load_lambda_module('stacks/vmdkexport/resources/vmexport/publishvmdkmetadata/publishvmdkmetadata_function.py')
+
+ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+TASK_ID = "export-ami-0123456789abcdef0"
+EVENT = {"image_build_version_arn": ARN, "ami_id": "ami-0123", "ami_name": "recipe", "export_image_task_id": TASK_ID, "batch": True}
+
+
+class FakeMetadata():
+    calls = []
+
+    def put(self, name, value):
+        FakeMetadata.calls.append(name)
+
+    def publish_latest(self):
+        FakeMetadata.calls.append("latest")
+        return True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    ec2 = boto3.client('ec2', region_name="eu-west-1")
+    s3 = boto3.client('s3', region_name="eu-west-1")
+    FakeMetadata.calls = []
+    monkeypatch.setattr(publishvmdkmetadata.boto3, "client", lambda service, *args, **kwargs: {"ec2": ec2, "s3": s3}[service])
+    monkeypatch.setattr(publishvmdkmetadata.MetadataWriter, "from_environment", classmethod(lambda cls, event: FakeMetadata()))
+    monkeypatch.setattr(publishvmdkmetadata, "record_stage", lambda *args, **kwargs: None)
+    monkeypatch.setattr(publishvmdkmetadata, "save_checkpoint", lambda *args, **kwargs: None)
+    monkeypatch.setenv("SNS_TOPIC", "arn:aws:sns:eu-west-1:111122223333:topic")
+    monkeypatch.setenv("EXPORT_EVENT_BUS", "bus")
+    with Stubber(ec2) as ec2_stubber, Stubber(s3) as s3_stubber:
+        ec2_stubber.add_response('describe_export_image_tasks', {'ExportImageTasks': [{
+            'ExportImageTaskId': TASK_ID, 'ImageId': "ami-0123", 'Status': "completed",
+            'S3ExportLocation': {'S3Bucket': "bucket", 'S3Prefix': "exports/"}
+        }]}, {'ExportImageTaskIds': [TASK_ID]})
+        yield s3_stubber
+        ec2_stubber.assert_no_pending_responses()
+        s3_stubber.assert_no_pending_responses()
+
+
+def test_completion_event_failures_do_not_fail_the_export(clients):
+    clients.add_client_error('head_object', service_error_code='SlowDown', http_status_code=503)
+
+    state = publishvmdkmetadata.lambda_handler(dict(EVENT), None)
+
+    assert "SlowDown" in state["completion_event_error"]
+    assert "failure" not in state
+    # the latest pointer is still moved, as the last step
+    assert FakeMetadata.calls[-1] == "latest"
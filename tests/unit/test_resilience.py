@@ -0,0 +1,111 @@
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from botocore.stub import ANY, Stubber
+from vmexportcommon import image_descriptor, resilience
+from vmexportcommon.resilience import (CircuitBreaker, UpstreamThrottled,
+                                       UpstreamUnavailable)
+
+from tests.utils.lambda_module import load_lambda_module
+
+imagebuilderpoll = load_lambda_module('stacks/vmdkexport/resources/vmexport/imagebuilderpoll/imagebuilderpoll_function.py')
+exportslot = load_lambda_module('stacks/vmdkexport/resources/vmexport/exportslot/exportslot_function.py')
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+
+
+class FakeBreaker():
+    throttled = []
+    open = []
+
+    @classmethod
+    def from_environment(cls):
+        return cls()
+
+    def record_throttle(self, operation):
+        FakeBreaker.throttled.append(operation)
+
+    def open_operations(self):
+        return FakeBreaker.open
+
+
+@pytest.fixture
+def imagebuilder(monkeypatch):
+    client = boto3.client('imagebuilder', region_name="eu-west-1")
+    monkeypatch.setattr(imagebuilderpoll.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setattr(resilience, "CircuitBreaker", FakeBreaker)
+    monkeypatch.setenv("EXPORT_CONTROL_TABLE", "control")
+    FakeBreaker.throttled = []
+    image_descriptor.clear_memory()
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def poll():
+    return imagebuilderpoll.lambda_handler({"image_build_version_arn": IMAGE_ARN}, None)
+
+
+def test_throttling_is_retryable_and_feeds_the_breaker(imagebuilder):
+    imagebuilder.add_client_error('get_image', service_error_code='ThrottlingException', http_status_code=400)
+    with pytest.raises(UpstreamThrottled):
+        poll()
+    assert FakeBreaker.throttled == ["GetImage"]
+
+
+def test_server_errors_are_retryable(imagebuilder):
+    imagebuilder.add_client_error('get_image', service_error_code='ServiceUnavailableException', http_status_code=503)
+    with pytest.raises(UpstreamUnavailable):
+        poll()
+    assert FakeBreaker.throttled == []
+
+
+def test_permanent_errors_fail_fast(imagebuilder):
+    imagebuilder.add_client_error('get_image', service_error_code='AccessDeniedException', http_status_code=403)
+    with pytest.raises(ClientError):
+        poll()
+
+
+def test_breaker_opens_after_threshold_within_window():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    breaker = CircuitBreaker("control", "eu-west-1", threshold=3, window_seconds=300, cooldown_seconds=600, dynamodb_resource=dynamodb)
+
+    with Stubber(dynamodb.meta.client) as stubber:
+        # first throttle of a window, the conditional increment fails
+        stubber.add_client_error('update_item', service_error_code='ConditionalCheckFailedException', http_status_code=400)
+        stubber.add_response('update_item', {})
+        stubber.add_response('update_item', {'Attributes': {'throttles': {'N': '2'}}})
+        stubber.add_response('update_item', {'Attributes': {'throttles': {'N': '3'}}})
+        stubber.add_response('update_item', {}, {
+            'TableName': 'control',
+            'Key': {'pk': 'BREAKER#eu-west-1', 'sk': 'ExportImage'},
+            'UpdateExpression': "SET open_until = :open_until",
+            'ExpressionAttributeValues': {':open_until': 1602},
+        })
+        opened = [breaker.record_throttle("ExportImage", now=1000 + i) for i in range(3)]
+        stubber.assert_no_pending_responses()
+
+    assert opened == [False, False, True]
+
+
+def test_open_breaker_pauses_new_exports(monkeypatch):
+    class FakeScheduler():
+        def __init__(self, **kwargs):
+            pass
+
+        def enqueue(self, holder, priority):
+            return "5#000000000001000#holder"
+
+        def try_acquire(self, holder, key):
+            raise AssertionError("no slot is taken while the breaker is open")
+
+    monkeypatch.setattr(exportslot, "ExportScheduler", FakeScheduler)
+    monkeypatch.setattr(exportslot, "CircuitBreaker", FakeBreaker)
+    monkeypatch.setenv("EXPORT_CONTROL_TABLE", "control")
+    monkeypatch.setenv("EXPORT_SLOT_LIMIT", "5")
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    FakeBreaker.open = ["ExportImage"]
+
+    state = exportslot.lambda_handler({"image_build_version_arn": IMAGE_ARN}, None)
+    assert state["export_slot_status"] == "WAITING"
+    assert state["export_queue_key"] == "5#000000000001000#holder"
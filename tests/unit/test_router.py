@@ -0,0 +1,26 @@
+import pytest
+
+from tests.utils.lambda_module import load_lambda_module
+
+router = load_lambda_module('stacks/vmdkexport/resources/vmexport/router/router_function.py')
+
+
+def test_every_action_routes_to_a_stage_handler():
+    # the notification stages render their emails with jinja2
+    pytest.importorskip("jinja2")
+    for action in router.ROUTES:
+        assert callable(router.handler_for(action))
+
+
+def test_state_is_passed_to_the_stage_handler(monkeypatch):
+    calls = []
+    monkeypatch.setitem(router.handlers, "ami_poll", lambda state, context: calls.append(state) or state)
+    state = {"image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"}
+
+    assert router.lambda_handler({"action": "ami_poll", "state": state}, None) == state
+    assert calls == [state]
+
+
+def test_unknown_action_fails():
+    with pytest.raises(ValueError):
+        router.lambda_handler({"action": "reboot", "state": {}}, None)
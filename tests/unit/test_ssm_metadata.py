@@ -0,0 +1,90 @@
+import boto3
+from botocore.stub import Stubber
+from vmexportcommon.ssm_metadata import MetadataWriter, build_id
+
+IMAGE_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/3"
+BUILD_PATH = "/pipeline/1.0.0/builds/recipe-1.0.0-3"
+OLDER_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/2"
+OLDER_PATH = "/pipeline/1.0.0/builds/recipe-1.0.0-2"
+NEWER_ARN = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/4"
+NEWER_PATH = "/pipeline/1.0.0/builds/recipe-1.0.0-4"
+LATEST = "/pipeline/1.0.0/latest"
+
+
+def put(stubber, name, value, version=1):
+    stubber.add_response('put_parameter', {'Version': version}, {'Name': name, 'Value': value, 'Type': 'String', 'Overwrite': True})
+
+
+def get(stubber, name, value, version=1):
+    stubber.add_response('get_parameter', {'Parameter': {'Name': name, 'Type': 'String', 'Value': value, 'Version': version}}, {'Name': name})
+
+
+def test_build_id_is_a_valid_parameter_name():
+    assert build_id(IMAGE_ARN) == "recipe-1.0.0-3"
+    assert build_id("arn:aws:imagebuilder:eu-west-1:111122223333:image/my recipe+x/1.0.0/3") == "my-recipe-x-1.0.0-3"
+
+
+def test_metadata_is_written_to_the_build_namespace_before_the_latest_pointer():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    writer = MetadataWriter("pipeline", "1.0.0", IMAGE_ARN, ssm_client=ssm)
+
+    with Stubber(ssm) as stubber:
+        put(stubber, f"{BUILD_PATH}/export/ImagePath", "s3://bucket/exports/export-ami-1.vmdk")
+        put(stubber, f"{BUILD_PATH}/ImageBuildVersionArn", IMAGE_ARN)
+        stubber.add_client_error('get_parameter', service_error_code='ParameterNotFound', expected_params={'Name': LATEST})
+        put(stubber, LATEST, BUILD_PATH)
+        writer.put("export/ImagePath", "s3://bucket/exports/export-ami-1.vmdk")
+        assert writer.publish_latest()
+        stubber.assert_no_pending_responses()
+
+
+def test_version_is_derived_from_the_image_build(monkeypatch):
+    monkeypatch.setenv("PIPELINE_NAME", "pipeline")
+    writer = MetadataWriter.from_environment({"image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/2.1.0/1"}, ssm_client=object())
+    assert writer.path == "/pipeline/2.1.0/builds/recipe-2.1.0-1"
+
+
+def test_latest_is_not_moved_back_to_an_older_build():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    writer = MetadataWriter("pipeline", "1.0.0", IMAGE_ARN, ssm_client=ssm)
+
+    with Stubber(ssm) as stubber:
+        put(stubber, f"{BUILD_PATH}/ImageBuildVersionArn", IMAGE_ARN)
+        get(stubber, LATEST, NEWER_PATH, version=4)
+        get(stubber, f"{NEWER_PATH}/ImageBuildVersionArn", NEWER_ARN)
+        assert not writer.publish_latest()
+        stubber.assert_no_pending_responses()
+
+
+def test_newer_build_written_concurrently_is_written_back():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    writer = MetadataWriter("pipeline", "1.0.0", IMAGE_ARN, ssm_client=ssm)
+
+    with Stubber(ssm) as stubber:
+        put(stubber, f"{BUILD_PATH}/ImageBuildVersionArn", IMAGE_ARN)
+        get(stubber, LATEST, OLDER_PATH, version=1)
+        get(stubber, f"{OLDER_PATH}/ImageBuildVersionArn", OLDER_ARN)
+        # another export pointed latest at a newer build between the read and the write
+        put(stubber, LATEST, BUILD_PATH, version=3)
+        stubber.add_response('get_parameter_history', {'Parameters': [
+            {'Name': LATEST, 'Value': path, 'Version': version}
+            for version, path in [(1, OLDER_PATH), (2, NEWER_PATH), (3, BUILD_PATH)]
+        ]}, {'Name': LATEST})
+        get(stubber, f"{NEWER_PATH}/ImageBuildVersionArn", NEWER_ARN)
+        get(stubber, LATEST, BUILD_PATH, version=3)
+        get(stubber, f"{BUILD_PATH}/ImageBuildVersionArn", IMAGE_ARN)
+        put(stubber, LATEST, NEWER_PATH, version=4)
+
+        assert not writer.publish_latest()
+        stubber.assert_no_pending_responses()
+
+
+def test_legacy_paths_are_written_next_to_the_namespace():
+    ssm = boto3.client('ssm', region_name='eu-west-1')
+    writer = MetadataWriter("pipeline", "1.0.0", IMAGE_ARN, legacy_paths=True, ssm_client=ssm)
+
+    with Stubber(ssm) as stubber:
+        put(stubber, f"{BUILD_PATH}/AMI_ID", "ami-0123")
+        put(stubber, "/pipeline/1.0.0/AMI_ID", "ami-0123")
+        writer.put("AMI_ID", "ami-0123")
+        stubber.assert_no_pending_responses()
@@ -0,0 +1,57 @@
+from decimal import Decimal
+
+import boto3
+from botocore.stub import Stubber
+from vmexportcommon.stage_history import (EXPORT_STARTED, StageHistory,
+                                          execution_sort_key, parse_timestamp)
+
+EVENT = {
+    "image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1",
+    "execution": {
+        "id": "arn:aws:states:eu-west-1:111122223333:execution:VMDKExportStateMachine:run-1",
+        "started_at": "2021-10-01T10:15:00.123Z"
+    }
+}
+
+
+def test_stage_is_recorded_in_the_partition_of_the_start_day():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    history = StageHistory("history", dynamodb_resource=dynamodb)
+
+    with Stubber(dynamodb.meta.client) as stubber:
+        stubber.add_response('update_item', {}, {
+            'TableName': 'history',
+            'Key': {'pk': 'EXECUTIONS#2021-10-01', 'sk': EVENT["execution"]["id"]},
+            'UpdateExpression': "SET #stage = if_not_exists(#stage, :at), #image = :image, #expires = :expires, #a0 = :a0",
+            'ExpressionAttributeNames': {
+                '#stage': 'stage_export_started',
+                '#image': 'image_build_version_arn',
+                '#expires': 'expires_at',
+                '#a0': 'format'
+            },
+            'ExpressionAttributeValues': {
+                ':at': Decimal('1633083300.5'),
+                ':image': EVENT["image_build_version_arn"],
+                ':expires': 1633083300 + 400 * 86400,
+                ':a0': 'VMDK'
+            }
+        })
+        history.record(EVENT, EXPORT_STARTED, at=1633083300.5, format="VMDK")
+        stubber.assert_no_pending_responses()
+
+
+def test_stage_without_execution_context_is_skipped():
+    dynamodb = boto3.resource('dynamodb', region_name='eu-west-1')
+    history = StageHistory("history", dynamodb_resource=dynamodb)
+
+    with Stubber(dynamodb.meta.client):
+        history.record({"image_build_version_arn": "arn"}, EXPORT_STARTED)
+
+
+def test_parse_state_machine_timestamp():
+    assert parse_timestamp("2021-10-01T10:15:00.123Z") == 1633083300.123
+
+
+def test_items_of_a_batch_execution_are_recorded_separately():
+    assert execution_sort_key(EVENT["execution"]) == EVENT["execution"]["id"]
+    assert execution_sort_key(dict(EVENT["execution"], item=0)) == f"{EVENT['execution']['id']}#0"
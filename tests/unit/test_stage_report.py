@@ -0,0 +1,42 @@
+from tools.stage_report import aggregate, percentile, segment_durations, summarize
+
+
+def execution(pipeline: str, region: str, offset: float, export_seconds: float) -> dict:
+    return {
+        "pipeline": pipeline,
+        "format": "VMDK",
+        "region": region,
+        "stage_execution_started": offset,
+        "stage_ami_available": offset + 1800,
+        "stage_export_started": offset + 1860,
+        "stage_export_completed": offset + 1860 + export_seconds,
+        "stage_metadata_published": offset + 1870 + export_seconds
+    }
+
+
+def test_segment_durations_skip_unfinished_stages():
+    item = execution("pipeline-a", "eu-west-1", 0, 3000)
+    del item["stage_metadata_published"]
+    durations = segment_durations(item)
+    assert durations == {"ami_wait": 1800, "export_start": 60, "export": 3000}
+
+
+def test_nearest_rank_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([7], 95) == 7
+    assert percentile([], 50) is None
+
+
+def test_report_groups_and_dominant_stage():
+    items = [execution("pipeline-a", "eu-west-1", i * 10, 600 + i) for i in range(100)]
+    items += [execution("pipeline-b", "us-east-1", 0, 60)]
+    rows = summarize(aggregate(items, ("pipeline", "region")))
+
+    assert [row["group"] for row in rows] == [["pipeline-a", "eu-west-1"], ["pipeline-b", "us-east-1"]]
+    assert rows[0]["executions"] == 100
+    assert rows[0]["segments"]["export"]["p95"] == 694
+    assert rows[0]["segments"]["end_to_end"]["p50"] == 60 + 649 + 10
+    assert rows[0]["dominant_stage"] == "export"
+    assert rows[1]["dominant_stage"] == "export_start"
@@ -355,4 +355,65 @@ class TestVmdkExportStack(tc.BaseTestCase):
         
     def test_vmdkcompleted_lambda_role(self):
          expect(self.cfn_template).to(
-         contain_metadata_path(self.state_machine,f"VMDKExportStateMachine-{CdkUtils.stack_tag}"))
\ No newline at end of file
+         contain_metadata_path(self.state_machine,f"VMDKExportStateMachine-{CdkUtils.stack_tag}"))
+
+    def test_vmdk_export_start_express_state_machine(self):
+        expect(self.cfn_template).to(
+            contain_metadata_path(self.state_machine, f"VMDKExportStartStateMachine-{CdkUtils.stack_tag}"))
+
+    def test_vmdk_export_start_state_machine_is_express(self):
+        expect(self.cfn_template).to(have_resource(self.state_machine, {
+            "StateMachineType": "EXPRESS"
+        }))
+
+    def test_export_control_table_created(self):
+        expect(self.cfn_template).to(
+            contain_metadata_path(self.dynamodb_table, f"ExportControlTable-{CdkUtils.stack_tag}"))
+
+    def test_export_control_table_ttl(self):
+        expect(self.cfn_template).to(have_resource(self.dynamodb_table, {
+            "TimeToLiveSpecification": {
+                "AttributeName": "expires_at",
+                "Enabled": True
+            }
+        }))
+
+    def test_vmdk_export_common_layer(self):
+        expect(self.cfn_template).to(contain_metadata_path(self.lambda_layer, f"vmdkExportCommonLayer-{CdkUtils.stack_tag}"))
+
+    def test_export_slot_lambda(self):
+        expect(self.cfn_template).to(contain_metadata_path(self.lambda_, f"exportSlotLambda-{CdkUtils.stack_tag}"))
+
+    def test_export_slot_lambda_role(self):
+         expect(self.cfn_template).to(
+         contain_metadata_path(self.iam_role,f"exportSlotLambdaRole-{CdkUtils.stack_tag}"))
+
+    def test_vmdk_export_event_bus(self):
+        expect(self.cfn_template).to(have_resource(self.event_bus, {
+            "Name": f"VmdkExportEventBus-{CdkUtils.stack_tag}"
+        }))
+
+    def test_export_history_table_created(self):
+        expect(self.cfn_template).to(
+            contain_metadata_path(self.dynamodb_table, f"ExportHistoryTable-{CdkUtils.stack_tag}"))
+
+    def test_vmdk_export_completed_schema(self):
+        expect(self.cfn_template).to(have_resource('AWS::EventSchemas::Schema', {
+            "SchemaName": "vmdkexport@VmdkExportCompleted",
+            "Type": "JSONSchemaDraft4"
+        }))
+
+    def test_vmdk_digest_lambda(self):
+        expect(self.cfn_template).to(contain_metadata_path(self.lambda_, f"vmdkDigestLambda-{CdkUtils.stack_tag}"))
+
+    def test_vmdk_digest_schedule(self):
+        expect(self.cfn_template).to(have_resource(self.event_rule, {
+            "ScheduleExpression": "rate(15 minutes)"
+        }))
+
+    def test_publish_failure_lambda(self):
+        expect(self.cfn_template).to(contain_metadata_path(self.lambda_, f"publishFailureLambda-{CdkUtils.stack_tag}"))
+
+    def test_publish_failure_lambda_role(self):
+        expect(self.cfn_template).to(
+            contain_metadata_path(self.iam_role, f"publishFailureLambdaRole-{CdkUtils.stack_tag}"))
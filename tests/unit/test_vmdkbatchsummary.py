@@ -0,0 +1,41 @@
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+pytest.importorskip("jinja2")
+
+vmdkbatchsummary = load_lambda_module('stacks/vmdkexport/resources/vmexport/vmdkbatchsummary/vmdkbatchsummary_function.py')
+
+ARN_1 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+ARN_2 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/2"
+RESULTS = [
+    {"image_build_version_arn": ARN_1, "ami_id": "ami-1", "export_image_task_id": "export-ami-1", "vdmk_export_status": "COMPLETED"},
+    {"image_build_version_arn": ARN_2, "ami_state": "FAILED", "failure": {"stage": "ami_build", "status": "FAILED", "reason": "Test failed"}}
+]
+
+
+@pytest.fixture
+def sns(monkeypatch):
+    client = boto3.client('sns', region_name="eu-west-1")
+    monkeypatch.setattr(vmdkbatchsummary.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setenv("SNS_TOPIC", "arn:aws:sns:eu-west-1:111122223333:topic")
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_batch_sends_one_summary(sns):
+    sns.add_response('publish', {'MessageId': '1'}, {
+        'TopicArn': "arn:aws:sns:eu-west-1:111122223333:topic",
+        'Message': ANY,
+        'Subject': "VMDK Export batch: 1 of 2 exports are ready"
+    })
+    summary = vmdkbatchsummary.lambda_handler({"batch": True, "results": RESULTS}, None)
+    assert summary == {"total": 2, "succeeded": 1, "failed": 1, "failed_image_build_version_arns": [ARN_2]}
+
+
+def test_single_export_is_not_notified_again(sns):
+    summary = vmdkbatchsummary.lambda_handler({"batch": False, "results": RESULTS[:1]}, None)
+    assert summary["failed"] == 0
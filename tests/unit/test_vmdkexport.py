@@ -0,0 +1,66 @@
+import boto3
+import pytest
+from botocore.stub import ANY, Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+vmdkexport = load_lambda_module(
+    'stacks/vmdkexport/resources/vmexport/vmdkexport/vmdkexport_function.py')
+
+EXECUTION = {"id": "arn:aws:states:eu-west-1:111122223333:execution:VMDKExportStateMachine:run-1", "started_at": "2021-10-01T10:15:00.123Z"}
+EVENT = {
+    "image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1",
+    "execution": EXECUTION,
+    "ami_id": "ami-0123",
+    "ami_name": "recipe"
+}
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    client = boto3.client('ec2', region_name="eu-west-1")
+    monkeypatch.setattr(vmdkexport.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setattr(vmdkexport, "record_stage", lambda *args, **kwargs: None)
+    monkeypatch.setattr(vmdkexport, "save_checkpoint", lambda *args, **kwargs: None)
+    monkeypatch.setenv("EXPORT_BUCKET", "bucket")
+    monkeypatch.setenv("EXPORT_ROLE", "vmimport")
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+def export_task(task_id, status, ami_id="ami-0123", prefix="exports/"):
+    return {'ExportImageTaskId': task_id, 'ImageId': ami_id, 'Status': status, 'S3ExportLocation': {'S3Bucket': "bucket", 'S3Prefix': prefix}}
+
+
+def test_client_token_is_deterministic_per_execution_and_ami():
+    token = vmdkexport.client_token(EVENT, "ami-0123")
+    assert len(token) <= 64
+    assert token == vmdkexport.client_token(dict(EVENT), "ami-0123")
+    assert token != vmdkexport.client_token(dict(EVENT, execution=dict(EXECUTION, item=1)), "ami-0123")
+    assert token != vmdkexport.client_token(EVENT, "ami-4567")
+
+
+def test_export_is_started_with_the_client_token(ec2):
+    ec2.add_response('describe_export_image_tasks', {'ExportImageTasks': [
+        export_task("export-ami-old", "deleted"),
+        export_task("export-ami-other", "active", ami_id="ami-4567"),
+        export_task("export-ami-elsewhere", "completed", prefix="manual/")
+    ]})
+    ec2.add_response('export_image', {'ExportImageTaskId': "export-ami-new"}, {
+        'ClientToken': vmdkexport.client_token(EVENT, "ami-0123"),
+        'DiskImageFormat': "VMDK",
+        'ImageId': "ami-0123",
+        'S3ExportLocation': {'S3Bucket': "bucket", 'S3Prefix': "exports/"},
+        'RoleName': ANY
+    })
+    state = vmdkexport.lambda_handler(dict(EVENT), None)
+    assert state["export_image_task_id"] == "export-ami-new"
+    ec2.assert_no_pending_responses()
+
+
+def test_active_export_of_the_ami_is_reused(ec2):
+    ec2.add_response('describe_export_image_tasks', {'ExportImageTasks': [export_task("export-ami-running", "active")]})
+    state = vmdkexport.lambda_handler(dict(EVENT), None)
+    assert state["export_image_task_id"] == "export-ami-running"
+    assert state["export_format"] == "VMDK"
+    ec2.assert_no_pending_responses()
@@ -0,0 +1,72 @@
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from tests.utils.lambda_module import load_lambda_module
+
+vmdkexportcompleted = load_lambda_module(
+    'stacks/vmdkexport/resources/vmexport/vmdkexportcompleted/vmdkexportcompleted_function.py')
+
+TASK_ID = "export-ami-0123456789abcdef0"
+EVENT = {"image_build_version_arn": "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1", "export_image_task_id": TASK_ID}
+
+
+class FakeScheduler():
+    released = []
+
+    def __init__(self, **kwargs):
+        pass
+
+    def release(self, holder):
+        FakeScheduler.released.append(holder)
+
+
+class FakePublisher():
+
+    def __init__(self, event_bus_name):
+        pass
+
+    def publish(self, event, state):
+        return state
+
+
+@pytest.fixture
+def ec2(monkeypatch):
+    client = boto3.client('ec2', region_name="eu-west-1")
+    monkeypatch.setattr(vmdkexportcompleted.boto3, "client", lambda *args, **kwargs: client)
+    monkeypatch.setattr(vmdkexportcompleted, "ExportScheduler", FakeScheduler)
+    monkeypatch.setattr(vmdkexportcompleted, "ProgressPublisher", FakePublisher)
+    monkeypatch.setattr(vmdkexportcompleted, "record_stage", lambda *args, **kwargs: None)
+    monkeypatch.setattr(vmdkexportcompleted, "save_checkpoint", lambda *args, **kwargs: None)
+    monkeypatch.setattr(vmdkexportcompleted, "clear_checkpoints", lambda *args, **kwargs: None)
+    monkeypatch.setenv("EXPORT_CONTROL_TABLE", "control")
+    monkeypatch.setenv("EXPORT_EVENT_BUS", "bus")
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+    FakeScheduler.released = []
+    with Stubber(client) as stubber:
+        yield stubber
+
+
+def poll(ec2, task: dict) -> dict:
+    ec2.add_response('describe_export_image_tasks', {'ExportImageTasks': [dict(task, ExportImageTaskId=TASK_ID)] if task else []})
+    return vmdkexportcompleted.lambda_handler(dict(EVENT), None)
+
+
+def test_active_export_keeps_polling(ec2):
+    state = poll(ec2, {'Status': 'active', 'Progress': '40', 'StatusMessage': 'converting'})
+    assert state["vdmk_export_status"] == "ACTIVE"
+    assert "failure" not in state
+    assert FakeScheduler.released == []
+
+
+def test_deleted_export_fails_with_reason_and_releases_the_slot(ec2):
+    state = poll(ec2, {'Status': 'deleted', 'StatusMessage': 'ClientError: Unsupported kernel version'})
+    assert state["vdmk_export_status"] == "FAILED"
+    assert state["failure"] == {"stage": "export", "status": "DELETED", "reason": "ClientError: Unsupported kernel version"}
+    assert FakeScheduler.released == [EVENT["image_build_version_arn"]]
+
+
+def test_missing_export_task_fails(ec2):
+    state = poll(ec2, None)
+    assert state["vdmk_export_status"] == "FAILED"
+    assert state["failure"]["status"] == "NOT_FOUND"
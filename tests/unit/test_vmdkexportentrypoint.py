@@ -0,0 +1,61 @@
+import pytest
+
+from tests.utils.lambda_module import load_lambda_module
+
+vmdkexportentrypoint = load_lambda_module(
+    'stacks/vmdkexport/resources/vmexport/vmdkexportentrypoint/vmdkexportentrypoint_function.py')
+
+ARN_1 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/1"
+ARN_2 = "arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/2"
+EXECUTION = {"id": "arn:aws:states:eu-west-1:111122223333:execution:VMDKExportStateMachine:run-1", "started_at": "2021-10-01T10:15:00.123Z"}
+
+
+@pytest.fixture(autouse=True)
+def environment(monkeypatch):
+    monkeypatch.setattr(vmdkexportentrypoint, "record_stage", lambda *args, **kwargs: None)
+    monkeypatch.setenv("AWS_REGION", "eu-west-1")
+
+
+def test_single_request_is_one_item():
+    result = vmdkexportentrypoint.lambda_handler({"image_build_version_arn": ARN_1, "export_priority": "release", "execution": EXECUTION}, None)
+    assert result["batch"] is False
+    assert result["items"] == [{"image_build_version_arn": ARN_1, "execution": EXECUTION, "export_priority": "release", "batch": False, "resume_from": "ami_poll"}]
+
+
+def test_batch_request_is_one_item_per_image_build():
+    result = vmdkexportentrypoint.lambda_handler({"image_build_version_arns": [ARN_1, ARN_2, ARN_1], "export_urgent": "true", "execution": EXECUTION}, None)
+    assert result["batch"] is True
+    assert [item["image_build_version_arn"] for item in result["items"]] == [ARN_1, ARN_2]
+    assert [item["execution"]["item"] for item in result["items"]] == [0, 1]
+    assert all(item["export_urgent"] == "true" and item["batch"] for item in result["items"])
+
+
+def test_resumed_request_restores_the_checkpoints(monkeypatch):
+    class Checkpoints():
+        def __init__(self, table_name):
+            assert table_name == "control"
+
+        def load(self, arn):
+            return {"ami_available": {"ami_id": "ami-0123", "ami_name": "recipe"}} if arn == ARN_1 else {}
+
+    monkeypatch.setattr(vmdkexportentrypoint, "CheckpointStore", Checkpoints)
+    monkeypatch.setenv("EXPORT_CONTROL_TABLE", "control")
+
+    result = vmdkexportentrypoint.lambda_handler({"image_build_version_arns": [ARN_1, ARN_2], "resume": True, "execution": EXECUTION}, None)
+    assert [item["resume_from"] for item in result["items"]] == ["export_slot", "ami_poll"]
+    assert result["items"][0]["ami_id"] == "ami-0123"
+    assert result["items"][0]["ami_state"] == "AVAILABLE"
+
+
+@pytest.mark.parametrize("event", [{}, {"image_build_version_arns": []}, {"image_build_version_arns": [ARN_1, "recipe/1.0.0/2"]}])
+def test_invalid_requests_fail(event):
+    with pytest.raises(ValueError):
+        vmdkexportentrypoint.lambda_handler(event, None)
+
+
+def test_batches_beyond_the_maximum_size_fail(monkeypatch):
+    monkeypatch.setenv("MAX_BATCH_SIZE", "2")
+    arns = [f"arn:aws:imagebuilder:eu-west-1:111122223333:image/recipe/1.0.0/{i}" for i in range(3)]
+    assert len(vmdkexportentrypoint.lambda_handler({"image_build_version_arns": arns[:2], "execution": EXECUTION}, None)["items"]) == 2
+    with pytest.raises(ValueError, match="maximum batch size of 2"):
+        vmdkexportentrypoint.lambda_handler({"image_build_version_arns": arns, "execution": EXECUTION}, None)
@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def load_lambda_module(relative_path: str):
+    """Loads a lambda handler module from its asset directory, which is not a python package."""
+    path = os.path.join(root_dir, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
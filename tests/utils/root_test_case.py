@@ -97,7 +97,9 @@ class RootTestCase(TestCase):
     iam_policy = 'AWS::IAM::Policy'
     state_machine = 'AWS::StepFunctions::StateMachine'
     event_rule = 'AWS::Events::Rule'
+    event_bus = 'AWS::Events::EventBus'
     custom_cfn_resource = 'AWS::CloudFormation::CustomResource'
+    dynamodb_table = 'AWS::DynamoDB::Table'
 
     __test__ = False
 
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+
+"""
+    backfill.py:
+    Exports historical AMIs to VMDK format by starting executions of the
+    VMDKExportStateMachine directly, bypassing the SNS notification topic
+    (whose handler only allows a single running execution).
+
+    Images can be given as EC2 Image Builder image build version ARNs,
+    AMI ids, or as a pipeline name plus a date range. Images that are not
+    AVAILABLE or that already have an active or completed export task
+    are skipped.
+
+    usage:
+        python -m tools.backfill --images arn:aws:imagebuilder:...  ami-0123456789abcdef0
+        python -m tools.backfill --pipeline ami-share-pipeline-main --since 2021-09-01 --until 2021-10-01
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import boto3
+
+from tools.stack_outputs import STATE_MACHINE_ARN, StackOutputs
+
+IMAGEBUILDER_ARN_TAG = "Ec2ImageBuilderArn"
+EXPORTED_TASK_STATES = ("active", "completed")
+
+EXECUTION_NAME_LENGTH = 80
+RETRIED_STATUSES = ("FAILED", "TIMED_OUT", "ABORTED")
+MAX_ATTEMPTS = 5
+
+
+def parse_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def resolve_ami_ids(ec2_client, ami_ids: list) -> list:
+    """
+        Maps AMI ids to the image build version ARN that EC2 Image Builder
+        tags its AMIs with.
+    """
+    arns = []
+    if not ami_ids:
+        return arns
+    response = ec2_client.describe_images(ImageIds=ami_ids)
+    found = {}
+    for image in response['Images']:
+        tags = {tag['Key']: tag['Value'] for tag in image.get('Tags', [])}
+        found[image['ImageId']] = tags.get(IMAGEBUILDER_ARN_TAG)
+    for ami_id in ami_ids:
+        if found.get(ami_id):
+            arns.append(found[ami_id])
+        else:
+            print(f"Skipping {ami_id}: not an EC2 Image Builder AMI", file=sys.stderr)
+    return arns
+
+
+def resolve_pipeline_images(imagebuilder_client, pipeline_name: str, since: datetime, until: datetime) -> list:
+    response = imagebuilder_client.list_image_pipelines(
+        filters=[{'name': 'name', 'values': [pipeline_name]}]
+    )
+    if len(response['imagePipelineList']) == 0:
+        raise ValueError(f"Image pipeline {pipeline_name} not found")
+    pipeline_arn = response['imagePipelineList'][0]['arn']
+
+    arns = []
+    kwargs = {'imagePipelineArn': pipeline_arn}
+    while True:
+        response = imagebuilder_client.list_image_pipeline_images(**kwargs)
+        for image in response['imageSummaryList']:
+            created = parse_date(image['dateCreated'])
+            if since <= created < until:
+                arns.append(image['arn'])
+        if 'nextToken' not in response:
+            break
+        kwargs['nextToken'] = response['nextToken']
+    return arns
+
+
+def describe_images(imagebuilder_client, image_build_version_arns: list) -> list:
+    """
+        Returns (arn, ami_id) for each AVAILABLE image in the current region.
+    """
+    images = []
+    region = imagebuilder_client.meta.region_name
+    for arn in image_build_version_arns:
+        image = imagebuilder_client.get_image(imageBuildVersionArn=arn)['image']
+        status = image['state']['status']
+        if status != "AVAILABLE":
+            print(f"Skipping {arn}: image is {status}", file=sys.stderr)
+            continue
+        amis = [ami for ami in image.get('outputResources', {}).get('amis', []) if ami['region'] == region]
+        if len(amis) == 0:
+            print(f"Skipping {arn}: no AMI in {region}", file=sys.stderr)
+            continue
+        images.append((arn, amis[0]['image']))
+    return images
+
+
+def exported_ami_ids(ec2_client) -> set:
+    ami_ids = set()
+    kwargs = {}
+    while True:
+        response = ec2_client.describe_export_image_tasks(**kwargs)
+        for task in response['ExportImageTasks']:
+            if task['Status'] in EXPORTED_TASK_STATES:
+                ami_ids.add(task.get('ImageId'))
+        if 'NextToken' not in response:
+            break
+        kwargs['NextToken'] = response['NextToken']
+    return ami_ids
+
+
+def execution_name(image_build_version_arn: str, attempt: int = 0) -> str:
+    """
+        Execution names are deterministic so that re-running a backfill does
+        not start a second export of the same image. Only the recipe is
+        truncated, the digest keeps the names of the versions apart, and
+        retries of a failed export get an attempt suffix.
+    """
+    digest = hashlib.sha256(image_build_version_arn.encode(encoding="utf-8")).hexdigest()[:16]
+    suffix = f"-{digest}" + (f"-{attempt}" if attempt else "")
+    recipe = re.sub(r"[^A-Za-z0-9_-]", "-", image_build_version_arn.split('/')[-3])
+    prefix = "backfill-"
+    return f"{prefix}{recipe[:EXECUTION_NAME_LENGTH - len(prefix) - len(suffix)]}{suffix}"
+
+
+def execution_arn(state_machine_arn: str, name: str) -> str:
+    return f"{state_machine_arn.replace(':stateMachine:', ':execution:')}:{name}"
+
+
+class Progress():
+    """
+        Thread safe throughput and ETA reporting.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def completed(self, image_build_version_arn: str, status: str):
+        with self.lock:
+            self.done += 1
+            elapsed = time.monotonic() - self.started_at
+            per_hour = self.done / elapsed * 3600 if elapsed > 0 else 0.0
+            remaining = self.total - self.done
+            eta = f"{remaining / per_hour:.1f}h" if per_hour > 0 else "n/a"
+            print(f"[{self.done}/{self.total}] {status:9} {image_build_version_arn} | {per_hour:.1f} exports/h | ETA {eta}")
+
+
+def wait_for_execution(stepfunctions_client, arn: str, poll_seconds: int) -> str:
+    while True:
+        status = stepfunctions_client.describe_execution(executionArn=arn)['status']
+        if status != "RUNNING":
+            return status
+        time.sleep(poll_seconds)
+
+
+def run_export(stepfunctions_client, state_machine_arn: str, image_build_version_arn: str, poll_seconds: int) -> str:
+    """
+        Starts the export and waits for it. The execution of an earlier
+        backfill is followed when still running and reported when it
+        succeeded, a failed, timed out or aborted one is retried under the
+        next attempt name.
+    """
+    status = None
+    for attempt in range(MAX_ATTEMPTS):
+        name = execution_name(image_build_version_arn, attempt)
+        try:
+            response = stepfunctions_client.start_execution(
+                stateMachineArn=state_machine_arn,
+                name=name,
+                input=json.dumps({"image_build_version_arn": image_build_version_arn})
+            )
+        except stepfunctions_client.exceptions.ExecutionAlreadyExists:
+            status = wait_for_execution(stepfunctions_client, execution_arn(state_machine_arn, name), poll_seconds)
+            if status in RETRIED_STATUSES:
+                print(f"Retrying {image_build_version_arn}: execution {name} is {status}", file=sys.stderr)
+                continue
+            return status
+        return wait_for_execution(stepfunctions_client, response['executionArn'], poll_seconds)
+    return f"{status} after {MAX_ATTEMPTS} attempts"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--images", nargs="+", help="image build version ARNs and/or AMI ids")
+    source.add_argument("--pipeline", help="EC2 Image Builder pipeline name")
+    parser.add_argument("--since", type=parse_date, default=datetime.min.replace(tzinfo=timezone.utc), help="ISO date, inclusive")
+    parser.add_argument("--until", type=parse_date, default=datetime.max.replace(tzinfo=timezone.utc), help="ISO date, exclusive")
+    parser.add_argument("--concurrency", type=int, default=2, help="maximum number of exports in flight")
+    parser.add_argument("--poll-seconds", type=int, default=60)
+    parser.add_argument("--dry-run", action="store_true", help="only list the images that would be exported")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    imagebuilder_client = boto3.client('imagebuilder')
+    ec2_client = boto3.client('ec2')
+    stepfunctions_client = boto3.client('stepfunctions')
+
+    if args.pipeline:
+        arns = resolve_pipeline_images(imagebuilder_client, args.pipeline, args.since, args.until)
+    else:
+        arns = [image for image in args.images if image.startswith("arn:")]
+        arns += resolve_ami_ids(ec2_client, [image for image in args.images if image.startswith("ami-")])
+
+    exported = exported_ami_ids(ec2_client)
+    pending = []
+    for arn, ami_id in describe_images(imagebuilder_client, list(dict.fromkeys(arns))):
+        if ami_id in exported:
+            print(f"Skipping {arn}: {ami_id} already exported", file=sys.stderr)
+        else:
+            pending.append(arn)
+
+    print(f"{len(pending)} image(s) to export with concurrency {args.concurrency}")
+    if args.dry_run or len(pending) == 0:
+        for arn in pending:
+            print(arn)
+        return
+
+    state_machine_arn = StackOutputs().get(STATE_MACHINE_ARN)
+    progress = Progress(len(pending))
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = {
+            executor.submit(run_export, stepfunctions_client, state_machine_arn, arn, args.poll_seconds): arn
+            for arn in pending
+        }
+        for future in as_completed(futures):
+            try:
+                status = future.result()
+            except Exception as err:
+                status = f"ERROR {err}"
+            progress.completed(futures[future], status)
+
+
+if __name__ == "__main__":
+    main()
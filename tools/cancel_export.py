@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+    cancel_export.py:
+    Cancels the export of a running State Machine execution: stops the
+    execution, cancels its export image tasks and releases the export
+    slots of its image builds.
+
+    usage:
+        python -m tools.cancel_export --execution-arn <execution arn> [--reason "..."]
+        python -m tools.cancel_export --image-build-version-arn <image build version arn>
+"""
+
+import argparse
+import os
+import sys
+
+import boto3
+
+from tools.stack_outputs import (CONTROL_TABLE_NAME, STATE_MACHINE_ARN,
+                                 StackOutputs)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "stacks", "vmdkexport", "resources", "vmexport", "common", "python"))
+
+from vmexportcommon.export_cancellation import ExportCanceller  # noqa: E402
+from vmexportcommon.export_scheduler import ExportScheduler  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--execution-arn", help="the execution to cancel")
+    target.add_argument("--image-build-version-arn", help="cancel the running execution exporting the image build")
+    parser.add_argument("--reason", default="Cancelled by request", help="recorded as the cause of the stopped execution")
+    parser.add_argument("--dry-run", action="store_true", help="only print the execution that would be cancelled")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    outputs = StackOutputs()
+
+    stepfunctions_client = boto3.client('stepfunctions')
+    scheduler = ExportScheduler(
+        table_name=outputs.get(CONTROL_TABLE_NAME),
+        region=stepfunctions_client.meta.region_name
+    )
+    canceller = ExportCanceller(outputs.get(STATE_MACHINE_ARN), scheduler=scheduler, stepfunctions_client=stepfunctions_client)
+
+    if args.execution_arn:
+        execution = canceller.execution(args.execution_arn)
+    else:
+        execution = canceller.find_execution(args.image_build_version_arn)
+        if execution is None:
+            sys.exit(f"No running execution exports {args.image_build_version_arn}")
+
+    if execution.get("status", "RUNNING") != "RUNNING":
+        sys.exit(f"Execution {execution['executionArn']} is {execution['status']}")
+
+    print(f"Cancelling {execution['executionArn']} exporting {', '.join(execution['image_build_version_arns'])}")
+    if args.dry_run:
+        return
+
+    cancelled = canceller.cancel(execution, cause=args.reason)
+    print(f"Stopped the execution, cancelled export image tasks: {', '.join(cancelled) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+    execute_pipeline.py:
+    Executes one or many EC2 Image Builder pipelines to create AMIs and
+    publishes a message per image build to the SNS topic which begins
+    the VMExport process, in which the AMI is converted to VMDK format.
+
+    The stack outputs are resolved with a single describe_stacks call,
+    the stack name is derived from the same stack tag as used by CDK.
+    With --follow the image builds and the export executions are tracked
+    to completion, printing each stage transition as it happens.
+
+    usage:
+        python -m tools.execute_pipeline [--pipeline-arn ARN ...] [--priority release] [--follow]
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+
+import boto3
+
+from tools.stack_outputs import (NOTIFICATION_TOPIC_ARN, PIPELINE_ARN,
+                                 STATE_MACHINE_ARN, StackOutputs)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "stacks", "vmdkexport", "resources", "vmexport", "common", "python"))
+
+from vmexportcommon.export_cancellation import \
+    execution_image_build_version_arns  # noqa: E402
+
+IMAGE_FAILED_STATES = ("FAILED", "CANCELLED", "DELETED")
+
+# the export of an available image is not started when it is declined by the
+# notify handler, i.e. superseded by a newer build or another export running
+DEFAULT_EXECUTION_WAIT_SECONDS = 600
+
+
+async def call(function, *args, **kwargs):
+    """
+        Runs a blocking boto3 call on the default executor.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
+
+
+def parse_date(value: str) -> datetime:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def log(image_build_version_arn: str, message: str):
+    build = "/".join(image_build_version_arn.split("/")[-3:])
+    print(f"{datetime.now().strftime('%H:%M:%S')} {build:50} {message}", flush=True)
+
+
+class Runner():
+
+    def __init__(self, outputs: StackOutputs, priority: str = None, urgent: bool = False):
+        self.imagebuilder = boto3.client('imagebuilder')
+        self.sns = boto3.client('sns')
+        self.stepfunctions = boto3.client('stepfunctions')
+        self.topic_arn = outputs.get(NOTIFICATION_TOPIC_ARN)
+        self.state_machine_arn = outputs.get(STATE_MACHINE_ARN)
+        self.priority = priority
+        self.urgent = urgent
+        # execution arn -> image build version arns of the execution input
+        self.execution_inputs = {}
+
+    async def start(self, pipeline_arn: str) -> str:
+        response = await call(self.imagebuilder.start_image_pipeline_execution, imagePipelineArn=pipeline_arn)
+        image_build_version_arn = response['imageBuildVersionArn']
+        log(image_build_version_arn, f"started pipeline {pipeline_arn}")
+
+        # publish a message to the sns topic to begin the VMDK export process
+        message_attributes = {}
+        if self.priority:
+            message_attributes['export_priority'] = {'DataType': 'String', 'StringValue': self.priority}
+        if self.urgent:
+            message_attributes['export_urgent'] = {'DataType': 'String', 'StringValue': 'true'}
+        await call(
+            self.sns.publish,
+            TopicArn=self.topic_arn,
+            Message=image_build_version_arn,
+            MessageAttributes=message_attributes
+        )
+        log(image_build_version_arn, f"published to {self.topic_arn}")
+        return image_build_version_arn
+
+    async def find_execution(self, image_build_version_arn: str, since: datetime) -> str:
+        """
+            The execution exporting the image build, single or batch, looked
+            up among the executions started since the image was created.
+        """
+        kwargs = {'stateMachineArn': self.state_machine_arn, 'maxResults': 100}
+        while True:
+            response = await call(self.stepfunctions.list_executions, **kwargs)
+            for execution in response['executions']:
+                # executions are listed newest first
+                if execution['startDate'] < since:
+                    return None
+                execution_arn = execution['executionArn']
+                if execution_arn not in self.execution_inputs:
+                    described = await call(self.stepfunctions.describe_execution, executionArn=execution_arn)
+                    self.execution_inputs[execution_arn] = execution_image_build_version_arns(json.loads(described.get('input') or "{}"))
+                if image_build_version_arn in self.execution_inputs[execution_arn]:
+                    return execution_arn
+            if 'nextToken' not in response:
+                return None
+            kwargs['nextToken'] = response['nextToken']
+
+    async def current_state(self, execution_arn: str) -> str:
+        response = await call(
+            self.stepfunctions.get_execution_history,
+            executionArn=execution_arn,
+            reverseOrder=True,
+            maxResults=20
+        )
+        for history_event in response['events']:
+            if 'stateEnteredEventDetails' in history_event:
+                return history_event['stateEnteredEventDetails']['name']
+        return "starting"
+
+    async def follow(self, image_build_version_arn: str, poll_seconds: int, execution_wait_seconds: int) -> bool:
+        last_stage = None
+        execution_arn = None
+        available_at = None
+
+        while True:
+            if execution_arn is None:
+                image = await call(self.imagebuilder.get_image, imageBuildVersionArn=image_build_version_arn)
+                image_status = image['image']['state']['status']
+                stage = f"image {image_status}"
+                if image_status in IMAGE_FAILED_STATES:
+                    log(image_build_version_arn, f"{stage}: {image['image']['state'].get('reason', '')}")
+                    return False
+                if image_status == "AVAILABLE":
+                    available_at = available_at or time.monotonic()
+                    execution_arn = await self.find_execution(image_build_version_arn, parse_date(image['image']['dateCreated']))
+                    if execution_arn is None:
+                        if time.monotonic() - available_at > execution_wait_seconds:
+                            log(image_build_version_arn, f"no export execution started within {execution_wait_seconds}s, "
+                                "the export was declined by the notification handler (superseded by a newer build, "
+                                "or another export was running)")
+                            return False
+                        stage = "image AVAILABLE, waiting for the export execution"
+
+            if execution_arn is not None:
+                execution = await call(self.stepfunctions.describe_execution, executionArn=execution_arn)
+                if execution['status'] != "RUNNING":
+                    log(image_build_version_arn, f"export {execution['status']}")
+                    return execution['status'] == "SUCCEEDED"
+                stage = f"export {await self.current_state(execution_arn)}"
+
+            if stage != last_stage:
+                log(image_build_version_arn, stage)
+                last_stage = stage
+
+            await asyncio.sleep(poll_seconds)
+
+
+async def run(args) -> bool:
+    outputs = StackOutputs()
+    runner = Runner(outputs, args.priority, args.urgent)
+    pipeline_arns = args.pipeline_arn or [outputs.get(PIPELINE_ARN)]
+
+    image_build_version_arns = await asyncio.gather(*[runner.start(arn) for arn in pipeline_arns])
+
+    if not args.follow:
+        return True
+
+    results = await asyncio.gather(*[
+        runner.follow(arn, args.poll_seconds, args.execution_wait_seconds) for arn in image_build_version_arns
+    ])
+    return all(results)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipeline-arn", action="append", help="pipeline to execute, defaults to the pipeline of the stack; repeat for many")
+    parser.add_argument("--priority", choices=["release", "default", "nightly"], help="export priority of the image builds")
+    parser.add_argument("--urgent", action="store_true", help="notify the exports right away, also in digest mode")
+    parser.add_argument("--follow", action="store_true", help="track the image builds and exports to completion")
+    parser.add_argument("--poll-seconds", type=int, default=30)
+    parser.add_argument("--execution-wait-seconds", type=int, default=DEFAULT_EXECUTION_WAIT_SECONDS,
+                        help="give up when no export execution is started this long after the image is available")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    succeeded = asyncio.run(run(args))
+    sys.exit(0 if succeeded else 1)
+
+
+if __name__ == "__main__":
+    main()
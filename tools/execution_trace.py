@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+"""
+    execution_trace.py:
+    Converts the execution history of VMDKExportStateMachine executions to
+    the Chrome trace event format, which can be opened in Perfetto
+    (https://ui.perfetto.dev) or chrome://tracing.
+
+    Each execution becomes a process of the trace, with the states (Task,
+    Wait, Choice, Pass, ...) as spans on one track and the Lambda and task
+    invocations as spans on a second track. Each Map iteration gets a pair
+    of tracks of its own, as iterations run at once.
+    By default every execution is aligned to its start so that many runs
+    can be compared at once, use --absolute to keep the wall clock times.
+
+    The AMI metadata and export start Lambdas run in a nested Express
+    workflow (ExportStartExpressTask), whose history get_execution_history
+    does not return. The nested workflow is shown as a single span, the
+    Lambda invocations inside it are not traced.
+
+    Histories are fetched with get_execution_history (paginated, many
+    executions concurrently) or read offline from saved JSON files, either
+    a get_execution_history response or the files written by --save-dir.
+
+    usage:
+        python -m tools.execution_trace --latest 100 --output trace.json
+        python -m tools.execution_trace --execution-arn arn:aws:states:... --save-dir histories/
+        python -m tools.execution_trace --input histories/*.json --output trace.json
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+
+from tools.stack_outputs import STATE_MACHINE_ARN, StackOutputs
+
+MAX_HISTORY_WORKERS = 8
+
+STATES_TRACK = 1
+INVOCATIONS_TRACK = 2
+# the tracks of Map iteration i are ITERATION_TRACKS + 2 * i (states) and + 1 (invocations)
+ITERATION_TRACKS = 100
+
+ITERATION_ENDS = ("MapIterationSucceeded", "MapIterationFailed", "MapIterationAborted")
+
+# history event types which end an invocation, by the type starting it
+INVOCATION_STARTS = ("LambdaFunctionScheduled", "TaskScheduled", "ActivityScheduled")
+INVOCATION_ENDS = (
+    "LambdaFunctionSucceeded", "LambdaFunctionFailed", "LambdaFunctionTimedOut",
+    "LambdaFunctionScheduleFailed", "LambdaFunctionStartFailed",
+    "TaskSucceeded", "TaskFailed", "TaskTimedOut", "TaskSubmitFailed", "TaskStartFailed",
+    "ActivitySucceeded", "ActivityFailed", "ActivityTimedOut", "ActivityScheduleFailed"
+)
+
+
+def timestamp_micros(value) -> int:
+    """
+        Microseconds since the epoch of a history timestamp, as returned by
+        boto3 (datetime), the AWS CLI (ISO 8601 string) or as epoch seconds.
+    """
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1_000_000)
+    if isinstance(value, (int, float)):
+        return int(value * 1_000_000)
+    return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1_000_000)
+
+
+def invocation_name(event: dict) -> str:
+    if event["type"] == "LambdaFunctionScheduled":
+        return event["lambdaFunctionScheduledEventDetails"]["resource"].split(":")[-1]
+    if event["type"] == "TaskScheduled":
+        details = event["taskScheduledEventDetails"]
+        return f"{details['resourceType']}:{details['resource']}"
+    return event["type"].replace("Scheduled", "")
+
+
+def scheduled_event(events_by_id: dict, event: dict) -> dict:
+    """
+        Walks the previousEventId chain back to the event that scheduled
+        the invocation ended by the event.
+    """
+    current = events_by_id.get(event.get("previousEventId"))
+    while current is not None and current["type"] not in INVOCATION_STARTS:
+        current = events_by_id.get(current.get("previousEventId"))
+    return current
+
+
+def entered_event(events_by_id: dict, event: dict, open_ids: set) -> dict:
+    """
+        Walks the previousEventId chain back to the open StateEntered event
+        of the state exited by the event. Concurrent Map iterations and
+        Parallel branches enter states of the same name at once, each
+        chain only passes through the events of its own iteration or branch.
+    """
+    state_name = event["stateExitedEventDetails"]["name"]
+    current = events_by_id.get(event.get("previousEventId"))
+    while current is not None:
+        if (current["id"] in open_ids
+                and current["type"].endswith("StateEntered")
+                and current["stateEnteredEventDetails"]["name"] == state_name):
+            return current
+        current = events_by_id.get(current.get("previousEventId"))
+    return None
+
+
+def map_iterations(events: list) -> dict:
+    """
+        The index of the Map iteration each history event belongs to, None
+        for the events outside of a Map iteration.
+    """
+    iterations = {}
+    for event in events:
+        if event["type"] == "MapIterationStarted":
+            iterations[event["id"]] = event["mapIterationStartedEventDetails"]["index"]
+        elif event["type"] in ITERATION_ENDS:
+            iterations[event["id"]] = None
+        else:
+            # the previous event precedes the event in the history
+            iterations[event["id"]] = iterations.get(event.get("previousEventId"))
+    return iterations
+
+
+def execution_trace_events(name: str, events: list, pid: int, absolute: bool = False) -> list:
+    """
+        Chrome trace events of the history events of one execution.
+    """
+    if not events:
+        return []
+
+    events = sorted(events, key=lambda e: e["id"])
+    events_by_id = {e["id"]: e for e in events}
+    iterations = map_iterations(events)
+    origin = 0 if absolute else timestamp_micros(events[0]["timestamp"])
+    end = timestamp_micros(events[-1]["timestamp"]) - origin
+
+    trace = [
+        {"ph": "M", "name": "process_name", "pid": pid, "args": {"name": name}},
+        {"ph": "M", "name": "thread_name", "pid": pid, "tid": STATES_TRACK, "args": {"name": "states"}},
+        {"ph": "M", "name": "thread_name", "pid": pid, "tid": INVOCATIONS_TRACK, "args": {"name": "invocations"}}
+    ]
+    # id of the open StateEntered event -> (start, state type)
+    entered = {}
+    named_tracks = {STATES_TRACK, INVOCATIONS_TRACK}
+
+    def track(base: int, event: dict) -> int:
+        iteration = iterations.get(event["id"])
+        if iteration is None:
+            return base
+        tid = ITERATION_TRACKS + 2 * iteration + (base - STATES_TRACK)
+        if tid not in named_tracks:
+            named_tracks.add(tid)
+            kind = "states" if base == STATES_TRACK else "invocations"
+            trace.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid, "args": {"name": f"iteration {iteration} {kind}"}})
+        return tid
+
+    def span(span_name: str, category: str, tid: int, start: int, finish: int, args: dict):
+        trace.append({
+            "ph": "X", "name": span_name, "cat": category, "pid": pid, "tid": tid,
+            "ts": start, "dur": max(0, finish - start), "args": args
+        })
+
+    for event in events:
+        ts = timestamp_micros(event["timestamp"]) - origin
+        event_type = event["type"]
+
+        if event_type.endswith("StateEntered"):
+            entered[event["id"]] = (ts, event_type[:-len("StateEntered")])
+        elif event_type.endswith("StateExited"):
+            state_entered = entered_event(events_by_id, event, entered.keys())
+            if state_entered is not None:
+                start, state_type = entered.pop(state_entered["id"])
+                span(event["stateExitedEventDetails"]["name"], state_type, track(STATES_TRACK, state_entered), start, ts,
+                     {"exited_event_id": event["id"]})
+        elif event_type in INVOCATION_ENDS:
+            scheduled = scheduled_event(events_by_id, event)
+            if scheduled is not None:
+                start = timestamp_micros(scheduled["timestamp"]) - origin
+                span(invocation_name(scheduled), event_type, track(INVOCATIONS_TRACK, scheduled), start, ts, {"result": event_type})
+        elif event_type in ("ExecutionFailed", "ExecutionAborted", "ExecutionTimedOut"):
+            trace.append({"ph": "i", "name": event_type, "pid": pid, "tid": STATES_TRACK, "ts": ts, "s": "p"})
+
+    # states still open when the history ends, i.e. running executions
+    for event_id, (start, state_type) in entered.items():
+        state_entered = events_by_id[event_id]
+        span(state_entered["stateEnteredEventDetails"]["name"], state_type, track(STATES_TRACK, state_entered), start, end, {"open": True})
+
+    return trace
+
+
+def chrome_trace(histories: list, absolute: bool = False) -> dict:
+    """
+        Chrome trace of (execution name, history events) pairs.
+    """
+    trace_events = []
+    for pid, (name, events) in enumerate(histories, start=1):
+        trace_events.extend(execution_trace_events(name, events, pid, absolute))
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def fetch_history(client, execution_arn: str) -> list:
+    paginator = client.get_paginator('get_execution_history')
+    events = []
+    for page in paginator.paginate(executionArn=execution_arn):
+        events.extend(page['events'])
+    return events
+
+
+def latest_executions(client, state_machine_arn: str, count: int) -> list:
+    paginator = client.get_paginator('list_executions')
+    arns = []
+    for page in paginator.paginate(stateMachineArn=state_machine_arn):
+        arns.extend(execution['executionArn'] for execution in page['executions'])
+        if len(arns) >= count:
+            break
+    return arns[:count]
+
+
+def fetch_histories(execution_arns: list, save_dir: str = None) -> list:
+    client = boto3.client('stepfunctions')
+    with ThreadPoolExecutor(max_workers=MAX_HISTORY_WORKERS) as executor:
+        histories = list(executor.map(lambda arn: fetch_history(client, arn), execution_arns))
+
+    if save_dir:
+        os.makedirs(save_dir, exist_ok=True)
+        for arn, events in zip(execution_arns, histories):
+            with open(os.path.join(save_dir, f"{arn.split(':')[-1]}.json"), "w") as file:
+                json.dump({"executionArn": arn, "events": events}, file, default=str)
+
+    return [(arn.split(":")[-1], events) for arn, events in zip(execution_arns, histories)]
+
+
+def read_histories(paths: list) -> list:
+    histories = []
+    for path in paths:
+        with open(path) as file:
+            content = json.load(file)
+        events = content if isinstance(content, list) else content["events"]
+        name = content.get("executionArn", path).split(":")[-1] if isinstance(content, dict) else path
+        histories.append((os.path.basename(name), events))
+    return histories
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--execution-arn", nargs="+", help="executions to fetch the history of")
+    source.add_argument("--latest", type=int, help="fetch the history of the latest executions of the state machine")
+    source.add_argument("--input", nargs="+", help="saved history JSON files")
+    parser.add_argument("--state-machine-arn", help="state machine of --latest, defaults to the state machine of the stack")
+    parser.add_argument("--save-dir", help="save the fetched histories to this directory")
+    parser.add_argument("--absolute", action="store_true", help="keep wall clock times instead of aligning executions at their start")
+    parser.add_argument("--output", default="trace.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.input:
+        histories = read_histories(args.input)
+    else:
+        execution_arns = args.execution_arn
+        if args.latest:
+            state_machine_arn = args.state_machine_arn or StackOutputs().get(STATE_MACHINE_ARN)
+            execution_arns = latest_executions(boto3.client('stepfunctions'), state_machine_arn, args.latest)
+        histories = fetch_histories(execution_arns, args.save_dir)
+
+    trace = chrome_trace(histories, args.absolute)
+    with open(args.output, "w") as file:
+        json.dump(trace, file)
+
+    spans = sum(1 for event in trace["traceEvents"] if event["ph"] == "X")
+    print(f"Wrote {spans} spans of {len(histories)} executions to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+"""
+    resume_export.py:
+    Resumes failed exports from the last completed stage. A new execution
+    of the State Machine is started for the image builds of a failed,
+    timed out or aborted execution (or for the given image builds); the
+    entry point restores their state from the stage checkpoints, so the
+    stages completed before the failure are skipped.
+
+    usage:
+        python -m tools.resume_export --execution-arn <failed execution arn>
+        python -m tools.resume_export --image-build-version-arns <arn> [<arn> ...] [--priority release]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+from tools.stack_outputs import STATE_MACHINE_ARN, StackOutputs
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "stacks", "vmdkexport", "resources", "vmexport", "common", "python"))
+
+from vmexportcommon.export_cancellation import \
+    execution_image_build_version_arns  # noqa: E402
+
+RESUMABLE_STATUSES = ("FAILED", "TIMED_OUT", "ABORTED")
+REQUEST_FIELDS = ("export_priority", "export_urgent")
+
+
+def resume_input(image_build_version_arns: list, request: dict = None) -> dict:
+    """
+        The input of the resumed execution, the request fields (priority,
+        urgency) of the failed execution are kept.
+    """
+    request = request or {}
+    if len(image_build_version_arns) == 1:
+        execution_input = {"image_build_version_arn": image_build_version_arns[0]}
+    else:
+        execution_input = {"image_build_version_arns": image_build_version_arns}
+    execution_input.update({name: request[name] for name in REQUEST_FIELDS if name in request})
+    execution_input["resume"] = True
+    return execution_input
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--execution-arn", help="the failed execution to resume")
+    target.add_argument("--image-build-version-arns", nargs="+", help="the image builds to resume")
+    parser.add_argument("--priority", choices=("release", "default", "nightly"), help="export priority of the resumed exports")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    state_machine_arn = StackOutputs().get(STATE_MACHINE_ARN)
+    stepfunctions_client = boto3.client('stepfunctions')
+
+    if args.execution_arn:
+        description = stepfunctions_client.describe_execution(executionArn=args.execution_arn)
+        if description['status'] not in RESUMABLE_STATUSES:
+            sys.exit(f"Execution {args.execution_arn} is {description['status']}, only {', '.join(RESUMABLE_STATUSES)} executions are resumed")
+        request = json.loads(description.get('input') or "{}")
+        execution_input = resume_input(execution_image_build_version_arns(request), request)
+    else:
+        execution_input = resume_input(list(dict.fromkeys(args.image_build_version_arns)))
+
+    if args.priority:
+        execution_input["export_priority"] = args.priority
+
+    response = stepfunctions_client.start_execution(
+        stateMachineArn=state_machine_arn,
+        input=json.dumps(execution_input)
+    )
+    print(f"Resuming the export of {execution_input.get('image_build_version_arns') or execution_input['image_build_version_arn']} in {response['executionArn']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""
+    stack_outputs.py:
+    Resolves the CloudFormation outputs of the deployed
+    EC2ImageBuilderVmdkExport stack for the command line tools.
+"""
+
+import boto3
+
+from utils.StackTag import stack_tag
+
+# export names of the stack outputs, suffixed with the stack tag
+PIPELINE_ARN = "VmdkExport-PipelineArn"
+NOTIFICATION_TOPIC_ARN = "VmdkExport-NotificationTopicArn"
+STATE_MACHINE_ARN = "VmdkExport-StateMachineArn"
+EVENT_BUS_NAME = "VmdkExport-EventBusName"
+HISTORY_TABLE_NAME = "VmdkExport-HistoryTableName"
+CONTROL_TABLE_NAME = "VmdkExport-ControlTableName"
+
+
+def stack_name() -> str:
+    return f"EC2ImageBuilderVmdkExport-{stack_tag()}"
+
+
+class StackOutputs():
+    """
+        The outputs of the deployed stack, fetched with a single
+        describe_stacks call and looked up by export name.
+    """
+
+    def __init__(self, name: str = None, cloudformation_client=None):
+        self.stack_name = name or stack_name()
+        client = cloudformation_client or boto3.client('cloudformation')
+        response = client.describe_stacks(StackName=self.stack_name)
+        self.outputs = {
+            output.get('ExportName', output['OutputKey']): output['OutputValue']
+            for output in response['Stacks'][0].get('Outputs', [])
+        }
+
+    def get(self, export_name: str) -> str:
+        key = f"{export_name}-{stack_tag()}"
+        if key not in self.outputs:
+            raise KeyError(f"Output {key} not found in stack {self.stack_name}")
+        return self.outputs[key]
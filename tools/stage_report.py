@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+    stage_report.py:
+    Reports p50/p95 latencies of each export stage and of the end to end
+    export (AMI available -> VMDK metadata published) from the export
+    history table, grouped by pipeline, format and region over a window.
+
+    The history table is partitioned by the day the execution started, so
+    a window is read with one paginated query per day (run concurrently)
+    projecting only the stage timestamps and group attributes.
+
+    usage:
+        python -m tools.stage_report --since 2021-09-01 --until 2021-10-01 [--group-by pipeline region]
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import boto3
+
+from tools.stack_outputs import HISTORY_TABLE_NAME, StackOutputs
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "stacks", "vmdkexport", "resources", "vmexport", "common", "python"))
+
+from vmexportcommon.stage_history import (AMI_AVAILABLE,  # noqa: E402
+                                          EXECUTION_STARTED, EXPORT_COMPLETED,
+                                          EXPORT_STARTED, METADATA_PUBLISHED,
+                                          STAGES, partition_key,
+                                          stage_attribute)
+
+# name, from stage, to stage
+SEGMENTS = (
+    ("ami_wait", EXECUTION_STARTED, AMI_AVAILABLE),
+    ("export_start", AMI_AVAILABLE, EXPORT_STARTED),
+    ("export", EXPORT_STARTED, EXPORT_COMPLETED),
+    ("publish", EXPORT_COMPLETED, METADATA_PUBLISHED),
+    ("end_to_end", AMI_AVAILABLE, METADATA_PUBLISHED)
+)
+GROUP_ATTRIBUTES = ("pipeline", "format", "region")
+MAX_QUERY_WORKERS = 8
+
+
+def days(since: date, until: date) -> list:
+    return [(since + timedelta(days=i)).isoformat() for i in range((until - since).days + 1)]
+
+
+def parse_item(item: dict) -> dict:
+    """
+        Converts a low level DynamoDB item to plain values, the report only
+        reads string and number attributes.
+    """
+    return {
+        name: float(value['N']) if 'N' in value else value.get('S')
+        for name, value in item.items()
+    }
+
+
+def query_day(client, table_name: str, day: str) -> list:
+    names = {f"#{i}": name for i, name in enumerate([stage_attribute(s) for s in STAGES] + list(GROUP_ATTRIBUTES))}
+    paginator = client.get_paginator('query')
+    items = []
+    for page in paginator.paginate(
+        TableName=table_name,
+        KeyConditionExpression="pk = :pk",
+        ExpressionAttributeValues={":pk": {"S": partition_key(day)}},
+        ExpressionAttributeNames=names,
+        ProjectionExpression=", ".join(names)
+    ):
+        items.extend(parse_item(item) for item in page['Items'])
+    return items
+
+
+def load_items(table_name: str, since: date, until: date) -> list:
+    client = boto3.client('dynamodb')
+    with ThreadPoolExecutor(max_workers=MAX_QUERY_WORKERS) as executor:
+        pages = executor.map(lambda day: query_day(client, table_name, day), days(since, until))
+        return [item for page in pages for item in page]
+
+
+def segment_durations(item: dict) -> dict:
+    """
+        Seconds spent in each segment the execution completed.
+    """
+    durations = {}
+    for segment, start, end in SEGMENTS:
+        started = item.get(stage_attribute(start))
+        ended = item.get(stage_attribute(end))
+        if started is not None and ended is not None:
+            durations[segment] = ended - started
+    return durations
+
+
+def aggregate(items: list, group_by: tuple) -> dict:
+    """
+        Groups the segment durations of the items, i.e.
+        {("pipeline-a", "eu-west-1"): {"export": [1800.0, ...], ...}}
+    """
+    groups = {}
+    for item in items:
+        key = tuple(item.get(attribute) or "-" for attribute in group_by)
+        segments = groups.setdefault(key, {segment: [] for segment, _, _ in SEGMENTS})
+        for segment, duration in segment_durations(item).items():
+            segments[segment].append(duration)
+    return groups
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+        Nearest rank percentile of values sorted in ascending order.
+    """
+    if not values:
+        return None
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def summarize(groups: dict) -> list:
+    rows = []
+    for key, segments in sorted(groups.items()):
+        row = {"group": list(key), "executions": max(len(v) for v in segments.values()), "segments": {}}
+        for segment, durations in segments.items():
+            durations.sort()
+            row["segments"][segment] = {
+                "count": len(durations),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95)
+            }
+        stages = {s: v["p50"] for s, v in row["segments"].items() if s not in ("ami_wait", "end_to_end") and v["p50"] is not None}
+        row["dominant_stage"] = max(stages, key=stages.get) if stages else None
+        rows.append(row)
+    return rows
+
+
+def minutes(seconds: float) -> str:
+    return "-" if seconds is None else f"{seconds / 60:.1f}m"
+
+
+def print_report(rows: list, group_by: tuple):
+    header = f"{' / '.join(group_by):40} {'count':>6}"
+    for segment, _, _ in SEGMENTS:
+        header += f" {segment + ' p50/p95':>22}"
+    print(header + "  dominant")
+    for row in rows:
+        line = f"{' / '.join(row['group']):40} {row['executions']:>6}"
+        for segment, _, _ in SEGMENTS:
+            values = row["segments"][segment]
+            line += f" {minutes(values['p50']) + ' / ' + minutes(values['p95']):>22}"
+        print(line + f"  {row['dominant_stage'] or '-'}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--since", type=date.fromisoformat, default=date.today() - timedelta(days=30), help="first day, YYYY-MM-DD")
+    parser.add_argument("--until", type=date.fromisoformat, default=date.today(), help="last day, YYYY-MM-DD")
+    parser.add_argument("--group-by", nargs="*", choices=GROUP_ATTRIBUTES, default=list(GROUP_ATTRIBUTES))
+    parser.add_argument("--table", help="history table name, defaults to the table of the stack")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    table_name = args.table or StackOutputs().get(HISTORY_TABLE_NAME)
+    group_by = tuple(args.group_by)
+
+    started = datetime.now()
+    items = load_items(table_name, args.since, args.until)
+    rows = summarize(aggregate(items, group_by))
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+        return
+
+    print(f"{len(items)} executions from {args.since} to {args.until} read in {(datetime.now() - started).total_seconds():.1f}s")
+    print()
+    print_report(rows, group_by)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,11 @@
 
 import hashlib
 import json
-import os
-import re
 
 from aws_cdk import core
 from jsii.python import classproperty
 
-_STACK_TAG = None
+from utils import StackTag
 
 class CdkUtils():
     """
@@ -33,37 +31,9 @@ class CdkUtils():
     @classproperty
     def stack_tag(self) -> str:
         """The stack tag is an identifier that is used to differentiate between
-        different instances of the same stack.  This is especially relevant in a
-        feature-branch environment where developers will create their own
-        version of the stack while making changes that are intended to be
-        integrated into the "main" version of the stack.
+        different instances of the same stack, see utils.StackTag.
         """
-
-        # The stack tag only needs to be determined once.  From then on we use
-        # the global variable _STACK_TAG to contain the value.
-        global _STACK_TAG
-
-        if _STACK_TAG is None:
-            if "STACK_TAG" in os.environ:
-                # An environment variable that can be used to define the stack suffix.
-                _STACK_TAG = os.environ["STACK_TAG"]
-            else:
-                from git import Repo
-
-                # If the stack tag is not provided in the OS environment, then it is
-                # calculated from the Git branch that is currently checked out.
-                repo = Repo(path=os.getcwd())
-                branch_name = repo.active_branch.name
-
-                # Create a "slug" from the branch name, by replacing all
-                # non-alphanumeric characters in the branch name with a dash.
-                _STACK_TAG = re.sub(
-                    r"""[^a-zA-Z0-9-]""",
-                    r"""-""",
-                    branch_name
-                ).lower()
-
-        return _STACK_TAG
+        return StackTag.stack_tag()
 
     @classproperty
     def bootstrap_qualifier(self) -> str:
@@ -71,6 +41,23 @@ class CdkUtils():
         hasher.update(CdkUtils.stack_tag.encode(encoding="utf-8"))
         return hasher.hexdigest()[-10:]
 
+    @staticmethod
+    def shard_string_list(values: list, max_length: int) -> list:
+        """Splits a list of strings into shards whose comma separated
+        value is at most max_length characters long.
+        """
+        shards = [[]]
+        length = 0
+        for value in values:
+            if len(value) > max_length:
+                raise ValueError(f"{value} is longer than {max_length} characters")
+            if shards[-1] and length + 1 + len(value) > max_length:
+                shards.append([])
+                length = 0
+            length += len(value) + (1 if shards[-1] else 0)
+            shards[-1].append(value)
+        return shards
+
     @staticmethod
     def get_project_settings():
         filename = "cdk.json"